@@ -56,7 +56,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise，额外提供运行期间生成的预渲染帖子文件
+    'posts.middleware.PrerenderedWhiteNoiseMiddleware',
+    # 访客记录中间件放在外层，响应阶段最后执行，处理耗时包含内层中间件和视图
+    'users.middleware.VisitorTrackingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # 添加这一行
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +69,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'users.middleware.VisitorTrackingMiddleware',  # 添加访客记录中间件
 ]
 
 ROOT_URLCONF = 'blog_drf.urls'
@@ -134,6 +136,48 @@ CACHES = {
     }
 }
 
+# 帖子详情渲染HTML的缓存时间（秒），缓存键包含修改时间，内容更新后自动失效
+POST_HTML_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# 每个进程在内存中保留的Markdown渲染结果数量（按内容哈希的LRU），更多的结果保存在共享缓存中；修改后需重启进程
+POSTS_RENDER_LRU_SIZE = 256
+# 缓冲的点击数写入数据库的间隔（秒），由收到点击的进程在后台写入；使用Redis时多个进程共享缓冲区，同一时间只有一个进程写入
+POST_CLICK_FLUSH_INTERVAL = 10
+# 未登录用户访问帖子列表和详情的响应缓存时间（秒），帖子或作者资料变化时通过信号立即失效
+POSTS_RESPONSE_CACHE_TIMEOUT = 60 * 5
+# 分区、月份、标签统计的缓存时间（秒），帖子增删改时立即失效
+POSTS_AGGREGATES_CACHE_TIMEOUT = 60 * 60
+# 热度榜单：浏览贡献的半衰期（秒），低于最小分数的帖子在刷新时移出榜单，每个榜单最多保留的帖子数
+# 需要定期（建议每小时）执行 refresh_trending 命令
+POSTS_TRENDING_HALF_LIFE = 60 * 60 * 24
+POSTS_TRENDING_MIN_SCORE = 0.01
+POSTS_TRENDING_MAX_SIZE = 1000
+# 每篇帖子预先计算的相关帖子数量，修改后需执行 rebuild_related_posts 命令
+POSTS_RELATED_LIMIT = 5
+# 预渲染的帖子详情和列表页（prerender_posts 命令全量生成，帖子保存后在后台线程中增量更新），由WhiteNoise直接提供
+# 客户端先读取 /prerendered/manifest.json，再按其中带内容哈希的文件名请求；默认不启用，设置输出目录后生效
+POSTS_PRERENDER_ROOT = os.environ.get('POSTS_PRERENDER_ROOT') or None
+POSTS_PRERENDER_URL = '/prerendered/'
+POSTS_PRERENDER_LIST_PAGES = 5
+# RSS/Atom订阅源和站点地图：帖子在前端的地址（相对路径时使用请求的域名），订阅源中的帖子数量，缓存时间（秒）
+POSTS_PUBLIC_URL_TEMPLATE = os.environ.get('POSTS_PUBLIC_URL_TEMPLATE', '/posts/{slug}/')
+POSTS_FEED_TITLE = os.environ.get('POSTS_FEED_TITLE', 'Blog')
+POSTS_FEED_DESCRIPTION = ''
+POSTS_FEED_LIMIT = 50
+POSTS_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# 访客记录先进入缓冲区再批量写入：缓冲区上限（超过后丢弃新记录），每批写入条数
+# 缓冲区使用Redis列表（多进程共享）或进程内队列，都由Web进程的后台线程每隔 VISITOR_FLUSH_INTERVAL 秒写入
+VISITOR_BUFFER_MAX_SIZE = 10000
+VISITOR_FLUSH_BATCH_SIZE = 500
+VISITOR_FLUSH_INTERVAL = 5
+# 各接口延迟直方图保留的天数，通过 latency_report 命令查看最慢的接口
+VISITOR_LATENCY_RETENTION_DAYS = 7
+# 访问量汇总（rollup_visits 命令）：每个事务汇总的记录数，原始访客记录和每小时汇总的保留天数，每日汇总永久保留
+VISITOR_ROLLUP_BATCH_SIZE = 5000
+VISITOR_RAW_RETENTION_DAYS = 90
+VISITOR_HOURLY_ROLLUP_RETENTION_DAYS = 180
+# 后台数据分析图表的缓存时间（秒）
+VISITOR_ANALYTICS_CACHE_TIMEOUT = 60
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from posts.feeds import AtomFeedView, RSSFeedView, SitemapView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -23,6 +24,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/posts/', include('posts.urls')),  # 添加这一行
+    path('feeds/rss.xml', RSSFeedView.as_view(), name='feed-rss'),
+    path('feeds/atom.xml', AtomFeedView.as_view(), name='feed-atom'),
+    path('sitemap.xml', SitemapView.as_view(), name='sitemap'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),  # 修改这一行
 ]
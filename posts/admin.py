@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Post
+from django.db.models import Count
+from .models import Post, Tag
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -15,4 +16,18 @@ class PostAdmin(admin.ModelAdmin):
         if obj.cover_image_url:
             return format_html('<img src="{}" width="50" height="50" style="object-fit: cover;" />', obj.cover_image_url)
         return '无图片'
-    cover_image_thumbnail.short_description = '封面图片'
\ No newline at end of file
+    cover_image_thumbnail.short_description = '封面图片'
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'post_count')
+    search_fields = ('name',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(post_count=Count('posts'))
+    
+    def post_count(self, obj):
+        return obj.post_count
+    post_count.short_description = '帖子数'
+    post_count.admin_order_field = 'post_count'
@@ -0,0 +1,259 @@
+import json
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+from rest_framework.parsers import BaseParser
+from rest_framework.exceptions import ParseError
+
+from .caching import invalidate_post_collections, invalidate_post
+from .models import Post, Tag
+from .prerender import get_prerender_root, update_prerendered_posts_safely
+from .related import update_related_posts
+from .utils import CONTENT_STATS_FIELDS, run_in_background
+
+# 导入导出涉及的帖子字段
+BULK_FIELDS = ('title', 'slug', 'cover_image_url', 'content', 'tags', 'category', 'is_published', 'created_at')
+# 每批写入的帖子数量
+DEFAULT_CHUNK_SIZE = 500
+# 自动生成slug时为冲突后缀预留的长度
+SLUG_BASE_MAX_LENGTH = 190
+
+
+class PostBulkItemSerializer(serializers.ModelSerializer):
+    """批量导入的单条帖子，slug相同时更新已有帖子，因此不做唯一性校验
+    未提供的字段不会出现在validated_data中：新建时使用默认值（is_published默认发布），更新时保持原值
+    """
+    is_published = serializers.BooleanField(required=False)
+
+    class Meta:
+        model = Post
+        fields = BULK_FIELDS
+        extra_kwargs = {
+            'slug': {'validators': []},
+            'created_at': {'required': False},
+        }
+
+
+class NDJSONParser(BaseParser):
+    """解析每行一个JSON对象的请求体"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        try:
+            return list(read_ndjson(line.decode('utf-8') for line in stream))
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError(f'NDJSON解析错误: {exc}')
+
+
+def read_ndjson(lines):
+    """逐行读取NDJSON，忽略空行"""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def parse_front_matter(text):
+    """解析带 --- 包围的简单front matter（key: value），返回 (元数据, 正文)"""
+    if not text.startswith('---'):
+        return {}, text
+    lines = text.splitlines(keepends=True)
+    for end, line in enumerate(lines[1:], start=1):
+        if line.strip() == '---':
+            break
+    else:
+        return {}, text
+
+    meta = {}
+    for line in lines[1:end]:
+        key, sep, value = line.partition(':')
+        if not sep or not key.strip():
+            continue
+        meta[key.strip()] = _parse_front_matter_value(value.strip())
+    if isinstance(meta.get('tags'), list):
+        meta['tags'] = ', '.join(str(tag) for tag in meta['tags'])
+    return meta, ''.join(lines[end + 1:]).lstrip('\n')
+
+
+def _parse_front_matter_value(value):
+    if value.startswith('"'):
+        return json.loads(value)
+    if value.startswith('[') and value.endswith(']'):
+        return [item.strip().strip('\'"') for item in value[1:-1].split(',') if item.strip()]
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return value.strip('\'')
+
+
+def render_front_matter(record):
+    """把帖子记录渲染为带front matter的Markdown文本，字符串使用JSON转义以兼容YAML"""
+    lines = ['---']
+    for field in BULK_FIELDS:
+        if field == 'content' or record.get(field) in (None, ''):
+            continue
+        value = record[field]
+        lines.append(f'{field}: {json.dumps(value, ensure_ascii=False) if isinstance(value, str) else json.dumps(value)}')
+    lines.append('---')
+    return '\n'.join(lines) + '\n\n' + (record.get('content') or '')
+
+
+def read_markdown_dir(directory):
+    """读取目录下的Markdown文件，未在front matter中指定slug时尝试使用文件名"""
+    for path in sorted(Path(directory).rglob('*.md')):
+        meta, body = parse_front_matter(path.read_text(encoding='utf-8'))
+        if not meta.get('slug') and slugify(path.stem):
+            meta['slug'] = slugify(path.stem)
+        meta.setdefault('title', path.stem)
+        meta['content'] = body
+        yield meta
+
+
+def export_records(queryset):
+    """流式导出帖子记录"""
+    for values in queryset.order_by('pk').values(*BULK_FIELDS).iterator(chunk_size=DEFAULT_CHUNK_SIZE):
+        if values['created_at'] is not None:
+            values['created_at'] = values['created_at'].isoformat()
+        yield values
+
+
+def import_posts(records, author, chunk_size=DEFAULT_CHUNK_SIZE, allow_foreign_updates=False,
+                 refresh_in_background=False):
+    """分批导入帖子：slug已存在时更新，否则创建
+    返回 {'created': 数量, 'updated': 数量, 'errors': [{'index': 序号, 'errors': 错误}]}
+    allow_foreign_updates为False时，不允许覆盖其他作者的帖子；
+    相关帖子索引和预渲染文件在全部导入提交后统一更新一次，refresh_in_background为True时在后台线程中执行
+    """
+    result = {'created': 0, 'updated': 0, 'errors': []}
+    imported = {'post_ids': [], 'slugs': []}
+    chunk = []
+    for index, record in enumerate(records):
+        serializer = PostBulkItemSerializer(data=record)
+        if not serializer.is_valid():
+            result['errors'].append({'index': index, 'errors': serializer.errors})
+            continue
+        chunk.append((index, serializer.validated_data))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, author, allow_foreign_updates, result, imported)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, author, allow_foreign_updates, result, imported)
+
+    if imported['post_ids']:
+        post_ids, slugs = imported['post_ids'], imported['slugs']
+        if refresh_in_background:
+            transaction.on_commit(lambda: run_in_background(refresh_imported_posts, post_ids, slugs))
+        else:
+            transaction.on_commit(lambda: refresh_imported_posts(post_ids, slugs))
+    return result
+
+
+def refresh_imported_posts(post_ids, slugs):
+    """bulk_create/bulk_update不会触发信号，导入完成后统一更新相关帖子索引和预渲染文件"""
+    for post_id in dict.fromkeys(post_ids):
+        update_related_posts(post_id)
+    if get_prerender_root():
+        update_prerendered_posts_safely(set(slugs))
+
+
+def _import_chunk(chunk, author, allow_foreign_updates, result, imported):
+    now = timezone.now()
+    with transaction.atomic():
+        # 一次查询取出本批中已存在的slug
+        wanted_slugs = {data['slug'] for _, data in chunk if data.get('slug')}
+        existing = Post.objects.in_bulk(wanted_slugs, field_name='slug') if wanted_slugs else {}
+
+        to_create, to_update, seen, sent_fields = [], [], set(), set()
+        for index, data in chunk:
+            slug = data.get('slug')
+            if slug in seen:
+                result['errors'].append({'index': index, 'errors': {'slug': [f'同一批次中slug重复: {slug}']}})
+                continue
+            post = existing.get(slug) if slug else None
+            if post is not None and post.author_id != author.pk and not allow_foreign_updates:
+                result['errors'].append({'index': index, 'errors': {'slug': [f'slug已被其他作者使用: {slug}']}})
+                continue
+            if slug:
+                seen.add(slug)
+
+            is_new = post is None
+            if is_new:
+                post = Post(author=author, is_published=True, created_at=data.get('created_at') or now)
+                to_create.append(post)
+            else:
+                to_update.append(post)
+                sent_fields.update(data)
+            for field, value in data.items():
+                setattr(post, field, value)
+            post.updated_at = now
+            # bulk_create/bulk_update不会调用save()，需要在这里预先计算摘要
+            if is_new or 'content' in data:
+                post.refresh_content_stats()
+
+        _assign_slugs([post for post in to_create if not post.slug], seen)
+
+        Post.objects.bulk_create(to_create)
+        # 只更新导入数据中提供了的字段，其余字段保持数据库中的值
+        update_fields = [field for field in BULK_FIELDS if field != 'slug' and field in sent_fields] + ['updated_at']
+        if 'content' in sent_fields:
+            update_fields += CONTENT_STATS_FIELDS
+        if to_update:
+            Post.objects.bulk_update(to_update, update_fields)
+
+        # MySQL的bulk_create不会回填主键，按slug重新取回
+        created_ids = dict(Post.objects.filter(slug__in=[post.slug for post in to_create]).values_list('slug', 'pk'))
+        for post in to_create:
+            post.pk = created_ids[post.slug]
+        _sync_tags(to_create + to_update)
+
+        slugs = [post.slug for post in to_create + to_update]
+        author_ids = {post.author_id for post in to_create + to_update}
+        transaction.on_commit(lambda: invalidate_post(slugs=slugs, author_ids=author_ids))
+        transaction.on_commit(invalidate_post_collections)
+
+    result['created'] += len(to_create)
+    result['updated'] += len(to_update)
+    imported['post_ids'] += [post.pk for post in to_create + to_update]
+    imported['slugs'] += slugs
+
+
+def _assign_slugs(posts, reserved):
+    """为未指定slug的帖子按标题生成slug，一次查询找出所有可能冲突的已有slug后统一加数字后缀"""
+    if not posts:
+        return
+    bases = [slugify(post.title, allow_unicode=True)[:SLUG_BASE_MAX_LENGTH] or 'post' for post in posts]
+    conditions = Q()
+    for base in set(bases):
+        conditions |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    taken = set(Post.objects.filter(conditions).values_list('slug', flat=True)) | set(reserved)
+    for post, base in zip(posts, bases):
+        slug, suffix = base, 2
+        while slug in taken:
+            slug, suffix = f'{base}-{suffix}', suffix + 1
+        taken.add(slug)
+        post.slug = slug
+
+
+def _sync_tags(posts):
+    """批量同步帖子的标签关联"""
+    if not posts:
+        return
+    PostTag = Post.tag_set.through
+    post_tags = {post.pk: list(dict.fromkeys(tag for tag in post.get_tags() if tag)) for post in posts}
+    names = {name for tag_names in post_tags.values() for name in tag_names}
+    if names:
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    # 数据库排序规则可能不区分大小写，统一按小写匹配
+    tag_ids = {name.lower(): pk for pk, name in Tag.objects.filter(name__in=names).values_list('pk', 'name')}
+
+    PostTag.objects.filter(post_id__in=list(post_tags)).delete()
+    PostTag.objects.bulk_create([
+        PostTag(post_id=post_id, tag_id=tag_ids[name.lower()])
+        for post_id, tag_names in post_tags.items()
+        for name in tag_names
+    ], ignore_conflicts=True)
@@ -0,0 +1,138 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+# 版本号使用最后一次失效的时间戳，缓存条目记录生成时的版本，版本不一致即视为过期
+LIST_VERSION_KEY = 'posts:version:list'
+POST_VERSION_KEY = 'posts:version:post:{}'
+AUTHOR_VERSION_KEY = 'posts:version:author:{}'
+RESPONSE_KEY = 'posts:resp:{}:{}'
+# 分区、月份、标签统计以及订阅源、站点地图只在帖子增删改时变化，点击数写入不影响
+AGGREGATES_VERSION_KEY = 'posts:version:aggregates'
+AGGREGATES_KEY = 'posts:aggregates'
+FEEDS_VERSION_KEY = 'posts:version:feeds'
+FEED_KEY = 'posts:feed:{}'
+
+
+def get_versions(keys):
+    """批量读取版本号，缺失的版本号初始化为当前时间"""
+    versions = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def bump_versions(keys):
+    """更新版本号，使相关的缓存条目全部失效"""
+    now = time.time()
+    cache.set_many({key: now for key in keys}, None)
+
+
+def invalidate_post(slugs=(), author_ids=()):
+    """帖子变化时使列表缓存以及对应帖子、作者相关的详情缓存失效"""
+    keys = [LIST_VERSION_KEY]
+    keys += [POST_VERSION_KEY.format(slug) for slug in slugs if slug]
+    keys += [AUTHOR_VERSION_KEY.format(author_id) for author_id in author_ids if author_id]
+    bump_versions(keys)
+
+
+def invalidate_post_details(slugs):
+    """只使对应帖子的详情缓存失效，列表缓存不受影响
+    用于点击数写入：点击数变化很频繁，列表中的点击数允许在缓存期内略有滞后
+    """
+    keys = [POST_VERSION_KEY.format(slug) for slug in slugs if slug]
+    if keys:
+        bump_versions(keys)
+
+
+def invalidate_author(author_id):
+    """作者资料变化时使列表缓存和该作者所有帖子的详情缓存失效"""
+    bump_versions([LIST_VERSION_KEY, AUTHOR_VERSION_KEY.format(author_id)])
+
+
+def invalidate_post_collections():
+    """帖子增删改后使分区、月份、标签统计以及订阅源、站点地图失效"""
+    bump_versions([AGGREGATES_VERSION_KEY, FEEDS_VERSION_KEY])
+
+
+def get_cache_period_start():
+    """当前响应缓存时段的开始时间
+    点击数写入不更新列表版本号，列表的ETag和缓存按时段过期，列表中的点击数最多滞后一个时段
+    """
+    period = getattr(settings, 'POSTS_RESPONSE_CACHE_TIMEOUT', 300)
+    return time.time() // period * period
+
+
+def make_etag(*parts):
+    """根据版本信息生成强ETag"""
+    return '"{}"'.format(hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+def get_user_key(request):
+    """区分不同用户可见内容的标识"""
+    return request.user.pk if request.user.is_authenticated else 'anonymous'
+
+
+def is_conditional_request(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def get_not_modified_response(request, etag, last_modified):
+    """请求的ETag或Last-Modified仍然有效时返回304响应，否则返回None"""
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    """为响应设置ETag和Last-Modified；响应内容因登录用户不同而不同，需按Authorization区分"""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(int(last_modified))
+    patch_vary_headers(response, ['Authorization'])
+
+
+class AnonymousResponseCacheMixin:
+    """未登录用户GET请求的响应缓存
+    缓存键由路径和排序后的查询参数组成，条目中记录生成时依赖的版本号，读取时版本不一致即视为过期。
+    """
+    response_cache_kind = None
+
+    def is_response_cacheable(self, request):
+        return request.method == 'GET' and not request.user.is_authenticated
+
+    def get_response_cache_key(self, request):
+        query = '&'.join(sorted(request.GET.urlencode().split('&')))
+        # 分页链接是绝对地址，缓存键需要包含域名
+        digest = hashlib.md5(f'{request.get_host()}{request.path}?{query}'.encode('utf-8')).hexdigest()
+        return RESPONSE_KEY.format(self.response_cache_kind, digest)
+
+    def get_cached_response(self, request):
+        """返回仍然有效的缓存响应，没有时返回None"""
+        if not self.is_response_cacheable(request):
+            return None
+        entry = cache.get(self.get_response_cache_key(request))
+        if entry is None or get_versions(list(entry['versions'])) != entry['versions']:
+            return None
+        response = Response(entry['data'])
+        # 与响应内容一起缓存的附加信息，不受fields/omit等参数影响
+        response.cache_extra = entry.get('extra') or {}
+        if entry.get('validators'):
+            set_validators(response, *entry['validators'])
+        return response
+
+    def cache_response(self, request, response, versions, validators=None, extra=None):
+        """缓存响应，versions应在读取数据库之前获取，避免与并发的失效操作产生竞争
+        validators为 (etag, last_modified)，命中缓存时一并恢复；extra为命中缓存时视图需要的其他信息
+        """
+        if response.status_code != 200 or not self.is_response_cacheable(request):
+            return
+        entry = {'versions': versions, 'data': response.data, 'validators': validators, 'extra': extra}
+        cache.set(self.get_response_cache_key(request), entry, getattr(settings, 'POSTS_RESPONSE_CACHE_TIMEOUT', 300))
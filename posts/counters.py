@@ -0,0 +1,207 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from .caching import invalidate_post_details
+from .models import Post
+from .trending import record_view
+from .utils import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 每次批量更新的帖子数量
+FLUSH_CHUNK_SIZE = 500
+
+
+def apply_click_deltas(deltas, on_chunk_applied=None):
+    """使用F()表达式把点击增量分批写入数据库，返回更新的帖子数
+    每批写入后调用on_chunk_applied(该批帖子ID)，调用方据此移除已写入的增量，中途失败重试时不会重复累加
+    """
+    post_ids = list(deltas)
+    updated = 0
+    for start in range(0, len(post_ids), FLUSH_CHUNK_SIZE):
+        chunk = post_ids[start:start + FLUSH_CHUNK_SIZE]
+        # 一条UPDATE语句同时更新多行：click_count = click_count + CASE id WHEN ... END
+        delta_expr = Case(
+            *[When(pk=post_id, then=Value(deltas[post_id])) for post_id in chunk],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+        updated += Post.objects.filter(pk__in=chunk).update(click_count=F('click_count') + delta_expr)
+        if on_chunk_applied is not None:
+            on_chunk_applied(chunk)
+        # 点击数写入后只使这些帖子的详情缓存和ETag失效；不使列表缓存失效，否则每次写入都会清空全部列表缓存
+        invalidate_post_details(Post.objects.filter(pk__in=chunk).values_list('slug', flat=True))
+    return updated
+
+
+class PeriodicFlushMixin:
+    """有待写入的数据时，在当前进程中安排一次延迟flush_interval秒的后台写入"""
+    flush_interval = 10
+
+    def _flush_in_background(self):
+        try:
+            with self._timer_lock:
+                self._timer = None
+            self.flush()
+        finally:
+            # 后台线程使用完数据库连接后关闭
+            connection.close()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            with self._timer_lock:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+
+class RedisClickCounter(PeriodicFlushMixin):
+    """基于Redis哈希的点击计数器，多个进程共享同一份待写入增量
+    每个进程在收到点击后定期尝试写入，同一时间只有拿到锁的进程执行；flush_click_counts 命令可随时手动写入
+    """
+    PENDING_KEY = 'posts:clicks:pending'
+    FLUSHING_KEY = 'posts:clicks:flushing'
+    FLUSH_LOCK_KEY = 'posts:clicks:flush-lock'
+
+    def __init__(self, connection, flush_interval):
+        self.connection = connection
+        self.flush_interval = flush_interval
+        self._timer = None
+        self._timer_lock = threading.Lock()
+
+    def incr(self, post_id, amount=1):
+        self.connection.hincrby(self.PENDING_KEY, post_id, amount)
+        self._schedule_flush()
+
+    def get_pending(self, post_ids):
+        """返回尚未写入数据库的点击增量（包含正在写入、还没有写入数据库的部分）"""
+        post_ids = list(post_ids)
+        if not post_ids:
+            return {}
+        pipe = self.connection.pipeline()
+        pipe.hmget(self.PENDING_KEY, post_ids)
+        pipe.hmget(self.FLUSHING_KEY, post_ids)
+        pending, flushing = pipe.execute()
+        return {
+            post_id: int(a or 0) + int(b or 0)
+            for post_id, a, b in zip(post_ids, pending, flushing)
+            if a or b
+        }
+
+    def flush(self):
+        # 同一时间只允许一个进程写入
+        lock = self.connection.lock(self.FLUSH_LOCK_KEY, timeout=300)
+        if not lock.acquire(blocking=False):
+            # 其他进程正在写入，稍后再试，避免之后没有新的点击时增量一直留在Redis中
+            self._schedule_flush()
+            return 0
+        try:
+            # 上次写入中断时先处理遗留的增量，否则原子地把当前增量转移出来
+            if not self.connection.exists(self.FLUSHING_KEY):
+                if not self.connection.exists(self.PENDING_KEY):
+                    return 0
+                self.connection.renamenx(self.PENDING_KEY, self.FLUSHING_KEY)
+            raw = self.connection.hgetall(self.FLUSHING_KEY)
+            deltas = {int(post_id): int(delta) for post_id, delta in raw.items() if int(delta)}
+            # 每批提交后立即从FLUSHING中删除，读取时不会把已写入的增量再算一次，中途失败重试时也只处理剩余的部分
+            updated = apply_click_deltas(
+                deltas, on_chunk_applied=lambda chunk: self.connection.hdel(self.FLUSHING_KEY, *chunk),
+            )
+            self.connection.delete(self.FLUSHING_KEY)
+            return updated
+        finally:
+            lock.release()
+
+
+class LocalClickCounter(PeriodicFlushMixin):
+    """进程内缓冲的点击计数器，未配置Redis时使用，由后台线程定期写入"""
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._timer_lock = threading.Lock()
+
+    def incr(self, post_id, amount=1):
+        with self._lock:
+            self._pending[post_id] += amount
+        self._schedule_flush()
+
+    def get_pending(self, post_ids):
+        with self._lock:
+            return {post_id: self._pending[post_id] for post_id in post_ids if self._pending.get(post_id)}
+
+    def flush(self):
+        with self._lock:
+            deltas, self._pending = dict(self._pending), Counter()
+        applied = set()
+        try:
+            return apply_click_deltas(deltas, on_chunk_applied=applied.update)
+        except Exception:
+            # 尚未写入的增量放回缓冲区，等待下次重试
+            logger.exception('点击数写入失败')
+            with self._lock:
+                self._pending.update({post_id: delta for post_id, delta in deltas.items() if post_id not in applied})
+            return 0
+
+
+_click_counter = None
+_click_counter_lock = threading.Lock()
+
+
+def get_click_counter():
+    """返回当前进程使用的点击计数器"""
+    global _click_counter
+    if _click_counter is None:
+        with _click_counter_lock:
+            if _click_counter is None:
+                redis_connection = get_redis()
+                if redis_connection is not None:
+                    _click_counter = RedisClickCounter(redis_connection, getattr(settings, 'POST_CLICK_FLUSH_INTERVAL', 10))
+                else:
+                    _click_counter = LocalClickCounter(getattr(settings, 'POST_CLICK_FLUSH_INTERVAL', 10))
+                    # 进程退出前写入剩余的点击数
+                    atexit.register(_click_counter.flush)
+    return _click_counter
+
+
+def reset_click_counter(*, setting, **kwargs):
+    """缓存配置变化时（如测试中override_settings）重新选择计数器"""
+    global _click_counter
+    if setting == 'CACHES':
+        _click_counter = None
+
+
+setting_changed.connect(reset_click_counter)
+
+
+def record_click(post_id, category=None):
+    """记录一次点击，不写数据库；同时计入热度榜单"""
+    get_click_counter().incr(post_id)
+    record_view(post_id, category)
+
+
+def record_post_view(request, post_id, category=None):
+    """记录一次帖子详情浏览：点击数和热度照常累加，并在请求上标记帖子ID，由访客记录中间件写入访客记录"""
+    record_click(post_id, category)
+    # DRF的Request不会把属性写回底层的HttpRequest，中间件只能看到后者
+    getattr(request, '_request', request).visited_post_id = post_id
+
+
+def merge_pending_clicks(posts):
+    """把尚未写入的点击增量合并到帖子对象的click_count上"""
+    posts = [post for post in posts if post.pk is not None]
+    if not posts:
+        return
+    pending = get_click_counter().get_pending(post.pk for post in posts)
+    for post in posts:
+        post.click_count += pending.get(post.pk, 0)
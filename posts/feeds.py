@@ -0,0 +1,167 @@
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.encoding import iri_to_uri
+from django.utils import timezone
+from django.utils.feedgenerator import rfc2822_date, rfc3339_date
+from django.utils.http import http_date
+from django.views import View
+
+from .caching import FEED_KEY, FEEDS_VERSION_KEY, get_not_modified_response, get_versions, make_etag
+from .models import Post
+from .rendering import get_rendered_content
+
+# 超过该大小（字节）的输出只流式返回，不写入缓存
+FEED_CACHE_MAX_SIZE = 5 * 1024 * 1024
+
+
+def get_post_url(request, slug):
+    """帖子在前端的访问地址，POSTS_PUBLIC_URL_TEMPLATE为相对路径时使用当前请求的域名"""
+    url = getattr(settings, 'POSTS_PUBLIC_URL_TEMPLATE', '/posts/{slug}/').format(slug=slug)
+    return iri_to_uri(url if url.startswith(('http://', 'https://')) else request.build_absolute_uri(url))
+
+
+class CachedXMLStreamView(View):
+    """流式输出XML并缓存结果
+    内容只在帖子增删改时变化（由版本号标记），ETag和Last-Modified由版本号决定，条件请求无需查询数据库。
+    首次请求边生成边返回，生成完毕后把完整内容写入缓存，之后直接返回缓存。
+    """
+    feed_kind = None
+    content_type = 'application/xml; charset=utf-8'
+
+    def get(self, request, *args, **kwargs):
+        version = get_versions([FEEDS_VERSION_KEY])[FEEDS_VERSION_KEY]
+        etag = make_etag('feed', self.feed_kind, version)
+        not_modified = get_not_modified_response(request, etag, version)
+        if not_modified is not None:
+            return not_modified
+
+        # 链接是绝对地址，缓存键需要包含域名
+        cache_key = FEED_KEY.format(f'{self.feed_kind}:{request.get_host()}')
+        entry = cache.get(cache_key)
+        if entry is not None and entry['version'] == version:
+            response = HttpResponse(entry['body'], content_type=self.content_type)
+        else:
+            response = StreamingHttpResponse(
+                self._stream_and_cache(cache_key, version, self.generate(request)), content_type=self.content_type
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(int(version))
+        return response
+
+    def generate(self, request):
+        """逐段生成XML文本"""
+        raise NotImplementedError
+
+    def _stream_and_cache(self, cache_key, version, chunks):
+        buffer, size = [], 0
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            yield data
+            if buffer is not None:
+                buffer.append(data)
+                size += len(data)
+                if size > FEED_CACHE_MAX_SIZE:
+                    buffer = None
+        # 客户端中途断开时生成器不会执行到这里，不会缓存不完整的内容
+        if buffer is not None:
+            cache.set(cache_key, {'version': version, 'body': b''.join(buffer)},
+                      getattr(settings, 'POSTS_FEED_CACHE_TIMEOUT', 60 * 60 * 24))
+
+    def get_feed_posts(self):
+        """订阅源中的最新帖子，分批读取"""
+        limit = getattr(settings, 'POSTS_FEED_LIMIT', 50)
+        return Post.objects.filter(is_published=True).select_related('author').only(
+            'title', 'slug', 'summary', 'content', 'tags', 'created_at', 'updated_at',
+            'author__username', 'author__nickname',
+        ).order_by('-created_at')[:limit].iterator(chunk_size=50)
+
+
+def _element(name, value, **attrs):
+    attributes = ''.join(f' {key}={quoteattr(str(val))}' for key, val in attrs.items())
+    return f'<{name}{attributes}>{escape(str(value))}</{name}>'
+
+
+def _author_name(post):
+    return post.author.nickname or post.author.username
+
+
+class RSSFeedView(CachedXMLStreamView):
+    """RSS 2.0订阅源"""
+    feed_kind = 'rss'
+    content_type = 'application/rss+xml; charset=utf-8'
+
+    def generate(self, request):
+        site_url = request.build_absolute_uri('/')
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield ('<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" '
+               'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+               'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>')
+        yield _element('title', getattr(settings, 'POSTS_FEED_TITLE', 'Blog'))
+        yield _element('link', site_url)
+        yield _element('description', getattr(settings, 'POSTS_FEED_DESCRIPTION', ''))
+        yield '<atom:link href={} rel="self" type="application/rss+xml"/>'.format(quoteattr(request.build_absolute_uri()))
+        for post in self.get_feed_posts():
+            link = get_post_url(request, post.slug)
+            yield '<item>'
+            yield _element('title', post.title)
+            yield _element('link', link)
+            yield _element('guid', link, isPermaLink='true')
+            yield _element('pubDate', rfc2822_date(post.created_at))
+            # RSS的author要求是邮箱地址，作者名称使用Dublin Core的creator
+            yield _element('dc:creator', _author_name(post))
+            yield _element('description', post.summary)
+            yield _element('content:encoded', get_rendered_content(post)['html'])
+            for tag in post.get_tags():
+                if tag:
+                    yield _element('category', tag)
+            yield '</item>'
+        yield '</channel></rss>'
+
+
+class AtomFeedView(CachedXMLStreamView):
+    """Atom订阅源"""
+    feed_kind = 'atom'
+    content_type = 'application/atom+xml; charset=utf-8'
+
+    def generate(self, request):
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield '<feed xmlns="http://www.w3.org/2005/Atom">'
+        yield _element('title', getattr(settings, 'POSTS_FEED_TITLE', 'Blog'))
+        yield _element('id', request.build_absolute_uri('/'))
+        yield '<link href={} rel="self"/>'.format(quoteattr(request.build_absolute_uri()))
+        latest = Post.objects.filter(is_published=True).order_by('-updated_at').values_list('updated_at', flat=True).first()
+        if latest is not None:
+            yield _element('updated', rfc3339_date(latest))
+        for post in self.get_feed_posts():
+            link = get_post_url(request, post.slug)
+            yield '<entry>'
+            yield _element('title', post.title)
+            yield '<link href={} rel="alternate"/>'.format(quoteattr(link))
+            yield _element('id', link)
+            yield _element('published', rfc3339_date(post.created_at))
+            yield _element('updated', rfc3339_date(post.updated_at))
+            yield '<author>{}</author>'.format(_element('name', _author_name(post)))
+            yield _element('summary', post.summary)
+            yield _element('content', get_rendered_content(post)['html'], type='html')
+            for tag in post.get_tags():
+                if tag:
+                    yield '<category term={}/>'.format(quoteattr(tag))
+            yield '</entry>'
+        yield '</feed>'
+
+
+class SitemapView(CachedXMLStreamView):
+    """站点地图，包含所有已发布帖子，按主键分批读取，内存占用与帖子数量无关"""
+    feed_kind = 'sitemap'
+
+    def generate(self, request):
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        rows = Post.objects.filter(is_published=True).order_by('pk').values_list('slug', 'updated_at')
+        for slug, updated_at in rows.iterator(chunk_size=2000):
+            yield '<url>{}{}</url>'.format(_element('loc', get_post_url(request, slug)),
+                                          _element('lastmod', timezone.localdate(updated_at).isoformat()))
+        yield '</urlset>'
@@ -0,0 +1,12 @@
+import django_filters
+
+from .models import Post
+
+
+class PostFilter(django_filters.FilterSet):
+    """帖子列表过滤器"""
+    tag = django_filters.CharFilter(field_name='tag_set__name', label='标签')
+
+    class Meta:
+        model = Post
+        fields = ['author', 'is_published', 'category', 'tag']
@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.utils import CONTENT_STATS_FIELDS, build_content_stats
+
+
+def _compute_stats(row):
+    """在子进程中计算单篇帖子的摘要信息"""
+    post_id, content = row
+    return post_id, build_content_stats(content)
+
+
+class Command(BaseCommand):
+    help = '为已有帖子批量回填摘要、字数、阅读时间和关键词（多进程并行解析Markdown）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行解析的进程数')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批读取和写回的帖子数量')
+        parser.add_argument('--only-missing', action='store_true', help='只处理尚未生成摘要的帖子')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Post.objects.order_by('pk')
+        if options['only_missing']:
+            queryset = queryset.filter(summary='')
+
+        workers = max(1, options['workers'])
+        chunksize = max(1, batch_size // (workers * 4))
+
+        total = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 按主键分批读取，避免一次把全部正文加载进内存
+            last_pk = 0
+            while True:
+                rows = list(queryset.filter(pk__gt=last_pk).values_list('pk', 'content')[:batch_size])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+
+                posts = []
+                for post_id, stats in executor.map(_compute_stats, rows, chunksize=chunksize):
+                    posts.append(Post(pk=post_id, **stats))
+                # 使用bulk_update写回，不触发save()也不修改updated_at
+                Post.objects.bulk_update(posts, CONTENT_STATS_FIELDS)
+
+                total += len(posts)
+                self.stdout.write(f'已处理 {total} 篇帖子')
+
+        self.stdout.write(self.style.SUCCESS(f'回填完成，共更新 {total} 篇帖子'))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+
+from posts.models import Post
+from posts.pagination import PostKeysetPagination
+
+
+class Command(BaseCommand):
+    help = '使用EXPLAIN检查帖子列表、过滤和详情查询是否命中索引且没有文件排序（请在有真实数据量的库上执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='要检查的数据库别名')
+
+    def get_queries(self):
+        """与接口实际执行的查询保持一致的代表性查询"""
+        sample = Post.objects.order_by('-created_at').values('author_id', 'category', 'slug', 'created_at', 'pk').first() or {
+            'author_id': 1, 'category': 'tech', 'slug': 'example', 'created_at': None, 'pk': 0,
+        }
+        published = Post.objects.filter(is_published=True)
+        # 列表接口每页多取一条用于判断是否还有下一页
+        limit = PostKeysetPagination.page_size + 1
+        queries = [
+            ('帖子列表', published.order_by('-created_at', '-pk')[:limit]),
+            ('按分区过滤', published.filter(category=sample['category']).order_by('-created_at', '-pk')[:limit]),
+            ('按作者过滤', published.filter(author_id=sample['author_id']).order_by('-created_at', '-pk')[:limit]),
+            ('按修改时间排序', published.order_by('-updated_at', '-pk')[:limit]),
+            ('按点击数排序', published.order_by('-click_count', '-pk')[:limit]),
+            ('帖子详情', published.filter(slug=sample['slug'])),
+        ]
+        if sample['created_at'] is not None:
+            # 键集分页的后续页
+            keyset = Q(created_at__lt=sample['created_at']) | Q(created_at=sample['created_at'], pk__lt=sample['pk'])
+            queries.append(('列表翻页', published.filter(keyset).order_by('-created_at', '-pk')[:limit]))
+        return queries
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        checker = getattr(self, f'check_{connection.vendor}', None)
+        if checker is None:
+            self.stdout.write(self.style.WARNING(f'只对MySQL做自动判断，{connection.vendor} 数据库仅输出执行计划'))
+
+        failures = []
+        for name, queryset in self.get_queries():
+            queryset = queryset.using(options['database'])
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(self.explain_prefix(connection) + sql, params)
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for row in rows:
+                self.stdout.write('  ' + ', '.join(f'{key}={value}' for key, value in row.items()))
+
+            problems = checker(rows) if checker else []
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  ✗ {problem}'))
+            if checker and not problems:
+                self.stdout.write(self.style.SUCCESS('  ✓ 命中索引，无文件排序'))
+            failures.extend(f'{name}: {problem}' for problem in problems)
+
+        if failures:
+            raise CommandError('以下查询未能有效使用索引：\n' + '\n'.join(failures))
+
+    def explain_prefix(self, connection):
+        if connection.vendor == 'sqlite':
+            return 'EXPLAIN QUERY PLAN '
+        return 'EXPLAIN '
+
+    def check_mysql(self, rows):
+        problems = []
+        for row in rows:
+            if row.get('table') != Post._meta.db_table:
+                continue
+            if row.get('type') == 'ALL' or not row.get('key'):
+                problems.append('全表扫描')
+            if 'Using filesort' in (row.get('Extra') or ''):
+                problems.append('使用了文件排序（Using filesort）')
+        return problems
@@ -0,0 +1,53 @@
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import export_records, render_front_matter
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = '把帖子流式导出为NDJSON，或导出为带front matter的Markdown文件目录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='输出文件或目录，- 表示输出到标准输出（仅NDJSON）')
+        parser.add_argument('--format', choices=['ndjson', 'markdown'], default='ndjson', help='导出格式')
+        parser.add_argument('--author', help='只导出指定用户名的帖子')
+        parser.add_argument('--published-only', action='store_true', help='只导出已发布的帖子')
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.all()
+        if options['author']:
+            queryset = queryset.filter(author__username=options['author'])
+        if options['published_only']:
+            queryset = queryset.filter(is_published=True)
+
+        output = options['output']
+        if options['format'] == 'markdown':
+            if output == '-':
+                raise CommandError('Markdown格式需要指定输出目录')
+            count = self.export_markdown(queryset, Path(output))
+        elif output == '-':
+            count = self.export_ndjson(queryset, sys.stdout)
+        else:
+            with open(output, 'w', encoding='utf-8') as stream:
+                count = self.export_ndjson(queryset, stream)
+
+        self.stderr.write(self.style.SUCCESS(f'导出完成，共 {count} 篇帖子'))
+
+    def export_ndjson(self, queryset, stream):
+        count = 0
+        for record in export_records(queryset):
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+        return count
+
+    def export_markdown(self, queryset, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for record in export_records(queryset):
+            (directory / f"{record['slug'] or record['title']}.md").write_text(render_front_matter(record), encoding='utf-8')
+            count += 1
+        return count
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import get_click_counter
+
+
+class Command(BaseCommand):
+    help = '把缓冲区中的帖子点击数批量写入数据库（建议通过cron等方式定期执行）'
+
+    def handle(self, *args, **options):
+        updated = get_click_counter().flush()
+        self.stdout.write(self.style.SUCCESS(f'已更新 {updated} 篇帖子的点击数'))
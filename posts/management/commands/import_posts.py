@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import DEFAULT_CHUNK_SIZE, import_posts, read_markdown_dir, read_ndjson
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = '从NDJSON文件或带front matter的Markdown目录批量导入帖子（slug已存在时更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='NDJSON文件路径、Markdown目录，或 - 表示从标准输入读取NDJSON')
+        parser.add_argument('--author', required=True, help='帖子作者的用户名')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每批写入的帖子数量')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f"用户不存在: {options['author']}")
+
+        source = options['source']
+        if source == '-':
+            result = import_posts(read_ndjson(sys.stdin), author, options['chunk_size'], allow_foreign_updates=True)
+        elif Path(source).is_dir():
+            result = import_posts(read_markdown_dir(source), author, options['chunk_size'], allow_foreign_updates=True)
+        elif Path(source).is_file():
+            with open(source, encoding='utf-8') as stream:
+                result = import_posts(read_ndjson(stream), author, options['chunk_size'], allow_foreign_updates=True)
+        else:
+            raise CommandError(f'找不到导入源: {source}')
+
+        for error in result['errors']:
+            self.stderr.write(f"第 {error['index'] + 1} 条导入失败: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"导入完成：新建 {result['created']} 篇，更新 {result['updated']} 篇，失败 {len(result['errors'])} 篇"))
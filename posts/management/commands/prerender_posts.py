@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.prerender import get_prerender_root, prerender_all
+
+
+class Command(BaseCommand):
+    help = '把已发布帖子的详情和列表前几页预渲染为带内容哈希的JSON文件（含gzip/brotli压缩版本），由WhiteNoise直接提供'
+
+    def handle(self, *args, **options):
+        root = get_prerender_root()
+        if not root:
+            raise CommandError('未配置POSTS_PRERENDER_ROOT')
+        count = prerender_all()
+        self.stdout.write(self.style.SUCCESS(f'预渲染完成，共 {count} 篇帖子，输出目录：{root}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.related import rebuild_related_posts
+
+
+class Command(BaseCommand):
+    help = '全量重建相关帖子索引（首次上线、调整POSTS_RELATED_LIMIT或批量回填关键词后执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的帖子数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        last_pk = 0
+        # 按主键分批读取，已删除或未发布帖子的记录也一并清理
+        while True:
+            post_ids = list(Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not post_ids:
+                break
+            last_pk = post_ids[-1]
+            total += rebuild_related_posts(post_ids)
+            self.stdout.write(f'已处理 {total} 篇帖子')
+
+        self.stdout.write(self.style.SUCCESS(f'重建完成，共处理 {total} 篇帖子'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = '刷新热度榜单：重置计分基准、移除热度过低和不再可见的帖子（建议每小时执行一次）'
+
+    def handle(self, *args, **options):
+        counts = refresh_trending()
+        if counts is None:
+            self.stdout.write(self.style.WARNING('其他进程正在刷新热度榜单，本次跳过'))
+            return
+        summary = '，'.join(f'{board} {count} 篇' for board, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'热度榜单刷新完成：{summary}'))
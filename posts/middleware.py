@@ -0,0 +1,48 @@
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import IsDirectoryError, MissingFileError
+from whitenoise.string_utils import ensure_leading_trailing_slash
+
+from .prerender import MANIFEST_NAME
+
+
+class PrerenderedWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """在WhiteNoise的基础上直接提供预渲染的帖子文件
+    WhiteNoise只在启动时扫描静态文件，预渲染文件会在运行期间新增，因此该目录下的文件按请求查找。
+    带内容哈希的文件永久缓存，清单文件使用WhiteNoise默认的缓存时间。
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.prerender_root = getattr(settings, 'POSTS_PRERENDER_ROOT', None)
+        if self.prerender_root:
+            self.prerender_root = os.path.abspath(self.prerender_root).rstrip(os.path.sep) + os.path.sep
+        self.prerender_prefix = ensure_leading_trailing_slash(
+            urlparse(getattr(settings, 'POSTS_PRERENDER_URL', '/prerendered/')).path
+        )
+
+    def __call__(self, request):
+        if self.prerender_root and request.path_info.startswith(self.prerender_prefix):
+            static_file = self.find_prerendered_file(request.path_info)
+            if static_file is not None:
+                return self.serve(static_file, request)
+        return super().__call__(request)
+
+    def find_prerendered_file(self, url):
+        if not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.prerender_root, url[len(self.prerender_prefix):])
+        if not self.path_is_child_of(path, self.prerender_root) or self.is_compressed_variant(path):
+            return None
+        try:
+            return self.get_static_file(path, url)
+        except (MissingFileError, IsDirectoryError):
+            return None
+
+    def immutable_file_test(self, path, url):
+        if self.prerender_root and url.startswith(self.prerender_prefix):
+            return url != self.prerender_prefix + MANIFEST_NAME
+        return super().immutable_file_test(path, url)
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    """MySQL下创建使用ngram分词的全文索引，支持中文检索"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX posts_post_fulltext_idx ON posts_post (title, content, tags) WITH PARSER ngram'
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX posts_post_fulltext_idx ON posts_post')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
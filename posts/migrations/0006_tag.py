@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='标签名')),
+            ],
+            options={
+                'verbose_name': '标签',
+                'verbose_name_plural': '标签',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='posts', to='posts.tag', verbose_name='标签'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def migrate_tags(apps, schema_editor):
+    """把逗号分隔的tags字段迁移到Tag表和标签关联"""
+    Post = apps.get_model('posts', 'Post')
+    Tag = apps.get_model('posts', 'Tag')
+    PostTag = Post.tag_set.through
+
+    post_tags = {}
+    for post_id, tags in Post.objects.exclude(tags__isnull=True).exclude(tags='').values_list('pk', 'tags').iterator():
+        names = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        if names:
+            post_tags[post_id] = list(dict.fromkeys(names))
+
+    names = {name for tag_names in post_tags.values() for name in tag_names}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    # 数据库排序规则可能不区分大小写，统一按小写匹配
+    tag_ids = {name.lower(): pk for pk, name in Tag.objects.values_list('pk', 'name')}
+
+    links = {
+        (post_id, tag_ids[name.lower()])
+        for post_id, tag_names in post_tags.items()
+        for name in tag_names
+    }
+    PostTag.objects.bulk_create(
+        [PostTag(post_id=post_id, tag_id=tag_id) for post_id, tag_id in links],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_tag'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrate_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_published', 'click_count'], name='post_pub_clicks_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 04:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_click_count_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='keywords',
+            field=models.JSONField(blank=True, default=list, verbose_name='正文关键词'),
+        ),
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='相关度')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='posts.post', verbose_name='帖子')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post', verbose_name='相关帖子')),
+            ],
+            options={
+                'verbose_name': '相关帖子',
+                'verbose_name_plural': '相关帖子',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['post', '-score'], name='related_post_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedpost',
+            constraint=models.UniqueConstraint(fields=('post', 'related'), name='related_post_unique'),
+        ),
+    ]
@@ -1,10 +1,47 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils.text import slugify
 from django.utils import timezone
+from .utils import CONTENT_STATS_FIELDS, build_content_stats
 
 # Create your models here.
 
+class Tag(models.Model):
+    """标签"""
+    name = models.CharField(max_length=200, unique=True, verbose_name="标签名")
+
+    class Meta:
+        verbose_name = "标签"
+        verbose_name_plural = "标签"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class PostQuerySet(models.QuerySet):
+    """帖子查询集"""
+
+    def visible_to(self, user):
+        """管理员可以看到所有帖子，作者可以看到自己的草稿，其他人只能看到已发布帖子"""
+        if user.is_authenticated and user.is_staff:
+            return self
+        if user.is_authenticated:
+            return self.filter(Q(is_published=True) | Q(author=user))
+        return self.filter(is_published=True)
+
+    def with_author_stats(self):
+        """通过关联子查询附带作者的文章数和标签数，与帖子在同一条SQL中取出"""
+        author_posts = Post.objects.filter(author=OuterRef('author')).order_by().values('author')
+        author_tags = Post.tag_set.through.objects.filter(post__author=OuterRef('author')).order_by().values('post__author')
+        return self.annotate(
+            author_post_count=Coalesce(Subquery(author_posts.annotate(count=Count('pk')).values('count')), 0),
+            author_tag_count=Coalesce(Subquery(author_tags.annotate(count=Count('tag', distinct=True)).values('count')), 0),
+        )
+
+
 class Post(models.Model):
     # 定义分区选项
     CATEGORY_CHOICES = [
@@ -17,6 +54,8 @@ class Post(models.Model):
     cover_image_url = models.URLField(blank=True, null=True, verbose_name="帖子封面图片URL")
     content = models.TextField(verbose_name="Markdown内容")
     tags = models.CharField(max_length=200, blank=True, null=True, verbose_name="标签（逗号分隔）")
+    # 规范化的标签关联，保存时根据tags字段同步，用于按标签过滤和统计
+    tag_set = models.ManyToManyField(Tag, blank=True, related_name='posts', verbose_name="标签")
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES, default='tech', verbose_name="分区")
     slug = models.SlugField(max_length=200, blank=True, null=True, unique=True, verbose_name="自定义链接slug")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="帖子发布时间")
@@ -29,10 +68,27 @@ class Post(models.Model):
     # 添加点击数字段
     click_count = models.PositiveIntegerField(default=0, verbose_name="点击数")
 
+    # 保存时预先计算的摘要与统计信息，列表接口直接读取
+    summary = models.TextField(blank=True, default='', verbose_name="内容摘要")
+    word_count = models.PositiveIntegerField(default=0, verbose_name="字数")
+    reading_time = models.PositiveIntegerField(default=0, verbose_name="阅读时间（分钟）")
+    keywords = models.JSONField(default=list, blank=True, verbose_name="正文关键词")
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         verbose_name = "帖子"
         verbose_name_plural = "帖子"
         ordering = ['-created_at']
+        # 与公开查询的访问路径一致：按发布状态（及分区/作者）过滤后按时间排序
+        # InnoDB二级索引末尾隐含主键，(created_at, id) 的键集分页可直接沿索引扫描
+        indexes = [
+            models.Index(fields=['is_published', 'created_at'], name='post_pub_created_idx'),
+            models.Index(fields=['category', 'is_published', 'created_at'], name='post_cat_pub_created_idx'),
+            models.Index(fields=['author', 'is_published', 'created_at'], name='post_author_pub_created_idx'),
+            models.Index(fields=['is_published', 'updated_at'], name='post_pub_updated_idx'),
+            models.Index(fields=['is_published', 'click_count'], name='post_pub_clicks_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -41,10 +97,52 @@ class Post(models.Model):
         # 如果没有提供slug，则根据标题自动生成
         if not self.slug:
             self.slug = slugify(self.title, allow_unicode=True)
+        # 内容变化时重新计算摘要、字数和阅读时间
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.refresh_content_stats()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(CONTENT_STATS_FIELDS)
         super().save(*args, **kwargs)
+        # 标签变化时同步标签关联
+        if update_fields is None or 'tags' in update_fields:
+            self.sync_tags()
+
+    def sync_tags(self):
+        """根据tags字段同步标签关联"""
+        names = list(dict.fromkeys(tag for tag in self.get_tags() if tag))
+        if names:
+            Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        self.tag_set.set(Tag.objects.filter(name__in=names))
+
+    def refresh_content_stats(self):
+        """根据当前内容重新计算摘要、字数、阅读时间和关键词"""
+        for field, value in build_content_stats(self.content).items():
+            setattr(self, field, value)
     
     def get_tags(self):
         """返回标签列表"""
         if self.tags:
             return [tag.strip() for tag in self.tags.split(',')]
-        return []
\ No newline at end of file
+        return []
+
+
+class RelatedPost(models.Model):
+    """预先计算的相关帖子，由 posts.related 在帖子保存时增量更新"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries', verbose_name="帖子")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', verbose_name="相关帖子")
+    score = models.FloatField(verbose_name="相关度")
+
+    class Meta:
+        verbose_name = "相关帖子"
+        verbose_name_plural = "相关帖子"
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='related_post_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['post', '-score'], name='related_post_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id}'
@@ -0,0 +1,121 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PostKeysetPagination(CursorPagination):
+    """帖子列表的键集（游标）分页
+    按 (排序字段, id) 组成的键定位下一页，翻到任意深度的代价都和第一页相同，不使用OFFSET。
+    排序字段取自过滤后查询集的排序（例如OrderingFilter的ordering参数），id作为同值时的稳定排序。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self._get_ordering_field(queryset)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['r'])
+
+        # 反向翻页（上一页）时颠倒排序方向，取出后再翻转回来
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + 'pk')
+
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            value = self._parse_value(queryset.model, cursor['v'])
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'pk__{lookup}': cursor['id']})
+            )
+
+        # 多取一条用于判断是否还有更多数据
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+        # 序列化时可能修改对象（如合并未写入的点击数），游标使用查询时取出的排序键
+        self.page_keys = [(getattr(item, self.field), item.pk) for item in self.page]
+
+        if self.reverse:
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(*self.page_keys[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(*self.page_keys[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if cursor['o'] != self.field:
+                raise ValueError('ordering changed')
+            return {'v': cursor['v'], 'id': int(cursor['id']), 'r': bool(cursor.get('r'))}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, value, pk, reverse):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        cursor = {'o': self.field, 'v': value, 'id': pk, 'r': reverse}
+        encoded = urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_ordering_field(self, queryset):
+        """取查询集的第一个排序字段，返回 (字段名, 是否降序)"""
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering) or [self.ordering]
+        first = ordering[0]
+        if not isinstance(first, str):
+            first = self.ordering
+        return first.lstrip('-'), first.startswith('-')
+
+    def _parse_value(self, model, value):
+        try:
+            field = model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            # 注解字段（如相关度得分）直接使用原值
+            return value
+        if isinstance(field, models.DateTimeField):
+            parsed = parse_datetime(value) if isinstance(value, str) else None
+            if parsed is None:
+                raise NotFound(self.invalid_cursor_message)
+            return parsed
+        return value
+
+
+class TrendingPagination(PageNumberPagination):
+    """热度榜单的页码分页，榜单保存在有序集合中，按排名区间读取一页"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
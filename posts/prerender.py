@@ -0,0 +1,202 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .models import Post
+from .pagination import PostKeysetPagination
+from .serializers import PostListSerializer, PostRenderedDetailSerializer
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只生成gzip压缩版本
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 清单文件名固定不变，其余文件名都带内容哈希，可以永久缓存
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_LOCK_NAME = '.manifest.lock'
+DETAIL_NAME = 'posts/{}.json'
+LIST_PAGE_NAME = 'list/page-{}.json'
+# 全量生成时，不再被清单引用且超过该时间（秒）的旧文件会被删除，留给持有旧清单的客户端
+STALE_FILE_GRACE = 60 * 10
+
+
+def get_prerender_root():
+    """预渲染文件的输出目录，未配置时不生成"""
+    return getattr(settings, 'POSTS_PRERENDER_ROOT', None)
+
+
+def get_list_page_count():
+    return getattr(settings, 'POSTS_PRERENDER_LIST_PAGES', 5)
+
+
+@contextmanager
+def _manifest_lock(root):
+    """多个进程同时更新清单时串行执行"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, MANIFEST_LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_atomic(path, data):
+    """先写临时文件再重命名，WhiteNoise不会读到写了一半的文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_asset(root, name, data):
+    """按内容哈希写入文件及其压缩版本，返回带哈希的文件名；内容未变时不重复写入"""
+    base, ext = os.path.splitext(name)
+    hashed_name = '{}.{}{}'.format(base, hashlib.md5(data).hexdigest()[:12], ext)
+    path = os.path.join(root, hashed_name)
+    if not os.path.exists(path):
+        # 压缩版本先于原文件写入，WhiteNoise找到原文件时压缩版本一定已经存在
+        _write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(path + '.br', brotli.compress(data))
+        _write_atomic(path, data)
+    return hashed_name
+
+
+def _remove_asset(root, hashed_name):
+    """删除带哈希的文件及其压缩版本"""
+    path = os.path.join(root, hashed_name)
+    for variant in (path, path + '.gz', path + '.br'):
+        try:
+            os.remove(variant)
+        except FileNotFoundError:
+            pass
+
+
+def _load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)['files']
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+def _save_manifest(root, files):
+    manifest = {'version': 1, 'generated_at': time.time(), 'files': dict(sorted(files.items()))}
+    _write_atomic(os.path.join(root, MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+
+
+def _render(data):
+    # 与接口使用相同的JSON渲染器，输出内容一致
+    return JSONRenderer().render(data)
+
+
+def _published_posts():
+    return Post.objects.filter(is_published=True).select_related('author')
+
+
+def _render_detail(post):
+    context = {'author_stats': {post.author_id: {'post_count': post.author_post_count, 'tag_count': post.author_tag_count}}}
+    return _render(PostRenderedDetailSerializer(post, context=context).data)
+
+
+def _write_details(root, files, posts):
+    for post in posts:
+        files[DETAIL_NAME.format(post.slug)] = _write_asset(root, DETAIL_NAME.format(post.slug), _render_detail(post))
+
+
+def _write_list_pages(root, files):
+    """生成列表前几页，next/previous为清单中的逻辑文件名"""
+    page_size = PostKeysetPagination.page_size
+    page_count = get_list_page_count()
+    queryset = _published_posts().defer(*PostListSerializer.get_deferred_model_fields(None)).order_by('-created_at', '-pk')
+    posts = list(queryset[:page_size * page_count + 1])
+    for name in [name for name in files if name.startswith('list/')]:
+        del files[name]
+    for number in range(1, page_count + 1):
+        page = posts[(number - 1) * page_size:number * page_size]
+        if not page and number > 1:
+            break
+        has_next = len(posts) > number * page_size and number < page_count
+        data = {
+            'next': LIST_PAGE_NAME.format(number + 1) if has_next else None,
+            'previous': LIST_PAGE_NAME.format(number - 1) if number > 1 else None,
+            'results': PostListSerializer(page, many=True, context={}).data,
+        }
+        files[LIST_PAGE_NAME.format(number)] = _write_asset(root, LIST_PAGE_NAME.format(number), _render(data))
+
+
+def prerender_all():
+    """全量生成所有已发布帖子的详情和列表页，并清理不再被引用的旧文件，返回生成的帖子数"""
+    root = get_prerender_root()
+    with _manifest_lock(root):
+        files = {}
+        count = 0
+        # 分批读取，避免一次把全部正文加载进内存
+        for post in _published_posts().with_author_stats().order_by('pk').iterator(chunk_size=200):
+            _write_details(root, files, [post])
+            count += 1
+        _write_list_pages(root, files)
+        _save_manifest(root, files)
+        _prune(root, set(files.values()))
+    return count
+
+
+def update_prerendered_posts(slugs):
+    """帖子变化后增量更新：重新生成这些帖子的详情（不再公开的则移出清单并删除文件）和列表页"""
+    root = get_prerender_root()
+    if not root:
+        return
+    slugs = {slug for slug in slugs if slug}
+    with _manifest_lock(root):
+        files = _load_manifest(root)
+        posts = list(_published_posts().with_author_stats().filter(slug__in=slugs))
+        for slug in slugs - {post.slug for post in posts}:
+            # 不再公开的帖子立即删除文件，不保留给持有旧清单的客户端
+            hashed_name = files.pop(DETAIL_NAME.format(slug), None)
+            if hashed_name:
+                _remove_asset(root, hashed_name)
+        _write_details(root, files, posts)
+        _write_list_pages(root, files)
+        _save_manifest(root, files)
+
+
+def update_prerendered_posts_safely(slugs):
+    """在请求中调用时，预渲染失败不影响已经提交的修改，等待下次全量生成"""
+    try:
+        update_prerendered_posts(slugs)
+    except Exception:
+        logger.exception('预渲染帖子失败')
+
+
+def _prune(root, referenced):
+    """删除不再被清单引用的过期文件（包括压缩版本）"""
+    now = time.time()
+    for directory in ('posts', 'list'):
+        for dirpath, _, filenames in os.walk(os.path.join(root, directory)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name.endswith(('.gz', '.br')):
+                    name = name[:-3]
+                if name not in referenced and now - os.path.getmtime(path) > STALE_FILE_GRACE:
+                    os.remove(path)
@@ -0,0 +1,131 @@
+import heapq
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Post, RelatedPost
+
+# 相关度权重：标签重合度、正文关键词重合度、同一分区
+TAG_WEIGHT = 0.6
+KEYWORD_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.1
+# 候选帖子数量上限：共享标签的帖子和同分区最新的帖子
+TAG_CANDIDATE_LIMIT = 200
+CATEGORY_CANDIDATE_LIMIT = 50
+
+
+def get_related_limit():
+    """每篇帖子保留的相关帖子数量"""
+    return getattr(settings, 'POSTS_RELATED_LIMIT', 5)
+
+
+def _jaccard(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+def _load_profiles(post_ids):
+    """读取计算相关度所需的少量字段，不加载正文"""
+    rows = Post.objects.filter(pk__in=post_ids, is_published=True).values('pk', 'category', 'tags', 'keywords')
+    return {
+        row['pk']: {
+            'category': row['category'],
+            'tag_names': [tag.strip() for tag in (row['tags'] or '').split(',') if tag.strip()],
+            'keywords': set(row['keywords'] or ()),
+        }
+        for row in rows
+    }
+
+
+def score_pair(a, b):
+    """两篇帖子的相关度，范围 0~1"""
+    a_tags = {tag.lower() for tag in a['tag_names']}
+    b_tags = {tag.lower() for tag in b['tag_names']}
+    score = TAG_WEIGHT * _jaccard(a_tags, b_tags) + KEYWORD_WEIGHT * _jaccard(a['keywords'], b['keywords'])
+    if a['category'] == b['category']:
+        score += CATEGORY_WEIGHT
+    return score
+
+
+def _get_candidates(post_id, category, tag_names):
+    """通过标签关联和分区索引找出候选帖子，不扫描全表
+    标签按名称匹配：保存信号触发时该帖子自身的标签关联可能还未同步
+    """
+    PostTag = Post.tag_set.through
+    candidates = set(
+        PostTag.objects.filter(tag__name__in=tag_names).exclude(post_id=post_id)
+        .order_by('-post_id').values_list('post_id', flat=True)[:TAG_CANDIDATE_LIMIT]
+    )
+    candidates.update(
+        Post.objects.filter(category=category, is_published=True).exclude(pk=post_id)
+        .order_by('-created_at').values_list('pk', flat=True)[:CATEGORY_CANDIDATE_LIMIT]
+    )
+    return candidates
+
+
+def _top(scores, limit):
+    return dict(heapq.nlargest(limit, ((post_id, score) for post_id, score in scores.items() if score > 0),
+                               key=lambda item: (item[1], item[0])))
+
+
+def _replace_entries(entries):
+    """用新的相关列表替换指定帖子的全部记录，entries为 {帖子id: {相关帖子id: 相关度}}"""
+    RelatedPost.objects.filter(post_id__in=list(entries)).delete()
+    RelatedPost.objects.bulk_create([
+        RelatedPost(post_id=post_id, related_id=related_id, score=score)
+        for post_id, related in entries.items()
+        for related_id, score in related.items()
+    ])
+
+
+def compute_related(post_id):
+    """计算一篇帖子的相关帖子，返回 (所有候选的相关度, 排名靠前的相关帖子)；帖子不可见时返回None"""
+    profiles = _load_profiles([post_id])
+    if post_id not in profiles:
+        return None
+    profile = profiles[post_id]
+    candidates = _load_profiles(_get_candidates(post_id, profile['category'], profile['tag_names']))
+    scores = {candidate_id: score_pair(profile, other) for candidate_id, other in candidates.items()}
+    return scores, _top(scores, get_related_limit())
+
+
+def update_related_posts(post_id):
+    """帖子保存后增量更新相关帖子索引：重算该帖子自身的列表，并只调整受影响的其他帖子的列表"""
+    limit = get_related_limit()
+    result = compute_related(post_id)
+    with transaction.atomic():
+        if result is None:
+            # 帖子已删除或未发布，从所有列表中移除
+            RelatedPost.objects.filter(post_id=post_id).delete()
+            RelatedPost.objects.filter(related_id=post_id).delete()
+            return
+        scores, top = result
+        entries = {post_id: top}
+
+        # 相关度是对称的：候选帖子和原本把该帖子列为相关的帖子，列表可能需要更新
+        affected = {candidate_id for candidate_id, score in scores.items() if score > 0}
+        affected.update(RelatedPost.objects.filter(related_id=post_id).values_list('post_id', flat=True))
+        current = defaultdict(dict)
+        for row in RelatedPost.objects.filter(post_id__in=affected).values('post_id', 'related_id', 'score'):
+            current[row['post_id']][row['related_id']] = row['score']
+        for other_id in affected:
+            related = current[other_id]
+            score = scores.get(other_id, 0)
+            if post_id not in related and len(related) >= limit and score <= min(related.values()):
+                continue
+            updated = _top({**related, post_id: score}, limit)
+            if updated != related:
+                entries[other_id] = updated
+        _replace_entries(entries)
+
+
+def rebuild_related_posts(post_ids):
+    """全量重建指定帖子的相关列表（不调整其他帖子），返回处理的帖子数"""
+    count = 0
+    for post_id in post_ids:
+        result = compute_related(post_id)
+        with transaction.atomic():
+            _replace_entries({post_id: result[1] if result else {}})
+        count += 1
+    return count
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import markdown
+from django.conf import settings
+from django.core.cache import cache
+
+# 统一的Markdown扩展：代码块、表格、目录
+# codehilite在安装Pygments时输出高亮标记，否则输出 language-xxx 类名供前端高亮库使用
+RENDER_EXTENSIONS = ['fenced_code', 'tables', 'toc', 'codehilite']
+RENDER_EXTENSION_CONFIGS = {
+    'toc': {'permalink': False},
+    'codehilite': {'css_class': 'highlight', 'guess_lang': False},
+}
+# 渲染配置或Markdown版本变化时缓存键随之变化，旧的渲染结果自然失效
+RENDERER_VERSION = hashlib.md5(
+    repr((RENDER_EXTENSIONS, sorted(RENDER_EXTENSION_CONFIGS.items()), markdown.__version__)).encode('utf-8')
+).hexdigest()[:8]
+RENDER_CACHE_KEY = 'posts:render:{}:{}'
+
+_local = threading.local()
+
+
+def get_converter():
+    """返回当前线程的Markdown转换器
+    Markdown实例不是线程安全的，每个线程复用自己的实例，避免每次渲染都重新加载扩展
+    """
+    converter = getattr(_local, 'converter', None)
+    if converter is None:
+        converter = _local.converter = markdown.Markdown(
+            extensions=RENDER_EXTENSIONS, extension_configs=RENDER_EXTENSION_CONFIGS
+        )
+    return converter
+
+
+class LRUCache:
+    """进程内的线程安全LRU缓存"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_render_lru = LRUCache(getattr(settings, 'POSTS_RENDER_LRU_SIZE', 256))
+
+
+def get_render_cache_key(content):
+    return RENDER_CACHE_KEY.format(RENDERER_VERSION, hashlib.sha1(content.encode('utf-8')).hexdigest())
+
+
+def render_markdown(content):
+    """把Markdown渲染为HTML并生成目录，返回 {'html': ..., 'toc': [...]}
+    结果按内容哈希依次缓存在进程内LRU和共享缓存中，相同的文本只解析一次。
+    返回的字典在多个调用方之间共享，不要修改。
+    """
+    content = content or ''
+    key = get_render_cache_key(content)
+    rendered = _render_lru.get(key)
+    if rendered is not None:
+        return rendered
+
+    rendered = cache.get(key)
+    if rendered is None:
+        converter = get_converter()
+        # 清除上次转换留下的状态（目录、脚注等）
+        converter.reset()
+        html = converter.convert(content)
+        rendered = {'html': html, 'toc': converter.toc_tokens}
+        cache.set(key, rendered, getattr(settings, 'POST_HTML_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
+    _render_lru.set(key, rendered)
+    return rendered
+
+
+def get_rendered_content(post):
+    """获取帖子渲染后的HTML和目录"""
+    return render_markdown(post.content)
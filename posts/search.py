@@ -0,0 +1,78 @@
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Func
+from django.utils.html import escape
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+# 全文索引覆盖的列，需与迁移 0005_post_fulltext_index 中的索引定义一致
+FULLTEXT_FIELDS = ('title', 'content', 'tags')
+FULLTEXT_INDEX_NAME = 'posts_post_fulltext_idx'
+
+# 搜索摘要片段在命中位置前后保留的字符数
+SNIPPET_RADIUS = 60
+
+
+class SearchRank(Func):
+    """MySQL全文检索相关度：MATCH (...) AGAINST (... IN NATURAL LANGUAGE MODE)"""
+    output_field = FloatField()
+
+    def __init__(self, *expressions, query):
+        super().__init__(*expressions)
+        self.query = query
+
+    def as_sql(self, compiler, connection, **extra_context):
+        columns, params = [], []
+        for expression in self.source_expressions:
+            sql, expression_params = compiler.compile(expression)
+            columns.append(sql)
+            params.extend(expression_params)
+        sql = 'MATCH ({}) AGAINST (%s IN NATURAL LANGUAGE MODE)'.format(', '.join(columns))
+        return sql, [*params, self.query]
+
+
+class PostSearchFilter(filters.SearchFilter):
+    """帖子搜索过滤器
+    MySQL下使用ngram全文索引并按相关度排序，其他数据库退回DRF默认的icontains搜索
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        if connections[queryset.db].vendor != 'mysql':
+            return super().filter_queryset(request, queryset, view)
+
+        rank = SearchRank(*[F(field) for field in FULLTEXT_FIELDS], query=' '.join(search_terms))
+        queryset = queryset.annotate(search_rank=rank).filter(search_rank__gt=0)
+        # 未指定ordering参数时按相关度排序
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank')
+        return queryset
+
+
+def build_snippet(text, terms, radius=SNIPPET_RADIUS):
+    """截取第一个命中词附近的文本，并用<mark>高亮所有命中词，返回安全的HTML"""
+    terms = [term for term in terms if term]
+    if not text or not terms:
+        return ''
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    match = pattern.search(text)
+    if match is None:
+        start, end = 0, min(len(text), radius * 2)
+    else:
+        start = max(0, match.start() - radius)
+        end = min(len(text), match.end() + radius)
+
+    window = ' '.join(text[start:end].split())
+    parts, last = [], 0
+    for hit in pattern.finditer(window):
+        parts.append(escape(window[last:hit.start()]))
+        parts.append('<mark>{}</mark>'.format(escape(hit.group())))
+        last = hit.end()
+    parts.append(escape(window[last:]))
+
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if end < len(text) else ''
+    return prefix + ''.join(parts) + suffix
@@ -1,8 +1,10 @@
 from rest_framework import serializers
-from .models import Post
+from django.db import models
+from .models import Post, RelatedPost, Tag
+from .counters import merge_pending_clicks
+from .search import PostSearchFilter, build_snippet
+from .rendering import get_rendered_content
 from django.contrib.auth import get_user_model
-import markdown
-from bs4 import BeautifulSoup
 User = get_user_model()
 
 
@@ -15,80 +17,170 @@ class AuthorSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'nickname', 'bio', 'post_count', 'tag_count', 'avatar_url', 'is_station_master')
     
+    def _get_stats(self, obj):
+        # 列表等场景会在上下文中预先批量提供作者统计，避免逐行查询
+        return self.context.get('author_stats', {}).get(obj.pk)
+    
     def get_post_count(self, obj):
         """获取用户发布的文章数量"""
-        return obj.get_post_count()
+        stats = self._get_stats(obj)
+        return stats['post_count'] if stats else obj.get_post_count()
     
     def get_tag_count(self, obj):
         """获取用户使用的不同标签数量"""
-        return obj.get_tag_count()
+        stats = self._get_stats(obj)
+        return stats['tag_count'] if stats else obj.get_tag_count()
+
+
+class SparseFieldsetMixin:
+    """支持通过 ?fields=a,b 或 ?omit=a,b 选择返回的字段，并据此推算需要从数据库加载的列
+    Meta.optional_fields 中的字段只有在fields参数中显式指定时才返回；
+    Meta.field_sources 声明方法字段等无法从source推断的字段依赖哪些列。
+    """
+    # 分页、缓存校验、可见性判断和点击数合并需要，始终加载的列
+    always_loaded_fields = ('id', 'slug', 'author', 'is_published', 'created_at', 'updated_at', 'click_count')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 没有请求时（如预渲染）按默认字段输出
+        request = self.context.get('request')
+        # 不存在的字段名直接忽略，全部不存在时按默认字段输出
+        requested = self._parse_field_names(request, 'fields') & set(self.fields)
+        omitted = self._parse_field_names(request, 'omit')
+        optional = getattr(self.Meta, 'optional_fields', ())
+        for name in list(self.fields):
+            selected = name in requested if requested else name not in optional
+            if not selected or name in omitted:
+                self.fields.pop(name)
+    
+    @staticmethod
+    def _parse_field_names(request, param):
+        if request is None:
+            return set()
+        value = request.query_params.get(param, '')
+        return {name.strip() for name in value.split(',') if name.strip()}
+    
+    def get_field_dependencies(self, name, field):
+        """返回字段依赖的模型列"""
+        field_sources = getattr(self.Meta, 'field_sources', {})
+        if name in field_sources:
+            return field_sources[name]
+        if field.source == '*':
+            return ()
+        return (field.source.split('.')[0],)
+    
+    @classmethod
+    def get_deferred_model_fields(cls, request):
+        """根据请求选择的字段，返回可以延迟加载的模型列"""
+        serializer = cls(context={'request': request})
+        needed = set(cls.always_loaded_fields)
+        for name, field in serializer.fields.items():
+            needed.update(serializer.get_field_dependencies(name, field))
+        return [field.name for field in cls.Meta.model._meta.concrete_fields if field.name not in needed]
+
+
+class PostBatchListSerializer(serializers.ListSerializer):
+    """帖子列表的批量序列化器，在逐行序列化前一次性补充整页数据"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        posts = list(iterable)
+        # 一次查询合并整页帖子尚未写入数据库的点击数；按点击数排序时保持排序所用的数据库中的值
+        if self.context.get('merge_pending_clicks', True):
+            merge_pending_clicks(posts)
+        # 批量获取整页帖子作者的统计数据
+        if 'author' in self.child.fields:
+            self.context['author_stats'] = User.get_author_stats(post.author_id for post in posts)
+        return super().to_representation(posts)
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """帖子列表序列化器"""
     author = AuthorSerializer(read_only=True)
     tag_list = serializers.SerializerMethodField()
-    content_summary = serializers.SerializerMethodField()  # 添加摘要字段
+    content_summary = serializers.CharField(source='summary', read_only=True)  # 保存时预先计算的摘要
+    search_snippet = serializers.SerializerMethodField()  # 搜索时返回高亮的命中片段
     
     class Meta:
         model = Post
-        fields = ('id', 'title', 'cover_image_url', 'slug', 'created_at', 'author', 'tag_list', 'is_published', 'category', 'content_summary', 'click_count')  # 添加click_count字段
+        fields = ('id', 'title', 'cover_image_url', 'slug', 'created_at', 'author', 'tag_list', 'is_published', 'category', 'content_summary', 'word_count', 'reading_time', 'click_count', 'search_snippet', 'content')  # 添加click_count字段
+        list_serializer_class = PostBatchListSerializer
+        # 正文默认不返回也不加载，需通过 ?fields=...,content 显式请求
+        optional_fields = ('content',)
+        field_sources = {'tag_list': ('tags',), 'search_snippet': ('content',)}
     
     def get_tag_list(self, obj):
         """返回标签列表"""
         return obj.get_tags()
-        
-    def get_content_summary(self, obj):
-        """生成Markdown格式的内容摘要
-        保留基本格式，移除图片和代码块，限制长度约200个字符
-        """
-        # 解析Markdown为HTML
-        html_content = markdown.markdown(obj.content)
-        
-        # 使用BeautifulSoup处理HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # 移除图片
-        for img in soup.find_all('img'):
-            img.decompose()
-        
-        # 移除代码块
-        for code_block in soup.find_all('pre'):
-            code_block.decompose()
-        
-        # 获取文本内容
-        text_content = soup.get_text()
-        
-        # 限制长度并确保在句子结束处截断
-        max_length = 200
-        if len(text_content) <= max_length:
-            return text_content
-        
-        # 找到最近的句子结束处
-        truncate_pos = text_content.rfind('.', 0, max_length)
-        if truncate_pos == -1:
-            truncate_pos = text_content.rfind('。', 0, max_length)
-        if truncate_pos == -1:
-            truncate_pos = max_length
-        
-        return text_content[:truncate_pos + 1] + '...'
+    
+    def get_field_dependencies(self, name, field):
+        # 只有搜索时才需要正文来截取命中片段
+        if name == 'search_snippet' and not self._get_search_terms():
+            return ()
+        return super().get_field_dependencies(name, field)
+    
+    def _get_search_terms(self):
+        request = self.context.get('request')
+        if request is None:
+            return []
+        return PostSearchFilter().get_search_terms(request)
+    
+    def get_search_snippet(self, obj):
+        """返回命中搜索词附近的内容片段（HTML，命中词用<mark>包裹），未搜索时为None"""
+        search_terms = self._get_search_terms()
+        if not search_terms:
+            return None
+        return build_snippet(obj.content, search_terms)
+
+
+class TrendingPostSerializer(PostListSerializer):
+    """热度榜单序列化器"""
+    trending_score = serializers.FloatField(read_only=True)  # 按时间衰减后的热度
 
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ('trending_score',)
+        field_sources = dict(PostListSerializer.Meta.field_sources, trending_score=())
 
-class PostDetailSerializer(serializers.ModelSerializer):
+
+class PostDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """帖子详情序列化器"""
     author = AuthorSerializer(read_only=True)
     tag_list = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = '__all__'
-        read_only_fields = ('author', 'created_at', 'updated_at', 'click_count')  # 添加click_count到只读字段
+        exclude = ('tag_set', 'keywords')  # 标签通过tag_list返回，关键词仅用于计算相关帖子
+        field_sources = {'tag_list': ('tags',)}
+        read_only_fields = ('author', 'created_at', 'updated_at', 'click_count', 'summary', 'word_count', 'reading_time')  # 添加click_count到只读字段
     
     def get_tag_list(self, obj):
         """返回标签列表"""
         return obj.get_tags()
 
 
+class PostRenderedDetailSerializer(PostDetailSerializer):
+    """帖子详情序列化器（附带服务端渲染的HTML和目录）"""
+    content_html = serializers.SerializerMethodField()
+    toc = serializers.SerializerMethodField()
+    
+    class Meta(PostDetailSerializer.Meta):
+        field_sources = dict(PostDetailSerializer.Meta.field_sources, content_html=('content',), toc=('content',))
+
+    def _get_rendered(self, obj):
+        # 同一对象只取一次缓存
+        if not hasattr(obj, '_rendered_content'):
+            obj._rendered_content = get_rendered_content(obj)
+        return obj._rendered_content
+
+    def get_content_html(self, obj):
+        """返回渲染后的HTML"""
+        return self._get_rendered(obj)['html']
+
+    def get_toc(self, obj):
+        """返回目录（嵌套的标题列表）"""
+        return self._get_rendered(obj)['toc']
+
+
 class PostCreateSerializer(serializers.ModelSerializer):
     """帖子创建序列化器"""
     # 添加 is_published 字段，默认为 True 表示创建即发布
@@ -111,4 +203,29 @@ class PostUpdateSerializer(serializers.ModelSerializer):
     """帖子更新序列化器"""
     class Meta:
         model = Post
-        fields = ('title', 'cover_image_url', 'content', 'tags', 'category', 'slug', 'is_published')
\ No newline at end of file
+        fields = ('title', 'cover_image_url', 'content', 'tags', 'category', 'slug', 'is_published')
+
+
+class TagSerializer(serializers.ModelSerializer):
+    """标签云序列化器"""
+    post_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Tag
+        fields = ('id', 'name', 'post_count')
+
+
+class RelatedPostSerializer(serializers.ModelSerializer):
+    """相关帖子序列化器"""
+    id = serializers.IntegerField(source='related_id', read_only=True)
+    title = serializers.CharField(source='related.title', read_only=True)
+    slug = serializers.CharField(source='related.slug', read_only=True)
+    cover_image_url = serializers.URLField(source='related.cover_image_url', read_only=True)
+    category = serializers.CharField(source='related.category', read_only=True)
+    content_summary = serializers.CharField(source='related.summary', read_only=True)
+    created_at = serializers.DateTimeField(source='related.created_at', read_only=True)
+
+    class Meta:
+        model = RelatedPost
+        fields = ('id', 'title', 'slug', 'cover_image_url', 'category', 'content_summary', 'created_at', 'score')
+
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import invalidate_post_collections, invalidate_author, invalidate_post
+from .models import Post
+from .prerender import get_prerender_root, update_prerendered_posts_safely
+from .related import update_related_posts
+from .trending import remove_posts
+from .utils import run_in_background
+
+User = get_user_model()
+
+# 嵌入在帖子接口中的作者字段，这些字段变化时需要使帖子缓存失效
+AUTHOR_EMBEDDED_FIELDS = {'username', 'nickname', 'bio', 'avatar_url', 'is_station_master'}
+# 影响相关帖子计算的字段
+RELATED_SOURCE_FIELDS = {'content', 'tags', 'category', 'is_published'}
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_slug(sender, instance, update_fields=None, **kwargs):
+    """记录修改前的slug，slug变化时旧地址的缓存也要失效"""
+    instance._previous_slug = None
+    if instance.pk and (update_fields is None or 'slug' in update_fields):
+        instance._previous_slug = Post.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, **kwargs):
+    # 事务提交后再失效，避免并发请求把未提交前的旧数据写回缓存
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)}
+    transaction.on_commit(lambda: invalidate_post(slugs=slugs, author_ids=[instance.author_id]))
+    transaction.on_commit(invalidate_post_collections)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_post(slugs=[instance.slug], author_ids=[instance.author_id]))
+    transaction.on_commit(invalidate_post_collections)
+
+
+@receiver(post_save, sender=Post)
+def remove_hidden_post_from_trending(sender, instance, **kwargs):
+    """取消发布的帖子立即移出热度榜单"""
+    if not instance.is_published:
+        post_id = instance.pk
+        transaction.on_commit(lambda: remove_posts([post_id]))
+
+
+@receiver(post_save, sender=Post)
+def refresh_related_posts(sender, instance, update_fields=None, **kwargs):
+    """标签、分区、正文或发布状态变化时增量更新相关帖子索引（删除时由外键级联清理）"""
+    if update_fields is not None and not RELATED_SOURCE_FIELDS.intersection(update_fields):
+        return
+    post_id = instance.pk
+    transaction.on_commit(lambda: update_related_posts(post_id))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_prerendered_post(sender, instance, **kwargs):
+    """重新生成该帖子的预渲染文件和列表页，未发布或已删除的帖子移出清单
+    生成时需要渲染详情和多个列表页并等待清单文件锁，提交后在后台线程中执行，不阻塞保存帖子的请求
+    """
+    if not get_prerender_root():
+        return
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)}
+    transaction.on_commit(lambda: run_in_background(update_prerendered_posts_safely, slugs))
+
+
+@receiver(post_delete, sender=Post)
+def remove_deleted_post_from_trending(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: remove_posts([post_id]))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_posts(sender, instance, created, update_fields=None, **kwargs):
+    """作者资料变化时使其帖子相关缓存以及订阅源（包含作者名称）失效，仅更新登录时间等无关字段时跳过"""
+    if created:
+        return
+    if update_fields is not None and not AUTHOR_EMBEDDED_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(lambda: invalidate_author(instance.pk))
+    transaction.on_commit(invalidate_post_collections)
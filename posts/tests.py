@@ -1,3 +1,819 @@
-from django.test import TestCase
+from unittest import mock, skipUnless
+import os
+import tempfile
+import time
+from datetime import datetime
+from importlib import import_module
+from xml.etree import ElementTree
+from urllib.parse import parse_qs, urlparse
+
+from django.apps import apps
+from django.db import connection
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Case
+from django.http import HttpResponseNotFound
+from django.utils import timezone
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from users.models import CustomUser
+from .bulk import import_posts
+from .feeds import AtomFeedView, RSSFeedView, SitemapView
+from .caching import LIST_VERSION_KEY, POST_VERSION_KEY, get_versions
+from . import counters, prerender, trending
+from .counters import LocalClickCounter, RedisClickCounter, apply_click_deltas, get_click_counter
+from .middleware import PrerenderedWhiteNoiseMiddleware
+from .models import Post, Tag
+from .prerender import prerender_all, update_prerendered_posts
+from .serializers import PostListSerializer
+from .trending import record_view, remove_posts
+from .utils import iter_summary_lines
+from .related import rebuild_related_posts, score_pair
+from .views import (
+    PostArchiveView, PostBulkImportView, PostDetailView, PostListView, RelatedPostListView, TagCloudView,
+    TrendingPostListView,
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 # Create your tests here.
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostDetailQueryCountTests(TestCase):
+    """帖子详情接口的查询次数"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.post = Post.objects.create(
+            title='Hello', slug='hello', content='# Hello\n\nworld', tags='django, drf',
+            author=cls.author, is_published=True,
+        )
+        Post.objects.create(title='Draft', slug='draft', content='draft', tags='django', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = PostDetailView.as_view()
+
+    def tearDown(self):
+        # 把测试中产生的点击数写回，避免后台线程在测试结束后访问数据库
+        get_click_counter().flush()
+
+    def test_detail_runs_single_query(self):
+        request = self.factory.get('/api/posts/hello/')
+        with self.assertNumQueries(1):
+            response = self.view(request, slug='hello')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['post_count'], 2)
+        self.assertEqual(response.data['author']['tag_count'], 2)
+        self.assertEqual(response.data['click_count'], 1)
+
+    def test_rendered_detail_runs_single_query(self):
+        request = self.factory.get('/api/posts/hello/', {'render': 'html'})
+        with self.assertNumQueries(1):
+            response = self.view(request, slug='hello')
+        self.assertIn('<h1 id="hello">Hello</h1>', response.data['content_html'])
+
+    def test_draft_hidden_from_anonymous(self):
+        request = self.factory.get('/api/posts/draft/')
+        response = self.view(request, slug='draft')
+        self.assertEqual(response.status_code, 404)
+
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class PostListQueryCountTests(TestCase):
+    """帖子列表接口的查询次数不随每页帖子数和作者数增加"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = PostListView.as_view()
+
+    def create_posts(self, count):
+        for index in range(count):
+            author = CustomUser.objects.create(username=f'author{index}', email=f'author{index}@example.com')
+            Post.objects.create(title=f'Post {index}', slug=f'post-{index}', content='x', tags='django, drf',
+                                author=author, is_published=True)
+
+    def assert_list_queries(self, count):
+        self.create_posts(count)
+        with self.assertNumQueries(2):
+            response = self.view(self.factory.get('/api/posts/', {'page_size': 20}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), count)
+        for item in response.data['results']:
+            self.assertEqual(item['author']['post_count'], 1)
+            self.assertEqual(item['author']['tag_count'], 2)
+
+    def test_single_post_page(self):
+        self.assert_list_queries(1)
+
+    def test_full_page_by_different_authors(self):
+        self.assert_list_queries(20)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostKeysetPaginationTests(TestCase):
+    """帖子列表的键集分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        Post.objects.bulk_create([
+            Post(title=f'Post {i}', slug=f'post-{i}', content='text', author=author, is_published=True)
+            for i in range(25)
+        ])
+        # 一部分帖子的发布时间相同，翻页需要按id区分先后
+        Post.objects.filter(slug__in=[f'post-{i}' for i in range(5, 15)]).update(created_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = PostListView.as_view()
+
+    def get_page(self, url):
+        parsed = urlparse(url)
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        response = self.view(self.factory.get(parsed.path, params))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_cover_all_posts_without_duplicates(self):
+        seen = []
+        url = '/api/posts/?page_size=10'
+        while url:
+            page = self.get_page(url)
+            seen += [item['id'] for item in page['results']]
+            url = page['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.get_page('/api/posts/?page_size=10')
+        self.assertIsNone(first['previous'])
+        second = self.get_page(first['next'])
+        back = self.get_page(second['previous'])
+        self.assertEqual([item['id'] for item in back['results']], [item['id'] for item in first['results']])
+
+    def walk_pages(self, url):
+        seen = []
+        while url:
+            page = self.get_page(url)
+            self.assertLessEqual(len(seen), 25, '翻页没有结束')
+            seen += page['results']
+            url = page['next']
+        return seen
+
+    def test_click_count_pages_ignore_pending_clicks_in_cursor(self):
+        for index, post in enumerate(Post.objects.order_by('pk')):
+            Post.objects.filter(pk=post.pk).update(click_count=index % 5)
+        counter = LocalClickCounter(flush_interval=3600)
+        with mock.patch.object(counters, 'get_click_counter', return_value=counter), \
+                mock.patch.object(LocalClickCounter, '_schedule_flush'):
+            # 点击数最少的帖子有大量未写入的点击，合并后的值不能影响游标
+            for post in Post.objects.filter(click_count=0):
+                counter.incr(post.pk, 100)
+            seen = self.walk_pages('/api/posts/?page_size=4&ordering=-click_count')
+        ids = [item['id'] for item in seen]
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_click_count_ordering_walks_every_page_in_order(self):
+        for index, post in enumerate(Post.objects.order_by('pk')):
+            Post.objects.filter(pk=post.pk).update(click_count=index % 7)
+        counter = LocalClickCounter(flush_interval=3600)
+        with mock.patch.object(counters, 'get_click_counter', return_value=counter), \
+                mock.patch.object(LocalClickCounter, '_schedule_flush'):
+            for post in Post.objects.filter(click_count__lt=2):
+                counter.incr(post.pk, 50)
+            for ordering in ('-click_count', 'click_count'):
+                seen = self.walk_pages(f'/api/posts/?page_size=6&ordering={ordering}')
+                self.assertEqual(len({item['id'] for item in seen}), 25)
+                # 返回的点击数与排序一致，未写入的点击数不会打乱顺序
+                counts = [item['click_count'] for item in seen]
+                self.assertEqual(counts, sorted(counts, reverse=ordering.startswith('-')))
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    POSTS_PRERENDER_ROOT=None,
+)
+class AnonymousResponseCacheTests(TestCase):
+    """未登录用户的响应缓存及保存帖子后的失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.post = Post.objects.create(title='Hello', slug='hello', content='world', author=cls.author, is_published=True)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def tearDown(self):
+        get_click_counter().flush()
+
+    def get_detail(self):
+        return PostDetailView.as_view()(self.factory.get('/api/posts/hello/'), slug='hello')
+
+    def get_list(self):
+        return PostListView.as_view()(self.factory.get('/api/posts/'))
+
+    def test_cached_detail_skips_database(self):
+        self.get_detail()
+        with self.assertNumQueries(0):
+            response = self.get_detail()
+        self.assertEqual(response.data['title'], 'Hello')
+
+    def test_cached_detail_with_sparse_fields(self):
+        # 缓存的响应不含id和分区时，命中缓存仍能记录点击
+        view = PostDetailView.as_view()
+        for _ in range(2):
+            response = view(self.factory.get('/api/posts/hello/', {'fields': 'title'}), slug='hello')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, {'title': 'Hello'})
+        self.assertEqual(get_click_counter().get_pending([self.post.pk]), {self.post.pk: 2})
+
+    def test_saving_post_invalidates_cached_responses(self):
+        self.get_detail()
+        self.get_list()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Changed'
+            self.post.save()
+        self.assertEqual(self.get_detail().data['title'], 'Changed')
+        self.assertEqual(self.get_list().data['results'][0]['title'], 'Changed')
+
+    def test_click_flush_only_invalidates_post_detail(self):
+        keys = [LIST_VERSION_KEY, POST_VERSION_KEY.format('hello')]
+        before = get_versions(keys)
+        apply_click_deltas({self.post.pk: 3})
+        after = get_versions(keys)
+        self.assertEqual(after[LIST_VERSION_KEY], before[LIST_VERSION_KEY])
+        self.assertNotEqual(after[POST_VERSION_KEY.format('hello')], before[POST_VERSION_KEY.format('hello')])
+
+    def test_list_validators_expire_after_cache_period(self):
+        first = self.get_list()
+        etag = first['ETag']
+        conditional = self.factory.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(PostListView.as_view()(conditional).status_code, 304)
+        # 点击数写入不更新列表版本号，过了一个缓存时段后条件请求也要拿到新的响应
+        apply_click_deltas({self.post.pk: 5})
+        with mock.patch('posts.views.get_cache_period_start', return_value=time.time() + 301):
+            response = PostListView.as_view()(self.factory.get('/api/posts/', HTTP_IF_NONE_MATCH=etag))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(response.data['results'][0]['click_count'], 5)
+            modified_since = self.factory.get('/api/posts/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+            self.assertEqual(PostListView.as_view()(modified_since).status_code, 200)
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    POSTS_PRERENDER_ROOT=None,
+)
+class PostBulkImportTests(TestCase):
+    """批量导入的创建与更新"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+
+    def test_reimport_is_idempotent(self):
+        records = [
+            {'title': f'Post {i}', 'slug': f'post-{i}', 'content': f'content {i}', 'tags': 'django, drf'}
+            for i in range(3)
+        ]
+        first = import_posts(records, self.author)
+        second = import_posts(records, self.author)
+        self.assertEqual((first['created'], first['updated'], first['errors']), (3, 0, []))
+        self.assertEqual((second['created'], second['updated'], second['errors']), (0, 3, []))
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Post.tag_set.through.objects.count(), 6)
+        self.assertTrue(all(Post.objects.values_list('is_published', flat=True)))
+
+    def test_update_keeps_fields_not_sent(self):
+        Post.objects.create(title='Draft', slug='draft', content='old', category='life', author=self.author)
+        result = import_posts([{'title': 'Renamed', 'slug': 'draft', 'content': 'new'}], self.author)
+        self.assertEqual(result['updated'], 1)
+        post = Post.objects.get(slug='draft')
+        self.assertEqual((post.title, post.content), ('Renamed', 'new'))
+        self.assertFalse(post.is_published)
+        self.assertEqual(post.category, 'life')
+
+    def test_related_and_prerender_refreshed_once_after_import(self):
+        records = [{'title': f'Post {i}', 'slug': f'post-{i}', 'content': 'x', 'tags': 'django'} for i in range(3)]
+        with mock.patch('posts.bulk.update_related_posts') as update_related, \
+                mock.patch('posts.bulk.update_prerendered_posts_safely') as update_prerendered, \
+                mock.patch('posts.bulk.get_prerender_root', return_value='/tmp/prerendered'), \
+                self.captureOnCommitCallbacks(execute=True):
+            import_posts(records, self.author, chunk_size=1)
+        self.assertEqual(update_related.call_count, 3)
+        update_prerendered.assert_called_once_with({'post-0', 'post-1', 'post-2'})
+
+    def test_endpoint_refreshes_in_background(self):
+        request = APIRequestFactory().post('/api/posts/bulk/', [{'title': 'Post', 'slug': 'post', 'content': 'x'}],
+                                           format='json')
+        force_authenticate(request, user=self.author)
+        with mock.patch('posts.bulk.run_in_background') as run_in_background, \
+                mock.patch('posts.bulk.update_related_posts') as update_related, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = PostBulkImportView.as_view()(request)
+        self.assertEqual(response.data['created'], 1)
+        update_related.assert_not_called()
+        run_in_background.assert_called_once()
+        self.assertEqual(run_in_background.call_args.args[1:], ([Post.objects.get(slug='post').pk], ['post']))
+
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TrendingPostTests(TestCase):
+    """热度榜单"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.tech = Post.objects.create(title='Tech', slug='tech', content='x', category='tech', author=author, is_published=True)
+        cls.life = Post.objects.create(title='Life', slug='life', content='x', category='life', author=author, is_published=True)
+
+    def setUp(self):
+        # 每个测试使用新的进程内榜单
+        trending._trending_store = None
+        self.factory = APIRequestFactory()
+
+    def get_trending(self, **params):
+        response = TrendingPostListView.as_view()(self.factory.get('/api/posts/trending/', params))
+        self.assertEqual(response.status_code, 200)
+        return [item['slug'] for item in response.data['results']]
+
+    def test_ranked_by_views_and_filtered_by_category(self):
+        record_view(self.tech.pk, 'tech')
+        for _ in range(3):
+            record_view(self.life.pk, 'life')
+        self.assertEqual(self.get_trending(), ['life', 'tech'])
+        self.assertEqual(self.get_trending(category='tech'), ['tech'])
+
+    def test_removed_posts_leave_ranking(self):
+        record_view(self.tech.pk, 'tech')
+        record_view(self.life.pk, 'life')
+        remove_posts([self.life.pk])
+        self.assertEqual(self.get_trending(), ['tech'])
+        self.assertEqual(self.get_trending(category='life'), [])
+
+
+class SummaryLinesTests(TestCase):
+    """摘要提取跳过代码块"""
+
+    def test_longer_fence_not_closed_by_shorter_one(self):
+        content = '开头\n````markdown\n```python\nprint(1)\n```\n````\n结尾\n'
+        self.assertEqual(list(iter_summary_lines(content)), ['开头', '结尾'])
+
+    def test_closing_fence_must_match_character(self):
+        content = '~~~\n```\n代码\n~~~~\n结尾\n'
+        self.assertEqual(list(iter_summary_lines(content)), ['结尾'])
+
+
+def fail_second_chunk():
+    """让分批写入点击数时第二批的UPDATE失败"""
+    calls = []
+
+    def build_case(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise DatabaseError('database down')
+        return Case(*args, **kwargs)
+
+    return mock.patch.multiple(counters, Case=build_case, FLUSH_CHUNK_SIZE=1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class ClickCounterFlushTests(TestCase):
+    """点击数分批写入中途失败时，重试不会重复累加已写入的批次"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.posts = [
+            Post.objects.create(title=f'Post {index}', slug=f'post-{index}', content='x', author=author,
+                                is_published=True)
+            for index in range(2)
+        ]
+
+    def setUp(self):
+        patcher = mock.patch.object(counters.PeriodicFlushMixin, '_schedule_flush')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def click_counts(self):
+        return [Post.objects.get(pk=post.pk).click_count for post in self.posts]
+
+    def assert_partial_flush_retried_once(self, counter, failure):
+        for post in self.posts:
+            counter.incr(post.pk, 3)
+        with fail_second_chunk(), failure:
+            counter.flush()
+        # 第一批已写入数据库，不再计入待写入的增量
+        self.assertEqual(self.click_counts(), [3, 0])
+        self.assertEqual(counter.get_pending(post.pk for post in self.posts), {self.posts[1].pk: 3})
+        counter.flush()
+        self.assertEqual(self.click_counts(), [3, 3])
+        self.assertEqual(counter.get_pending(post.pk for post in self.posts), {})
+
+    def test_local_counter_retries_only_unwritten_chunks(self):
+        counter = LocalClickCounter(flush_interval=3600)
+        self.assert_partial_flush_retried_once(counter, self.assertLogs('posts.counters', 'ERROR'))
+
+    @skipUnless(fakeredis, '需要安装fakeredis')
+    def test_redis_counter_retries_only_unwritten_chunks(self):
+        counter = RedisClickCounter(fakeredis.FakeStrictRedis(), flush_interval=3600)
+        self.assert_partial_flush_retried_once(counter, self.assertRaises(DatabaseError))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class TagTests(TestCase):
+    """标签表与tags字段的同步、按标签过滤和标签云"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.other = CustomUser.objects.create_user(username='other', email='other@example.com', password='pass')
+        cls.post = Post.objects.create(title='One', slug='one', content='x', tags='django, drf, django',
+                                       author=cls.author, is_published=True)
+        Post.objects.create(title='Two', slug='two', content='x', tags='django, python', author=cls.author,
+                            is_published=True)
+        Post.objects.create(title='Draft', slug='draft', content='x', tags='django, secret', author=cls.other)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def tag_names(self, post):
+        return sorted(post.tag_set.values_list('name', flat=True))
+
+    def test_save_syncs_tag_set(self):
+        self.assertEqual(self.tag_names(self.post), ['django', 'drf'])
+        self.post.tags = 'drf, rest'
+        self.post.save()
+        self.assertEqual(self.tag_names(self.post), ['drf', 'rest'])
+        self.post.tags = ''
+        self.post.save(update_fields=['tags'])
+        self.assertEqual(self.tag_names(self.post), [])
+
+    def test_save_without_tags_field_keeps_tag_set(self):
+        Post.objects.filter(pk=self.post.pk).update(tags='changed')
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Renamed'
+        post.save(update_fields=['title'])
+        self.assertEqual(self.tag_names(post), ['django', 'drf'])
+
+    def test_list_filtered_by_tag(self):
+        response = PostListView.as_view()(self.factory.get('/api/posts/', {'tag': 'django'}))
+        self.assertEqual(sorted(item['slug'] for item in response.data['results']), ['one', 'two'])
+        response = PostListView.as_view()(self.factory.get('/api/posts/', {'tag': 'secret'}))
+        self.assertEqual(response.data['results'], [])
+
+    def test_tag_cloud_counts_published_posts(self):
+        response = TagCloudView.as_view()(self.factory.get('/api/posts/tags/'))
+        self.assertEqual(
+            [(item['name'], item['post_count']) for item in response.data],
+            [('django', 2), ('drf', 1), ('python', 1)],
+        )
+
+    def test_author_tag_count_uses_distinct_tags(self):
+        stats = CustomUser.get_author_stats([self.author.pk, self.other.pk])
+        self.assertEqual(stats[self.author.pk], {'post_count': 2, 'tag_count': 3})
+        self.assertEqual(stats[self.other.pk], {'post_count': 1, 'tag_count': 2})
+
+    def test_migration_backfills_tags_from_csv(self):
+        Post.tag_set.through.objects.all().delete()
+        Tag.objects.all().delete()
+        Post.objects.filter(pk=self.post.pk).update(tags=' django ,, Drf ,django')
+        migrate_tags = import_module('posts.migrations.0007_migrate_post_tags').migrate_tags
+        migrate_tags(apps, None)
+        self.assertEqual(self.tag_names(self.post), ['Drf', 'django'])
+        self.assertEqual(self.tag_names(Post.objects.get(slug='draft')), ['django', 'secret'])
+        self.assertEqual(Tag.objects.count(), 4)
+        # 重复执行不会产生重复的标签或关联
+        migrate_tags(apps, None)
+        self.assertEqual(Tag.objects.count(), 4)
+        self.assertEqual(Post.tag_set.through.objects.count(), 6)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class SparseFieldsetTests(TestCase):
+    """列表接口的fields/omit参数及按所选字段延迟加载的列"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        Post.objects.create(title='Hello', slug='hello', content='long body', tags='django', author=author,
+                            is_published=True)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def get_list(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = PostListView.as_view()(self.factory.get('/api/posts/', params))
+        self.assertEqual(response.status_code, 200)
+        # 第一条查询读取帖子列表
+        return response.data['results'][0], queries.captured_queries[0]['sql']
+
+    def test_content_not_loaded_by_default(self):
+        item, sql = self.get_list()
+        self.assertNotIn('content', item)
+        self.assertIn('content_summary', item)
+        self.assertNotIn('"posts_post"."content"', sql)
+
+    def test_fields_selects_columns(self):
+        item, sql = self.get_list(fields='title,content')
+        self.assertEqual(item, {'title': 'Hello', 'content': 'long body'})
+        self.assertIn('"posts_post"."content"', sql)
+        self.assertNotIn('"posts_post"."summary"', sql)
+
+    def test_omit_skips_author_stats(self):
+        with self.assertNumQueries(1):
+            response = PostListView.as_view()(self.factory.get('/api/posts/', {'omit': 'author,tag_list'}))
+        item = response.data['results'][0]
+        self.assertNotIn('author', item)
+        self.assertNotIn('tag_list', item)
+        self.assertIn('title', item)
+
+    def test_unknown_field_names_are_ignored(self):
+        item, _ = self.get_list(fields='title,bogus')
+        self.assertEqual(item, {'title': 'Hello'})
+        default, _ = self.get_list()
+        self.assertEqual(self.get_list(fields='bogus')[0], default)
+        self.assertEqual(self.get_list(omit='bogus')[0], default)
+
+    def test_deferred_model_fields(self):
+        request = APIRequestFactory().get('/api/posts/', {'fields': 'title'})
+        deferred = PostListSerializer.get_deferred_model_fields(PostListView().initialize_request(request))
+        self.assertIn('content', deferred)
+        self.assertIn('tags', deferred)
+        self.assertNotIn('title', deferred)
+        for name in ('id', 'slug', 'author', 'is_published', 'created_at', 'click_count'):
+            self.assertNotIn(name, deferred)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class RelatedPostTests(TestCase):
+    """相关帖子的相关度计算、保存时的增量更新和接口"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.django = self.create('django', tags='django, drf', content='django rest framework serializer')
+        self.drf = self.create('drf', tags='django, drf', content='router viewset permission')
+        self.cooking = self.create('cooking', tags='cooking', category='life', content='noodle soup recipe')
+
+    def create(self, slug, **fields):
+        fields = {'title': slug.title(), 'category': 'tech', 'is_published': True, **fields}
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(slug=slug, author=self.author, **fields)
+
+    def save(self, post, **fields):
+        for field, value in fields.items():
+            setattr(post, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+
+    def related(self, slug):
+        response = RelatedPostListView.as_view()(self.factory.get(f'/api/posts/{slug}/related/'), slug=slug)
+        self.assertEqual(response.status_code, 200)
+        return [item['slug'] for item in response.data]
+
+    def test_score_pair(self):
+        profile = {'category': 'tech', 'tag_names': ['Django', 'drf'], 'keywords': {'orm'}}
+        self.assertAlmostEqual(score_pair(profile, {**profile, 'tag_names': ['django', 'DRF']}), 1.0)
+        self.assertAlmostEqual(score_pair(profile, {'category': 'tech', 'tag_names': ['django'], 'keywords': set()}),
+                               0.6 * 0.5 + 0.1)
+        self.assertEqual(score_pair(profile, {'category': 'life', 'tag_names': [], 'keywords': set()}), 0)
+
+    def test_related_posts_ranked_by_score(self):
+        self.assertEqual(self.related('django'), ['drf'])
+        self.assertEqual(self.related('drf'), ['django'])
+        self.assertEqual(self.related('cooking'), [])
+        similar = self.create('orm', tags='django', content='django orm queryset')
+        self.assertEqual(self.related('django'), ['drf', 'orm'])
+        self.assertEqual(self.related('drf'), ['django', 'orm'])
+        # 相关度是对称的，新帖子也出现在已有帖子的列表中
+        self.assertEqual(self.related(similar.slug), ['django', 'drf'])
+
+    def test_incremental_updates_on_save(self):
+        self.save(self.cooking, tags='django, drf', category='tech')
+        self.assertIn('cooking', self.related('django'))
+        self.save(self.drf, is_published=False)
+        self.assertNotIn('drf', self.related('django'))
+        self.assertNotIn('drf', self.related('cooking'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cooking.delete()
+        self.assertEqual(self.related('django'), [])
+
+    @override_settings(POSTS_RELATED_LIMIT=1)
+    def test_limit_keeps_best_matches(self):
+        self.create('partial', tags='django', content='django rest framework serializer')
+        self.assertEqual(self.related('django'), ['drf'])
+        self.assertEqual(self.related('partial'), ['django'])
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.create('orm', tags='django', content='django orm queryset')
+        expected = {slug: self.related(slug) for slug in ('django', 'drf', 'orm', 'cooking')}
+        rebuild_related_posts(Post.objects.values_list('pk', flat=True))
+        self.assertEqual({slug: self.related(slug) for slug in expected}, expected)
+
+    def test_unknown_or_hidden_post_returns_404(self):
+        draft = self.create('draft', tags='django, drf', is_published=False)
+        for slug in ('missing', draft.slug):
+            response = RelatedPostListView.as_view()(self.factory.get(f'/api/posts/{slug}/related/'), slug=slug)
+            self.assertEqual(response.status_code, 404)
+
+
+def local_datetime(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class PostArchiveTests(TestCase):
+    """分区、月份和标签统计接口"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def create(self, slug, created_at, **fields):
+        fields = {'title': slug, 'content': 'x', 'is_published': True, **fields}
+        return Post.objects.create(slug=slug, author=self.author, created_at=created_at, **fields)
+
+    def get_archive(self, **headers):
+        return PostArchiveView.as_view()(self.factory.get('/api/posts/archive/', **headers))
+
+    def test_counts_by_category_local_month_and_tag(self):
+        # 两篇帖子在UTC都是1月31日，按本地时区分属1月和2月
+        self.create('jan', local_datetime(2024, 1, 31, 23, 30), tags='django', category='tech')
+        self.create('feb', local_datetime(2024, 2, 1, 0, 30), tags='django, life', category='life')
+        self.create('draft', local_datetime(2024, 3, 1), tags='secret', is_published=False)
+        data = self.get_archive().data
+        self.assertEqual(
+            [(row['category'], row['count']) for row in data['categories']], [('life', 1), ('tech', 1)],
+        )
+        self.assertEqual(data['months'], [{'month': '2024-02', 'count': 1}, {'month': '2024-01', 'count': 1}])
+        self.assertEqual(data['tags'], [{'name': 'django', 'count': 2}, {'name': 'life', 'count': 1}])
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_months_in_zone_with_daylight_saving(self):
+        # 夏令时（UTC-4）和标准时间（UTC-5）月底的帖子都归入本地月份
+        self.create('july', local_datetime(2024, 7, 31, 23, 30))
+        self.create('december', local_datetime(2024, 12, 1, 0, 30))
+        self.create('november', local_datetime(2024, 11, 30, 23, 30))
+        self.assertEqual(self.get_archive().data['months'], [
+            {'month': '2024-12', 'count': 1}, {'month': '2024-11', 'count': 1}, {'month': '2024-07', 'count': 1},
+        ])
+
+    def test_not_modified_until_posts_change(self):
+        post = self.create('post', local_datetime(2024, 1, 1))
+        etag = self.get_archive()['ETag']
+        self.assertEqual(self.get_archive(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.category = 'life'
+            post.save()
+        response = self.get_archive(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['category'] for row in response.data['categories']], ['life'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PrerenderTests(TestCase):
+    """预渲染文件的增量更新和WhiteNoise提供"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create(username='author', email='author@example.com')
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        settings_override = self.settings(POSTS_PRERENDER_ROOT=self.root, POSTS_PRERENDER_URL='/prerendered/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.middleware = PrerenderedWhiteNoiseMiddleware(lambda request: HttpResponseNotFound())
+
+    def get(self, name):
+        return self.middleware(RequestFactory().get('/prerendered/' + name))
+
+    def test_unpublished_post_file_is_removed(self):
+        post = Post.objects.create(title='Post', slug='post', content='x', is_published=True, author=self.author)
+        prerender_all()
+        hashed_name = prerender._load_manifest(self.root)['posts/post.json']
+        self.assertEqual(self.get(hashed_name).status_code, 200)
+
+        Post.objects.filter(pk=post.pk).update(is_published=False)
+        update_prerendered_posts({'post'})
+        self.assertNotIn('posts/post.json', prerender._load_manifest(self.root))
+        for suffix in ('', '.gz', '.br'):
+            self.assertFalse(os.path.exists(os.path.join(self.root, hashed_name + suffix)))
+        self.assertEqual(self.get(hashed_name).status_code, 404)
+
+    def test_save_updates_in_background(self):
+        with mock.patch('posts.signals.run_in_background') as run_in_background, \
+                mock.patch('posts.signals.update_prerendered_posts_safely') as update_prerendered, \
+                self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='Post', slug='post', content='x', is_published=True, author=self.author)
+        update_prerendered.assert_not_called()
+        run_in_background.assert_called_once_with(update_prerendered, {'post', None})
+
+
+def read_body(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None, POSTS_PUBLIC_URL_TEMPLATE='/posts/{slug}/')
+class FeedTests(TestCase):
+    """RSS/Atom订阅源和站点地图"""
+    DC = '{http://purl.org/dc/elements/1.1/}'
+    ATOM = '{http://www.w3.org/2005/Atom}'
+    SITEMAP = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create(username='author', nickname='作者', email='author@example.com')
+        cls.post = Post.objects.create(title='Hello & <World>', slug='hello', content='**正文**', tags='django',
+                                       is_published=True, author=cls.author)
+        Post.objects.create(title='Draft', slug='draft', content='x', is_published=False, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def get(self, view, path, **headers):
+        response = view.as_view()(self.factory.get(path, **headers))
+        return response, read_body(response) if response.status_code == 200 else b''
+
+    def test_rss(self):
+        response, body = self.get(RSSFeedView, '/feeds/rss.xml')
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+        items = ElementTree.fromstring(body).findall('channel/item')
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].findtext('title'), 'Hello & <World>')
+        self.assertEqual(items[0].findtext('link'), 'http://testserver/posts/hello/')
+        self.assertEqual(items[0].findtext(self.DC + 'creator'), '作者')
+        self.assertIsNone(items[0].find('author'))
+        self.assertEqual(items[0].findtext('category'), 'django')
+
+    def test_atom(self):
+        _, body = self.get(AtomFeedView, '/feeds/atom.xml')
+        entries = ElementTree.fromstring(body).findall(self.ATOM + 'entry')
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].find(self.ATOM + 'link').get('href'), 'http://testserver/posts/hello/')
+        self.assertEqual(entries[0].findtext(f'{self.ATOM}author/{self.ATOM}name'), '作者')
+        self.assertIn('<strong>正文</strong>', entries[0].findtext(self.ATOM + 'content'))
+
+    def test_sitemap_lists_published_posts(self):
+        _, body = self.get(SitemapView, '/sitemap.xml')
+        locations = [url.findtext(self.SITEMAP + 'loc') for url in ElementTree.fromstring(body)]
+        self.assertEqual(locations, ['http://testserver/posts/hello/'])
+
+    def test_cached_body_and_not_modified_until_posts_change(self):
+        response, body = self.get(RSSFeedView, '/feeds/rss.xml')
+        self.assertTrue(response.streaming)
+        cached, cached_body = self.get(RSSFeedView, '/feeds/rss.xml')
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached_body, body)
+
+        not_modified, _ = self.get(RSSFeedView, '/feeds/rss.xml', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified, _ = self.get(SitemapView, '/sitemap.xml', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Renamed'
+            self.post.save()
+        changed, body = self.get(RSSFeedView, '/feeds/rss.xml', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(ElementTree.fromstring(body).findtext('channel/item/title'), 'Renamed')
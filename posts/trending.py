@@ -0,0 +1,234 @@
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+from .models import Post
+from .utils import get_redis
+
+# 热度按指数衰减：一次浏览的贡献每经过一个半衰期减半
+# 为避免逐条衰减，浏览按 2^((发生时间 - 基准时间) / 半衰期) 计分，越新的浏览分值越大，
+# 任意时刻的排序都与衰减后的热度一致；定期任务把基准时间移到当前并按比例缩小分数，防止数值溢出
+TRENDING_KEY = 'posts:trending:{}'
+TRENDING_EPOCH_KEY = 'posts:trending:epoch'
+TRENDING_REFRESH_LOCK_KEY = 'posts:trending:refresh-lock'
+# 全站榜单使用的名称，其余榜单按分区名称区分
+ALL_CATEGORIES = 'all'
+
+
+def get_half_life():
+    """热度半衰期（秒）"""
+    return getattr(settings, 'POSTS_TRENDING_HALF_LIFE', 60 * 60 * 24)
+
+
+def get_board_names(category=None):
+    """一次浏览需要计入的榜单：全站榜单以及帖子所在分区的榜单"""
+    return [ALL_CATEGORIES, category] if category else [ALL_CATEGORIES]
+
+
+def get_all_board_names():
+    return [ALL_CATEGORIES] + [value for value, _ in Post.CATEGORY_CHOICES]
+
+
+class RedisTrendingStore:
+    """基于Redis有序集合的热度榜单，多个进程共享"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_epoch(self):
+        now = time.time()
+        # 首次使用时以当前时间为基准
+        self.connection.set(TRENDING_EPOCH_KEY, now, nx=True)
+        return float(self.connection.get(TRENDING_EPOCH_KEY) or now)
+
+    def incr(self, post_id, boards, weight):
+        pipe = self.connection.pipeline()
+        for board in boards:
+            pipe.zincrby(TRENDING_KEY.format(board), weight, post_id)
+        pipe.execute()
+
+    def count(self, board):
+        return self.connection.zcard(TRENDING_KEY.format(board))
+
+    def top(self, board, start, stop):
+        """返回排名在 [start, stop) 之间的 (帖子id, 原始分数)，只读取这一段"""
+        if stop <= start:
+            return []
+        rows = self.connection.zrevrange(TRENDING_KEY.format(board), start, stop - 1, withscores=True)
+        return [(int(member), score) for member, score in rows]
+
+    def remove(self, post_ids, boards):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        pipe = self.connection.pipeline()
+        for board in boards:
+            pipe.zrem(TRENDING_KEY.format(board), *post_ids)
+        pipe.execute()
+
+    def rebase(self, boards, factor, epoch, min_score, max_size):
+        """所有分数乘以factor并更新基准时间，同时删除过低的分数，每个榜单最多保留max_size篇"""
+        pipe = self.connection.pipeline(transaction=True)
+        for board in boards:
+            key = TRENDING_KEY.format(board)
+            pipe.zunionstore(key, {key: factor})
+            pipe.zremrangebyscore(key, '-inf', f'({min_score}')
+            pipe.zremrangebyrank(key, 0, -(max_size + 1))
+        pipe.set(TRENDING_EPOCH_KEY, epoch)
+        pipe.execute()
+
+    def members(self, board):
+        return {int(member): score for member, score in self.connection.zrange(TRENDING_KEY.format(board), 0, -1, withscores=True)}
+
+    def lock(self):
+        return self.connection.lock(TRENDING_REFRESH_LOCK_KEY, timeout=300)
+
+
+class LocalTrendingStore:
+    """进程内的热度榜单，未配置Redis时使用（各进程的榜单互相独立）"""
+
+    def __init__(self):
+        self._boards = {}
+        self._epoch = time.time()
+        self._lock = threading.RLock()
+
+    def get_epoch(self):
+        return self._epoch
+
+    def incr(self, post_id, boards, weight):
+        with self._lock:
+            for board in boards:
+                scores = self._boards.setdefault(board, {})
+                scores[post_id] = scores.get(post_id, 0) + weight
+
+    def count(self, board):
+        return len(self._boards.get(board, ()))
+
+    def top(self, board, start, stop):
+        if stop <= start:
+            return []
+        with self._lock:
+            scores = self._boards.get(board, {})
+            ranked = heapq.nlargest(stop, scores.items(), key=lambda item: (item[1], item[0]))
+        return ranked[start:stop]
+
+    def remove(self, post_ids, boards):
+        with self._lock:
+            for board in boards:
+                scores = self._boards.get(board, {})
+                for post_id in post_ids:
+                    scores.pop(post_id, None)
+
+    def rebase(self, boards, factor, epoch, min_score, max_size):
+        with self._lock:
+            for board in boards:
+                scores = {post_id: score * factor for post_id, score in self._boards.get(board, {}).items()}
+                kept = heapq.nlargest(max_size, ((post_id, score) for post_id, score in scores.items() if score >= min_score),
+                                      key=lambda item: item[1])
+                self._boards[board] = dict(kept)
+            self._epoch = epoch
+
+    def members(self, board):
+        with self._lock:
+            return dict(self._boards.get(board, {}))
+
+    def lock(self):
+        return self._lock
+
+
+_trending_store = None
+_trending_store_lock = threading.Lock()
+
+
+def get_trending_store():
+    """返回当前进程使用的热度榜单存储"""
+    global _trending_store
+    if _trending_store is None:
+        with _trending_store_lock:
+            if _trending_store is None:
+                redis_connection = get_redis()
+                _trending_store = RedisTrendingStore(redis_connection) if redis_connection is not None else LocalTrendingStore()
+    return _trending_store
+
+
+def reset_trending_store(*, setting, **kwargs):
+    """缓存配置变化时（如测试中override_settings）重新选择存储"""
+    global _trending_store
+    if setting == 'CACHES':
+        _trending_store = None
+
+
+setting_changed.connect(reset_trending_store)
+
+
+def record_view(post_id, category=None):
+    """把一次浏览计入全站榜单和所在分区的榜单"""
+    store = get_trending_store()
+    weight = 2 ** ((time.time() - store.get_epoch()) / get_half_life())
+    store.incr(post_id, get_board_names(category), weight)
+
+
+def remove_posts(post_ids):
+    """从所有榜单中移除帖子（删除或取消发布时）"""
+    get_trending_store().remove(list(post_ids), get_all_board_names())
+
+
+class TrendingRanking:
+    """榜单的惰性序列，切片时才从存储中读取对应的一段，可直接交给分页器使用"""
+
+    def __init__(self, board):
+        self.store = get_trending_store()
+        self.board = board
+        # 原始分数换算为当前时刻的衰减热度（相当于多少次“刚刚发生的浏览”）
+        self.scale = 2 ** ((self.store.get_epoch() - time.time()) / get_half_life())
+
+    def count(self):
+        return self.store.count(self.board)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('TrendingRanking只支持切片')
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        return [(post_id, score * self.scale) for post_id, score in self.store.top(self.board, start, stop)]
+
+
+def refresh_trending(min_score=None, max_size=None):
+    """定期任务：把基准时间移到当前、清理过低的分数和不再可见的帖子
+    返回每个榜单保留的帖子数，已有其他进程在刷新时返回None
+    """
+    store = get_trending_store()
+    min_score = getattr(settings, 'POSTS_TRENDING_MIN_SCORE', 0.01) if min_score is None else min_score
+    max_size = getattr(settings, 'POSTS_TRENDING_MAX_SIZE', 1000) if max_size is None else max_size
+    boards = get_all_board_names()
+
+    lock = store.lock()
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        now = time.time()
+        factor = 2 ** ((store.get_epoch() - now) / get_half_life())
+        # 刷新期间按旧基准写入的少量浏览分值会略微偏高，刷新间隔远小于半衰期时可以忽略
+        store.rebase(boards, factor, now, min_score, max_size)
+
+        # 删除已不存在或未发布的帖子，分区变化的帖子移到新分区的榜单
+        members = {board: store.members(board) for board in boards}
+        post_ids = set().union(*members.values())
+        posts = dict(Post.objects.filter(pk__in=post_ids, is_published=True).values_list('pk', 'category'))
+        store.remove([post_id for post_id in post_ids if post_id not in posts], boards)
+        for board in boards:
+            if board == ALL_CATEGORIES:
+                continue
+            for post_id, score in members[board].items():
+                category = posts.get(post_id)
+                if category is not None and category != board:
+                    store.remove([post_id], [board])
+                    store.incr(post_id, [category], score)
+        return {board: store.count(board) for board in boards}
+    finally:
+        lock.release()
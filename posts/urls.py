@@ -6,7 +6,12 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.PostListView.as_view(), name='post-list'),
     path('create/', views.PostCreateView.as_view(), name='post-create'),  # 移到前面
+    path('bulk/', views.PostBulkImportView.as_view(), name='post-bulk-import'),
+    path('tags/', views.TagCloudView.as_view(), name='tag-cloud'),
+    path('archive/', views.PostArchiveView.as_view(), name='post-archive'),
+    path('trending/', views.TrendingPostListView.as_view(), name='post-trending'),
     path('<slug:slug>/', views.PostDetailView.as_view(), name='post-detail'),  # 移到后面
+    path('<slug:slug>/related/', views.RelatedPostListView.as_view(), name='post-related'),
     path('<slug:slug>/update/', views.PostUpdateView.as_view(), name='post-update'),
     path('<slug:slug>/delete/', views.PostDeleteView.as_view(), name='post-delete'),
     path('<slug:slug>/preview/', views.PostPreviewView.as_view(), name='post-preview'),
@@ -0,0 +1,231 @@
+import io
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.db import connection
+
+from .rendering import render_markdown
+
+logger = logging.getLogger(__name__)
+
+# 摘要最大长度（字符）
+SUMMARY_MAX_LENGTH = 200
+# 阅读速度（每分钟字数），中文按字计、英文按词计
+READING_SPEED = 300
+
+# 匹配单个中日韩字符或一个连续的非中日韩单词
+WORD_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]|[^\s\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+# 保存时预先计算并存入帖子的字段，由 build_content_stats 生成
+CONTENT_STATS_FIELDS = ('summary', 'word_count', 'reading_time', 'keywords')
+
+# 每篇帖子保留的关键词数量，用于相关帖子的内容相似度
+KEYWORD_LIMIT = 20
+# 关键词切分：连续的中日韩字符取相邻两字，英文等取字母数字组成的单词
+KEYWORD_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-zA-Z][a-zA-Z0-9_+#-]+')
+KEYWORD_STOPWORDS = frozenset((
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'any', 'can', 'was', 'one', 'our', 'has', 'have',
+    'this', 'that', 'with', 'from', 'they', 'will', 'would', 'there', 'their', 'what', 'when', 'which', 'then',
+    'than', 'into', 'your', 'about', 'also', 'just', 'some', 'more', 'been', 'were', 'use', 'using', 'how',
+    '我们', '你们', '他们', '一个', '可以', '这个', '那个', '没有', '什么', '自己', '就是', '如果', '因为',
+    '所以', '但是', '已经', '这样', '还是', '然后', '时候', '这些', '那些', '不是', '一些', '以及', '进行',
+))
+
+
+# 流式提取摘要时识别的Markdown语法
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+HTML_PRE_OPEN_PATTERN = re.compile(r'^\s*<pre\b', re.IGNORECASE)
+HTML_PRE_CLOSE_PATTERN = re.compile(r'</pre\s*>', re.IGNORECASE)
+BLOCK_PREFIX_PATTERN = re.compile(r'^ {0,3}(?:#{1,6}(?:\s+|$)|>\s?|[-*+]\s+|\d+[.)]\s+)')
+HORIZONTAL_RULE_PATTERN = re.compile(r'^ {0,3}([-*_])(?:\s*\1){2,}\s*$')
+TABLE_DELIMITER_PATTERN = re.compile(r'^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)+\|?\s*$')
+LINK_DEFINITION_PATTERN = re.compile(r'^ {0,3}\[[^\]]+\]:\s')
+IMAGE_PATTERN = re.compile(r'!\[[^\]]*\](?:\([^)]*\)|\[[^\]]*\])|<img\b[^>]*>', re.IGNORECASE)
+LINK_PATTERN = re.compile(r'\[([^\]]*)\](?:\([^)]*\)|\[[^\]]*\])')
+HTML_TAG_PATTERN = re.compile(r'</?[a-zA-Z][^>]*>')
+EMPHASIS_PATTERN = re.compile(r'\*\*|__|~~|`|(?<!\w)\*|\*(?!\w)')
+ESCAPE_PATTERN = re.compile(r'\\([\\`*_{}\[\]()#+\-.!|>])')
+
+
+def iter_summary_lines(content):
+    """逐行遍历Markdown，跳过代码块、图片等不适合放进摘要的内容，产出纯文本行"""
+    fence = None
+    in_html_pre = False
+    previous_blank = True
+    for line in io.StringIO(content or ''):
+        line = line.rstrip('\n')
+        if fence is not None:
+            # 代码块内的行直到同类型、长度不短于开始标记的结束标记为止全部跳过
+            closing = FENCE_PATTERN.match(line)
+            if closing and closing.group(1)[0] == fence[0] and len(closing.group(1)) >= len(fence) \
+                    and not line[closing.end():].strip():
+                fence = None
+            continue
+        if in_html_pre:
+            in_html_pre = not HTML_PRE_CLOSE_PATTERN.search(line)
+            continue
+        match = FENCE_PATTERN.match(line)
+        if match:
+            fence = match.group(1)
+            continue
+        if HTML_PRE_OPEN_PATTERN.match(line):
+            in_html_pre = not HTML_PRE_CLOSE_PATTERN.search(line)
+            continue
+        if not line.strip():
+            previous_blank = True
+            continue
+        # 空行后缩进4格的是缩进式代码块
+        if previous_blank and line.startswith(('    ', '\t')):
+            continue
+        previous_blank = False
+        if HORIZONTAL_RULE_PATTERN.match(line) or TABLE_DELIMITER_PATTERN.match(line) or LINK_DEFINITION_PATTERN.match(line):
+            continue
+
+        text = line
+        while True:
+            stripped = BLOCK_PREFIX_PATTERN.sub('', text, count=1)
+            if stripped == text:
+                break
+            text = stripped
+        text = IMAGE_PATTERN.sub('', text)
+        text = LINK_PATTERN.sub(r'\1', text)
+        text = HTML_TAG_PATTERN.sub('', text)
+        text = EMPHASIS_PATTERN.sub('', text)
+        text = ESCAPE_PATTERN.sub(r'\1', text)
+        if text.strip().startswith('|'):
+            # 表格行：单元格之间用空格分隔
+            text = ' '.join(cell.strip() for cell in text.strip().strip('|').split('|'))
+        text = text.strip()
+        if text:
+            yield text
+
+
+def extract_summary(content, max_length=SUMMARY_MAX_LENGTH):
+    """流式提取摘要：逐行读取Markdown，攒够超过max_length个字符就停止，再按句子结束处截断
+    工作量只与摘要长度有关，与正文长度无关
+    """
+    collected = []
+    length = 0
+    for text in iter_summary_lines(content):
+        collected.append(text)
+        length += len(text) + 1
+        if length > max_length:
+            break
+    return truncate_summary('\n'.join(collected), max_length)
+
+
+class HTMLTextExtractor(HTMLParser):
+    """增量解析HTML，不构建DOM，同时收集全文和代码块以外的正文"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts = []
+        self.prose_parts = []
+        self._pre_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'pre':
+            self._pre_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'pre' and self._pre_depth:
+            self._pre_depth -= 1
+
+    def handle_data(self, data):
+        self.text_parts.append(data)
+        if not self._pre_depth:
+            self.prose_parts.append(data)
+
+    @classmethod
+    def extract(cls, html):
+        """返回 (全文, 代码块以外的正文)"""
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        return ''.join(parser.text_parts), ''.join(parser.prose_parts)
+
+
+def truncate_summary(text_content, max_length=SUMMARY_MAX_LENGTH):
+    """限制长度并确保在句子结束处截断"""
+    if len(text_content) <= max_length:
+        return text_content
+
+    # 找到最近的句子结束处
+    truncate_pos = text_content.rfind('.', 0, max_length)
+    if truncate_pos == -1:
+        truncate_pos = text_content.rfind('。', 0, max_length)
+    if truncate_pos == -1:
+        truncate_pos = max_length
+
+    return text_content[:truncate_pos + 1] + '...'
+
+
+def count_words(text_content):
+    """统计字数：中文按字计，其他语言按词计"""
+    return len(WORD_PATTERN.findall(text_content))
+
+
+def estimate_reading_time(word_count):
+    """估算阅读时间（分钟），有内容时至少为1分钟"""
+    if not word_count:
+        return 0
+    return max(1, math.ceil(word_count / READING_SPEED))
+
+
+def extract_keywords(text, limit=KEYWORD_LIMIT):
+    """按出现次数取正文的关键词"""
+    counter = Counter()
+    for token in KEYWORD_PATTERN.findall(text):
+        if token.isascii():
+            terms = [token.lower()]
+        else:
+            terms = [token[i:i + 2] for i in range(len(token) - 1)]
+        counter.update(term for term in terms if term not in KEYWORD_STOPWORDS)
+    return [term for term, _ in counter.most_common(limit)]
+
+
+def build_content_stats(content):
+    """生成摘要、字数、阅读时间和关键词
+    摘要直接从Markdown流式提取，移除图片和代码块，限制长度约200个字符；
+    字数和关键词需要全文，使用渲染服务的结果（与详情页共用缓存）增量解析
+    """
+    # 与详情页共用渲染服务，保存时的渲染结果也会被详情页和订阅源直接复用
+    html_content = render_markdown(content)['html']
+
+    # 字数统计基于完整正文（包含代码块），关键词只取代码块以外的正文
+    text_content, prose_content = HTMLTextExtractor.extract(html_content)
+    word_count = count_words(text_content)
+    return {
+        'summary': extract_summary(content),
+        'word_count': word_count,
+        'reading_time': estimate_reading_time(word_count),
+        'keywords': extract_keywords(prose_content),
+    }
+
+
+def get_redis():
+    """返回默认缓存对应的Redis连接，未使用django-redis时返回None"""
+    if not settings.CACHES['default']['BACKEND'].startswith('django_redis'):
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def run_in_background(func, *args):
+    """在后台线程中执行耗时的派生数据更新，不阻塞当前请求；执行结束后关闭该线程的数据库连接"""
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('后台任务执行失败: %s', getattr(func, '__name__', func))
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -1,45 +1,103 @@
+from collections import Counter
+from datetime import timezone as dt_timezone
+
 from django.shortcuts import render
 from rest_framework import generics, permissions, filters, status
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from .models import Post
-from .serializers import PostListSerializer, PostDetailSerializer, PostCreateSerializer, PostUpdateSerializer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count, DateTimeField, ExpressionWrapper, F, Value
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+from .models import Post, RelatedPost, Tag
+from .counters import record_post_view, merge_pending_clicks
+from .pagination import PostKeysetPagination, TrendingPagination
+from .trending import ALL_CATEGORIES, TrendingRanking
+from .search import PostSearchFilter
+from .filters import PostFilter
+from .bulk import NDJSONParser, PostBulkItemSerializer, import_posts
+from .caching import (
+    AnonymousResponseCacheMixin, get_versions, make_etag, get_user_key, is_conditional_request,
+    get_not_modified_response, set_validators, LIST_VERSION_KEY, POST_VERSION_KEY, AUTHOR_VERSION_KEY,
+    AGGREGATES_KEY, AGGREGATES_VERSION_KEY, get_cache_period_start,
+)
+from .serializers import PostListSerializer, TrendingPostSerializer, PostDetailSerializer, PostRenderedDetailSerializer, PostCreateSerializer, PostUpdateSerializer, RelatedPostSerializer, TagSerializer
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 # Create your views here.
 
 
-class PostListView(generics.ListAPIView):
+class PostListView(AnonymousResponseCacheMixin, generics.ListAPIView):
     """帖子列表视图"""
     serializer_class = PostListSerializer
     permission_classes = (permissions.AllowAny,)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['author', 'is_published', 'category']
+    pagination_class = PostKeysetPagination
+    response_cache_kind = 'list'
+    # 搜索过滤器放在排序之后，未指定ordering时按相关度排序
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, PostSearchFilter]
+    filterset_class = PostFilter
     search_fields = ['title', 'content', 'tags']
-    ordering_fields = ['created_at', 'updated_at']
+    ordering_fields = ['created_at', 'updated_at', 'click_count']
     ordering = ['-created_at']
     
     @swagger_auto_schema(
         operation_summary="获取帖子列表",
-        operation_description="返回所有已发布的帖子列表，支持分页、过滤、搜索和排序。管理员可以看到所有帖子（包括草稿）",
+        operation_description="返回所有已发布的帖子列表，支持游标分页、过滤、搜索和排序。管理员可以看到所有帖子（包括草稿）。翻页请直接使用返回的next/previous链接",
         manual_parameters=[
             openapi.Parameter('author', openapi.IN_QUERY, description="根据作者ID过滤", type=openapi.TYPE_INTEGER),
             openapi.Parameter('is_published', openapi.IN_QUERY, description="根据发布状态过滤", type=openapi.TYPE_BOOLEAN),
             openapi.Parameter('category', openapi.IN_QUERY, description="根据分区过滤(tech:技术, chat:杂谈, life:生活)", type=openapi.TYPE_STRING),
-            openapi.Parameter('search', openapi.IN_QUERY, description="搜索标题、内容或标签", type=openapi.TYPE_STRING),
-            openapi.Parameter('ordering', openapi.IN_QUERY, description="排序字段，支持created_at和updated_at", type=openapi.TYPE_STRING),
+            openapi.Parameter('tag', openapi.IN_QUERY, description="根据标签名过滤", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="全文搜索标题、内容或标签，未指定ordering时按相关度排序", type=openapi.TYPE_STRING),
+            openapi.Parameter('ordering', openapi.IN_QUERY, description="排序字段，支持created_at、updated_at和click_count，前缀-表示降序；按click_count排序时返回已写入数据库的点击数", type=openapi.TYPE_STRING),
+            openapi.Parameter('fields', openapi.IN_QUERY, description="只返回指定字段（逗号分隔），正文content需显式指定", type=openapi.TYPE_STRING),
+            openapi.Parameter('omit', openapi.IN_QUERY, description="不返回指定字段（逗号分隔）", type=openapi.TYPE_STRING),
         ],
         responses={200: PostListSerializer(many=True)}
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        # 列表的ETag和Last-Modified由集合版本号决定，无需查询数据库即可返回304
+        versions = get_versions([LIST_VERSION_KEY])
+        validators = self.get_validators(request, versions[LIST_VERSION_KEY])
+        not_modified = get_not_modified_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        
+        # 未登录用户优先使用缓存的响应，上一个时段缓存的响应不再使用
+        cached = self.get_cached_response(request)
+        if cached is not None and cached.get('ETag') == validators[0]:
+            return cached
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, *validators)
+        self.cache_response(request, response, versions, validators)
+        return response
+    
+    def get_validators(self, request, list_version):
+        """返回 (ETag, Last-Modified)，列表同时按响应缓存时段过期，点击数最多滞后一个时段"""
+        period_start = get_cache_period_start()
+        etag = make_etag('list', list_version, period_start, get_user_key(request), request.get_full_path())
+        return etag, max(list_version, period_start)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # 按点击数排序时合并未写入的点击数会让列表看起来顺序错乱
+        context['merge_pending_clicks'] = getattr(self.paginator, 'field', None) != 'click_count'
+        return context
     
     # 修复：正确缩进 get_queryset() 方法
     def get_queryset(self):
         user = self.request.user
-        queryset = Post.objects.all()
+        # 作者信息随帖子一起取出，作者统计由序列化器按整页批量查询
+        # 只加载所选字段需要的列，正文等大字段默认不读取
+        queryset = Post.objects.select_related('author').defer(
+            *self.get_serializer_class().get_deferred_model_fields(self.request)
+        )
         
         if user.is_authenticated:
             # 作者能看到自己的所有帖子 + 其他人的已发布帖子
@@ -53,38 +111,154 @@ class PostListView(generics.ListAPIView):
         return queryset
 
 
-class PostDetailView(generics.RetrieveAPIView):
+class TrendingPostListView(generics.ListAPIView):
+    """热门帖子视图"""
+    serializer_class = TrendingPostSerializer
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = TrendingPagination
+    filter_backends = []
+    
+    @swagger_auto_schema(
+        operation_summary="获取热门帖子",
+        operation_description="按随时间衰减的浏览热度返回已发布的帖子，每次浏览的贡献每经过一个半衰期（默认24小时）减半。"
+                              "榜单由浏览事件增量维护，每页只读取对应排名区间",
+        manual_parameters=[
+            openapi.Parameter('category', openapi.IN_QUERY, description="分区榜单(tech:技术, chat:杂谈, life:生活)，不传时为全站榜单", type=openapi.TYPE_STRING),
+            openapi.Parameter('fields', openapi.IN_QUERY, description="只返回指定字段（逗号分隔）", type=openapi.TYPE_STRING),
+            openapi.Parameter('omit', openapi.IN_QUERY, description="不返回指定字段（逗号分隔）", type=openapi.TYPE_STRING),
+        ],
+        responses={200: TrendingPostSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        category = self.request.query_params.get('category') or ALL_CATEGORIES
+        if category != ALL_CATEGORIES and category not in dict(Post.CATEGORY_CHOICES):
+            raise ValidationError({'category': f'不存在的分区: {category}'})
+        return TrendingRanking(category)
+    
+    def list(self, request, *args, **kwargs):
+        ranking = self.paginate_queryset(self.get_queryset())
+        scores = dict(ranking)
+        # 只查询当前页的帖子，按榜单顺序返回；刚取消发布还未移出榜单的帖子直接跳过
+        posts = Post.objects.filter(pk__in=scores, is_published=True).select_related('author').defer(
+            *self.get_serializer_class().get_deferred_model_fields(request)
+        ).in_bulk()
+        page = []
+        for post_id, score in ranking:
+            if post_id in posts:
+                posts[post_id].trending_score = score
+                page.append(posts[post_id])
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class PostDetailView(AnonymousResponseCacheMixin, generics.RetrieveAPIView):
     """帖子详情视图"""
     serializer_class = PostDetailSerializer
     permission_classes = (permissions.AllowAny,)
     lookup_field = 'slug'
+    response_cache_kind = 'detail'
     
     @swagger_auto_schema(
         operation_summary="获取帖子详情",
-        operation_description="根据slug获取单个帖子的详细信息。只有作者或管理员可以查看未发布的帖子",
-        responses={200: PostDetailSerializer}
+        operation_description="根据slug获取单个帖子的详细信息。只有作者或管理员可以查看未发布的帖子。传入render=html时额外返回服务端渲染的HTML和目录",
+        manual_parameters=[
+            openapi.Parameter('render', openapi.IN_QUERY, description="传入html时返回content_html和toc字段", type=openapi.TYPE_STRING),
+            openapi.Parameter('fields', openapi.IN_QUERY, description="只返回指定字段（逗号分隔）", type=openapi.TYPE_STRING),
+            openapi.Parameter('omit', openapi.IN_QUERY, description="不返回指定字段（逗号分隔）", type=openapi.TYPE_STRING),
+        ],
+        responses={200: PostRenderedDetailSerializer}
     )
     def get(self, request, *args, **kwargs):
         """处理GET请求，返回帖子详情，并自动增加点击数"""
-        # 获取帖子对象
+        slug = kwargs[self.lookup_field]
+        # 条件请求只查询修改时间等少量字段，不加载正文也不执行序列化
+        if is_conditional_request(request):
+            row = Post.objects.visible_to(request.user).filter(slug=slug).values('pk', 'updated_at', 'author_id', 'category').first()
+            if row is not None:
+                versions = get_versions([POST_VERSION_KEY.format(slug), AUTHOR_VERSION_KEY.format(row['author_id'])])
+                not_modified = get_not_modified_response(request, *self.get_validators(request, row['pk'], row['updated_at'], versions))
+                if not_modified is not None:
+                    record_post_view(request, row['pk'], row['category'])
+                    return not_modified
+        
+        # 未登录用户优先使用缓存的响应，点击数照常记录
+        # 响应内容可能因fields/omit参数不含id和分区，点击记录使用缓存条目中单独保存的值
+        cached = self.get_cached_response(request)
+        if cached is not None and 'post_id' in cached.cache_extra:
+            record_post_view(request, cached.cache_extra['post_id'], cached.cache_extra['category'])
+            return cached
+        versions = get_versions([POST_VERSION_KEY.format(slug)])
+        
+        # 帖子、作者及作者统计在一条查询中取出
         post = self.get_object()
-        # 增加点击数
-        post.click_count += 1
-        post.save(update_fields=['click_count'])
-        # 继续原来的逻辑返回帖子详情
-        return super().get(request, *args, **kwargs)
+        # 点击数先记入缓冲区，由 flush_click_counts 定期批量写入数据库
+        record_post_view(request, post.pk, post.category)
+        merge_pending_clicks([post])
+        # 作者统计已由查询注解提供，序列化时不再额外查询
+        context = self.get_serializer_context()
+        context['author_stats'] = {
+            post.author_id: {'post_count': post.author_post_count, 'tag_count': post.author_tag_count},
+        }
+        serializer = self.get_serializer_class()(post, context=context)
+        response = Response(serializer.data)
+        # 详情中包含作者资料和统计，作者相关变化也需要使缓存失效
+        versions.update(get_versions([AUTHOR_VERSION_KEY.format(post.author_id)]))
+        validators = self.get_validators(request, post.pk, post.updated_at, versions)
+        set_validators(response, *validators)
+        self.cache_response(request, response, versions, validators,
+                            extra={'post_id': post.pk, 'category': post.category})
+        return response
+    
+    def get_validators(self, request, post_id, updated_at, versions):
+        """返回 (ETag, Last-Modified)，由帖子修改时间和帖子、作者的版本号决定"""
+        stamps = [versions[key] for key in sorted(versions)]
+        etag = make_etag('detail', post_id, updated_at.timestamp(), *stamps, get_user_key(request), request.get_full_path())
+        return etag, max([updated_at.timestamp(), *stamps])
+    
+    def get_serializer_class(self):
+        """render=html时使用带渲染结果的序列化器"""
+        if self.request.query_params.get('render') == 'html':
+            return PostRenderedDetailSerializer
+        return super().get_serializer_class()
     
     def get_queryset(self):
         """返回已发布的帖子，作者可以看到自己的草稿"""
-        user = self.request.user
-        queryset = Post.objects.all()
-        
-        # 非管理员用户和非作者只能看到已发布的帖子
-        if not (user.is_authenticated and (user.is_staff or 
-                queryset.filter(slug=self.kwargs.get(self.lookup_field), author=user).exists())):
-            queryset = queryset.filter(is_published=True)
-            
-        return queryset
+        return Post.objects.visible_to(self.request.user).select_related('author').with_author_stats().defer(
+            *self.get_serializer_class().get_deferred_model_fields(self.request)
+        )
+
+
+class RelatedPostListView(generics.ListAPIView):
+    """相关帖子视图"""
+    serializer_class = RelatedPostSerializer
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+    
+    @swagger_auto_schema(
+        operation_summary="获取相关帖子",
+        operation_description="返回与指定帖子标签、分区和正文关键词最相近的已发布帖子，按相关度从高到低排列。"
+                              "结果在帖子保存时预先计算，读取时只需一次按帖子的索引查询",
+        responses={200: RelatedPostSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        source = Post.objects.visible_to(self.request.user).filter(slug=self.kwargs['slug'])
+        return RelatedPost.objects.filter(post__in=source, related__is_published=True).select_related('related').only(
+            'score', 'post_id', 'related_id', 'related__title', 'related__slug', 'related__cover_image_url',
+            'related__category', 'related__summary', 'related__created_at',
+        ).order_by('-score')
+    
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        # 没有相关帖子时再确认帖子本身是否存在且可见
+        if not response.data and not Post.objects.visible_to(request.user).filter(slug=self.kwargs['slug']).exists():
+            raise NotFound()
+        return response
 
 
 class PostCreateView(generics.CreateAPIView):
@@ -107,6 +281,34 @@ class PostCreateView(generics.CreateAPIView):
         serializer.save(author=self.request.user)
 
 
+class PostBulkImportView(APIView):
+    """批量导入帖子视图"""
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (JSONParser, NDJSONParser)
+    # 单次请求允许导入的最大帖子数量
+    max_items = 5000
+    
+    @swagger_auto_schema(
+        operation_summary="批量导入帖子",
+        operation_description="一次创建或更新多篇帖子。请求体为JSON数组或NDJSON（Content-Type: application/x-ndjson）。"
+                              "slug已存在时更新该帖子（只能更新自己的帖子，管理员除外），未指定slug时根据标题自动生成。"
+                              "相关帖子和预渲染页面在响应返回后更新",
+        request_body=PostBulkItemSerializer(many=True),
+        responses={200: '导入结果：created、updated数量和errors列表'}
+    )
+    def post(self, request, *args, **kwargs):
+        """处理POST请求，分批写入帖子"""
+        records = request.data
+        if not isinstance(records, list):
+            return Response({'detail': '请求体必须是帖子数组或NDJSON'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(records) > self.max_items:
+            return Response({'detail': f'单次最多导入{self.max_items}篇帖子'}, status=status.HTTP_400_BAD_REQUEST)
+        # 相关帖子索引和预渲染文件在响应返回后由后台线程更新
+        result = import_posts(records, request.user, allow_foreign_updates=request.user.is_staff,
+                              refresh_in_background=True)
+        return Response(result)
+
+
 class PostUpdateView(generics.UpdateAPIView):
     """更新帖子视图"""
     serializer_class = PostUpdateSerializer
@@ -194,3 +396,88 @@ class PostPreviewView(generics.RetrieveAPIView):
             return queryset
         return queryset.filter(author=user)
 
+
+class TagCloudView(generics.ListAPIView):
+    """标签云视图"""
+    serializer_class = TagSerializer
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+    
+    @swagger_auto_schema(
+        operation_summary="获取标签云",
+        operation_description="返回已发布帖子使用的所有标签及其帖子数量，按数量从多到少排列",
+        responses={200: TagSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        """一次GROUP BY查询统计每个标签下已发布帖子的数量"""
+        return Tag.objects.filter(posts__is_published=True).annotate(
+            post_count=Count('posts')
+        ).order_by('-post_count', 'name')
+
+
+class PostArchiveView(APIView):
+    """帖子归档统计视图"""
+    permission_classes = (permissions.AllowAny,)
+    
+    @swagger_auto_schema(
+        operation_summary="获取分区、月份和标签统计",
+        operation_description="返回已发布帖子按分区、发布月份和标签分组的数量，供侧边栏使用。"
+                              "结果会被缓存，帖子新建、修改或删除后失效",
+        responses={200: '{"categories": [{"category", "name", "count"}], "months": [{"month": "YYYY-MM", "count"}], "tags": [{"name", "count"}]}'}
+    )
+    def get(self, request, *args, **kwargs):
+        version = get_versions([AGGREGATES_VERSION_KEY])[AGGREGATES_VERSION_KEY]
+        validators = (make_etag('aggregates', version), version)
+        not_modified = get_not_modified_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        
+        entry = cache.get(AGGREGATES_KEY)
+        if entry is None or entry['version'] != version:
+            # 版本号在查询前读取，查询期间发生的修改会在下次请求时重新统计
+            entry = {'version': version, 'data': self.get_aggregates()}
+            cache.set(AGGREGATES_KEY, entry, getattr(settings, 'POSTS_AGGREGATES_CACHE_TIMEOUT', 60 * 60))
+        response = Response(entry['data'])
+        set_validators(response, *validators)
+        return response
+    
+    def get_aggregates(self):
+        """三条GROUP BY查询分别统计分区、月份（按当前时区）和标签"""
+        published = Post.objects.filter(is_published=True).order_by()
+        labels = dict(Post.CATEGORY_CHOICES)
+        categories = published.values('category').annotate(count=Count('pk')).order_by('category')
+        tags = Tag.objects.filter(posts__is_published=True).values('name').annotate(count=Count('posts')).order_by('-count', 'name')
+        return {
+            'categories': [
+                {'category': row['category'], 'name': labels.get(row['category'], row['category']), 'count': row['count']}
+                for row in categories
+            ],
+            'months': [
+                {'month': f'{year:04d}-{month:02d}', 'count': count}
+                for year, month, count in self.get_month_counts(published)
+            ],
+            'tags': list(tags),
+        }
+    
+    def get_month_counts(self, published):
+        """按当前时区统计每月的帖子数，返回 [(年, 月, 数量)]，从新到旧
+        MySQL未加载时区表时CONVERT_TZ返回NULL，不能依赖数据库换算时区。固定偏移的时区（如Asia/Shanghai）
+        在数据库中平移后按UTC取年月；有夏令时的时区偏移随日期变化，改为逐行取出发布时间后在Python中分组
+        """
+        now = timezone.localtime()
+        offset = now.utcoffset()
+        if now.replace(month=1, day=1).utcoffset() != now.replace(month=7, day=1).utcoffset():
+            counts = Counter()
+            for created_at in published.values_list('created_at', flat=True).iterator(chunk_size=2000):
+                local = timezone.localtime(created_at)
+                counts[(local.year, local.month)] += 1
+            return sorted(((year, month, count) for (year, month), count in counts.items()), reverse=True)
+        local_created = ExpressionWrapper(F('created_at') + Value(offset), output_field=DateTimeField())
+        rows = published.annotate(
+            year=ExtractYear(local_created, tzinfo=dt_timezone.utc), month=ExtractMonth(local_created, tzinfo=dt_timezone.utc),
+        ).values_list('year', 'month').annotate(count=Count('pk')).order_by('-year', '-month')
+        return [(year, month, count) for year, month, count in rows if year and month]
+
@@ -8,9 +8,8 @@ from django.utils.safestring import mark_safe
 from django.urls import path
 from django.shortcuts import render
 from django.http import JsonResponse
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import timedelta
+from posts.models import Post
+from .analytics import GRANULARITY_CHOICES, VISIT_RANGE_CHOICES, cached_analytics, get_post_rankings, get_visit_counts
 from .models import CustomUser, VisitorRecord
 
 # 自定义widget，只支持文件上传
@@ -109,13 +108,13 @@ class CustomUserAdmin(UserAdmin):
 # 访客记录管理界面
 class VisitorRecordAdmin(admin.ModelAdmin):
     # 列表显示字段
-    list_display = ('get_user_display', 'ip_address', 'path', 'method', 'timestamp', 'is_authenticated_user_display')
-    list_filter = ('method', 'timestamp', 'user')
+    list_display = ('get_user_display', 'ip_address', 'path', 'method', 'status_code', 'latency_ms', 'timestamp', 'is_authenticated_user_display')
+    list_filter = ('method', 'status_code', 'timestamp', 'user')
     search_fields = ('ip_address', 'path', 'user_agent', 'user__username')
     ordering = ('-timestamp',)
     
     # 只读字段
-    readonly_fields = ('user', 'ip_address', 'user_agent', 'referer', 'path', 'method', 'timestamp', 'session_key', 'is_authenticated_user_display')
+    readonly_fields = ('user', 'ip_address', 'user_agent', 'referer', 'path', 'method', 'timestamp', 'session_key', 'status_code', 'latency_ms', 'route_name', 'post', 'is_authenticated_user_display')
     
     # 详情页字段分组
     fieldsets = (
@@ -123,7 +122,7 @@ class VisitorRecordAdmin(admin.ModelAdmin):
             'fields': ('user', 'is_authenticated_user_display')
         }),
         ('访问信息', {
-            'fields': ('ip_address', 'path', 'method', 'timestamp')
+            'fields': ('ip_address', 'path', 'route_name', 'post', 'method', 'status_code', 'latency_ms', 'timestamp')
         }),
         ('详细信息', {
             'fields': ('user_agent', 'referer', 'session_key')
@@ -157,152 +156,38 @@ class VisitorRecordAdmin(admin.ModelAdmin):
         context = dict(
             self.admin_site.each_context(request),
             title="数据分析",
+            range_choices=VISIT_RANGE_CHOICES,
+            category_choices=Post.CATEGORY_CHOICES,
         )
         return render(request, 'admin/analytics.html', context)
     
     def daily_visits_data(self, request):
-        """每日访问量数据API"""
-        from django.db.models import Count
-        from django.utils import timezone
-        from datetime import timedelta, datetime
-        
-        # 计算最近7天的日期
-        today = timezone.now().date()
-        dates = []
-        date_range = []
-        
-        for i in range(6, -1, -1):  # 从6天前到今天
-            date = today - timedelta(days=i)
-            dates.append(date.strftime('%m-%d'))
-            date_range.append(date)
-        
-        # 获取所有访客记录数量
-        total_records = VisitorRecord.objects.count()
-        
-        # 打印调试信息
-        print(f"总访客记录数: {total_records}")
-        print(f"查询日期范围: {date_range[0]} 到 {date_range[-1]}")
-        
-        # 如果没有记录，返回空数据
-        if total_records == 0:
-            return JsonResponse({
-                'dates': dates,
-                'counts': [0] * len(dates)
-            })
-        
-        # 查询每日访问量数据
-        # 使用更准确的日期范围查询
-        daily_visits = VisitorRecord.objects.extra(
-            select={'visit_date': 'DATE(timestamp)'}
-        ).values('visit_date').annotate(
-            count=Count('id')
-        ).order_by('visit_date')
-        
-        # 打印查询结果
-        print(f"查询结果: {list(daily_visits)}")
-        
-        # 构造图表数据
-        counts = []
-        visit_dict = {}
-        
-        # 将查询结果转换为字典，键为日期字符串
-        for visit in daily_visits:
-            if isinstance(visit['visit_date'], str):
-                date_key = visit['visit_date']
-            else:
-                date_key = visit['visit_date'].strftime('%Y-%m-%d')
-            visit_dict[date_key] = visit['count']
-        
-        # 为每个日期查找对应的访问量
-        for date in date_range:
-            date_key = date.strftime('%Y-%m-%d')
-            counts.append(visit_dict.get(date_key, 0))
-        
-        print(f"返回数据: dates={dates}, counts={counts}")
-        
-        return JsonResponse({
-            'dates': dates,
-            'counts': counts
-        })
+        """每日访问量数据API
+        参数 days 为 7/30/90（默认7），granularity 为 day/hour（默认day）；结果短暂缓存
+        """
+        days = self.get_choice_param(request, 'days', VISIT_RANGE_CHOICES, int)
+        granularity = self.get_choice_param(request, 'granularity', GRANULARITY_CHOICES)
+        data = cached_analytics('visits', (days, granularity), lambda: get_visit_counts(days, granularity))
+        return JsonResponse(data)
+    
+    def get_choice_param(self, request, name, choices, cast=str):
+        """读取查询参数，不在可选范围内时使用第一个选项"""
+        try:
+            value = cast(request.GET.get(name, choices[0]))
+        except (TypeError, ValueError):
+            return choices[0]
+        return value if value in choices else choices[0]
     
     def post_rankings_data(self, request):
-        """帖子访问排行数据API"""
-        from django.db.models import Count, Q
-        from posts.models import Post
-        
-        # 获取所有访客记录数量
-        total_records = VisitorRecord.objects.count()
-        
-        # 打印调试信息
-        print(f"总访客记录数: {total_records}")
-        
-        # 如果没有记录，返回空数据
-        if total_records == 0:
-            return JsonResponse({
-                'paths': [],
-                'counts': [],
-                'titles': []  # 添加标题字段
-            })
-        
-        # 先查看一些访客记录的路径格式，用于调试
-        sample_paths = VisitorRecord.objects.values('path').distinct()[:10]
-        print(f"示例路径: {[p['path'] for p in sample_paths]}")
-        
-        # 查找具体的帖子详情页访问记录
-        # 帖子详情页的URL模式是: /api/posts/{slug}/
-        post_detail_visits = VisitorRecord.objects.filter(
-            path__regex=r'^/api/posts/[^/]+/$'  # 匹配 /api/posts/slug/ 格式
-        ).values('path').annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        # 如果没有找到具体的帖子详情页访问记录，尝试其他模式
-        if not post_detail_visits:
-            post_detail_visits = VisitorRecord.objects.filter(
-                Q(path__startswith='/api/posts/') & 
-                ~Q(path='/api/posts/') &  # 排除列表页
-                ~Q(path__endswith='/update/') &  # 排除更新页
-                ~Q(path__endswith='/delete/') &  # 排除删除页
-                ~Q(path__endswith='/preview/')   # 排除预览页
-            ).values('path').annotate(
-                count=Count('id')
-            ).order_by('-count')[:10]
-        
-        # 打印查询结果
-        print(f"帖子详情页访问排行查询结果: {list(post_detail_visits)}")
-        
-        # 提取数据
-        paths = [visit['path'] for visit in post_detail_visits]
-        counts = [visit['count'] for visit in post_detail_visits]
-        
-        # 获取对应的帖子标题
-        titles = []
-        for path in paths:
-            # 从路径中提取slug: /api/posts/{slug}/ -> {slug}
-            parts = path.strip('/').split('/')
-            if len(parts) >= 3 and parts[0] == 'api' and parts[1] == 'posts':
-                slug = parts[2]
-                try:
-                    post = Post.objects.get(slug=slug)
-                    titles.append(post.title)
-                except Post.DoesNotExist:
-                    titles.append(f"未知帖子 ({slug})")
-            else:
-                titles.append("未知帖子")
-        
-        # 如果没有数据，返回空数组而不是None
-        if not paths and not counts:
-            paths = []
-            counts = []
-            titles = []
-        
-        print(f"返回数据: paths={paths}, counts={counts}, titles={titles}")
-        
-        return JsonResponse({
-            'paths': paths,
-            'counts': counts,
-            'titles': titles  # 返回帖子标题
-        })
+        """帖子访问排行数据API
+        参数 days 为 7/30/90（默认7），category 为分区（默认全部）；结果短暂缓存
+        """
+        days = self.get_choice_param(request, 'days', VISIT_RANGE_CHOICES, int)
+        category = request.GET.get('category') or None
+        if category not in dict(Post.CATEGORY_CHOICES):
+            category = None
+        data = cached_analytics('rankings', (days, category), lambda: get_post_rankings(days, category))
+        return JsonResponse(data)
     
     def get_user_display(self, obj):
         """显示用户信息"""
@@ -0,0 +1,134 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from .models import DailyVisitRollup, HourlyVisitRollup, VisitorRecord, VisitRollupState
+from .rollups import STATE_NAME, day_start, hour_start
+
+# 后台图表可选的统计范围（天）和粒度
+VISIT_RANGE_CHOICES = (7, 30, 90)
+GRANULARITY_CHOICES = ('day', 'hour')
+ANALYTICS_CACHE_KEY = 'users:analytics:{}'
+
+
+def get_analytics_cache_timeout():
+    """后台统计结果的缓存时间（秒）"""
+    return getattr(settings, 'VISITOR_ANALYTICS_CACHE_TIMEOUT', 60)
+
+
+def cached_analytics(name, params, compute):
+    """按名称和参数短暂缓存统计结果，多个管理员同时打开页面时只计算一次"""
+    key = ANALYTICS_CACHE_KEY.format(':'.join([name, *(str(value) for value in params)]))
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, get_analytics_cache_timeout())
+    return data
+
+
+def get_periods(days, granularity):
+    """最近days天（包含今天）按本地时区划分的时段开始时间，从早到晚"""
+    today = timezone.localdate()
+    if granularity == 'day':
+        return [
+            timezone.make_aware(datetime.combine(today - timedelta(days=offset), time.min))
+            for offset in range(days - 1, -1, -1)
+        ]
+    start = timezone.make_aware(datetime.combine(today - timedelta(days=days - 1), time.min))
+    hours = int((hour_start(timezone.now()) - start).total_seconds() // 3600) + 1
+    return [timezone.localtime(start + timedelta(hours=offset)) for offset in range(hours)]
+
+
+def get_visit_counts(days=7, granularity='day'):
+    """最近days天每天（或每小时）的访问量，返回 {'dates': [...], 'counts': [...]}
+    已汇总的部分读取汇总表，尚未汇总的新记录（主键大于汇总进度）按时间索引范围读取后补上，
+    时段按本地时区（Asia/Shanghai）划分
+    """
+    periods = get_periods(days, granularity)
+    start = periods[0]
+    rollup_model, truncate = (DailyVisitRollup, day_start) if granularity == 'day' else (HourlyVisitRollup, hour_start)
+
+    counts = Counter()
+    # 在同一个事务中读取进度和汇总表，避免汇总任务恰好在两次查询之间提交
+    with transaction.atomic():
+        state = VisitRollupState.objects.filter(name=STATE_NAME).first()
+        last_record_id = state.last_record_id if state else 0
+        rows = rollup_model.objects.filter(period_start__gte=start).values('period_start').annotate(
+            count=Sum('visit_count')
+        ).order_by()
+        for row in rows:
+            counts[row['period_start']] += row['count']
+        pending = VisitorRecord.objects.filter(timestamp__gte=start, pk__gt=last_record_id).values_list(
+            'timestamp', flat=True
+        )
+        for timestamp in pending.iterator(chunk_size=2000):
+            counts[truncate(timestamp)] += 1
+
+    label_format = '%m-%d' if granularity == 'day' else '%m-%d %H:00'
+    return {
+        'dates': [period.strftime(label_format) for period in periods],
+        'counts': [counts.get(period, 0) for period in periods],
+    }
+
+
+def _rank_rows(queryset, count_expression):
+    """按帖子分组统计访问量，同时取出标题和slug（没有slug的帖子无法链接到详情页，不参与排行）"""
+    queryset = queryset.exclude(post__slug__isnull=True).exclude(post__slug='')
+    return queryset.values('post_id', 'post__title', 'post__slug').annotate(count=count_expression).order_by()
+
+
+def _post_path(slug):
+    """帖子详情页的路径，slug不符合路由格式时返回None"""
+    try:
+        return reverse('posts:post-detail', kwargs={'slug': slug})
+    except NoReverseMatch:
+        return None
+
+
+def get_post_rankings(days=7, category=None, limit=10):
+    """最近days天访问量最高的帖子，可按分区过滤，返回 {'paths': [...], 'counts': [...], 'titles': [...]}
+    已汇总的部分在每日汇总表上按帖子分组（时间范围走索引，并关联帖子取标题），
+    尚未汇总的新记录按帖子ID单独分组后合并
+    """
+    start = get_periods(days, 'day')[0]
+    post_filter = {'post__isnull': False}
+    if category:
+        post_filter['post__category'] = category
+
+    totals, info = Counter(), {}
+
+    def collect(rows):
+        for row in rows:
+            totals[row['post_id']] += row['count']
+            info[row['post_id']] = (row['post__title'], row['post__slug'])
+
+    with transaction.atomic():
+        state = VisitRollupState.objects.filter(name=STATE_NAME).first()
+        last_record_id = state.last_record_id if state else 0
+        rollups = DailyVisitRollup.objects.filter(period_start__gte=start, **post_filter)
+        collect(_rank_rows(rollups, Sum('visit_count')).order_by('-count')[:limit])
+        ranked_ids = set(totals)
+        pending = VisitorRecord.objects.filter(timestamp__gte=start, pk__gt=last_record_id, **post_filter)
+        collect(_rank_rows(pending, Count('id')))
+        # 只有未汇总记录中出现、不在前几名里的帖子，补上它们已汇总的访问量后再排序
+        extra_ids = set(totals) - ranked_ids
+        if extra_ids:
+            for row in _rank_rows(rollups.filter(post_id__in=extra_ids), Sum('visit_count')):
+                totals[row['post_id']] += row['count']
+
+    paths = {post_id: _post_path(info[post_id][1]) for post_id in totals}
+    ranked = sorted(
+        ((post_id, count) for post_id, count in totals.items() if paths[post_id]),
+        key=lambda item: (-item[1], item[0]),
+    )[:limit]
+    return {
+        'paths': [paths[post_id] for post_id, _ in ranked],
+        'counts': [count for _, count in ranked],
+        'titles': [info[post_id][0] for post_id, _ in ranked],
+    }
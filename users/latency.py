@@ -0,0 +1,160 @@
+import bisect
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils import timezone
+
+from posts.utils import get_redis
+
+# 延迟直方图的桶上限（毫秒），最后一个桶收集超过 5 秒的请求
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# 没有匹配到URL路由的请求（如404）
+UNRESOLVED_ROUTE = '<unresolved>'
+
+
+def get_retention_days():
+    """延迟直方图按天保存的天数"""
+    return getattr(settings, 'VISITOR_LATENCY_RETENTION_DAYS', 7)
+
+
+def get_bucket(latency_ms):
+    """延迟所在桶的序号，超过最后一个上限时为 len(LATENCY_BUCKETS)"""
+    return bisect.bisect_left(LATENCY_BUCKETS, latency_ms)
+
+
+def _day(days_ago=0):
+    return (timezone.localdate() - timedelta(days=days_ago)).strftime('%Y%m%d')
+
+
+class RedisLatencyHistogram:
+    """基于Redis哈希的延迟直方图，每天一个哈希，字段为 路由|桶序号 和 路由|sum"""
+    KEY = 'users:latency:{}'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def observe(self, route, latency_ms):
+        key = self.KEY.format(_day())
+        pipe = self.connection.pipeline(transaction=False)
+        pipe.hincrby(key, f'{route}|{get_bucket(latency_ms)}', 1)
+        pipe.hincrbyfloat(key, f'{route}|sum', latency_ms)
+        pipe.expire(key, 60 * 60 * 24 * (get_retention_days() + 1))
+        pipe.execute()
+
+    def get_raw(self, days):
+        pipe = self.connection.pipeline(transaction=False)
+        for days_ago in range(days):
+            pipe.hgetall(self.KEY.format(_day(days_ago)))
+        merged = Counter()
+        for data in pipe.execute():
+            for field, value in data.items():
+                field = field.decode('utf-8') if isinstance(field, bytes) else field
+                merged[field] += float(value)
+        return merged
+
+
+class LocalLatencyHistogram:
+    """进程内的延迟直方图，未配置Redis时使用，只包含当前进程处理的请求"""
+
+    def __init__(self):
+        self._days = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def observe(self, route, latency_ms):
+        day = _day()
+        with self._lock:
+            data = self._days[day]
+            data[f'{route}|{get_bucket(latency_ms)}'] += 1
+            data[f'{route}|sum'] += latency_ms
+            # 只保留最近几天的数据
+            for old_day in sorted(self._days)[:-(get_retention_days() + 1)]:
+                del self._days[old_day]
+
+    def get_raw(self, days):
+        wanted = {_day(days_ago) for days_ago in range(days)}
+        merged = Counter()
+        with self._lock:
+            for day, data in self._days.items():
+                if day in wanted:
+                    merged.update(data)
+        return merged
+
+
+def _percentile(buckets, count, fraction):
+    """按桶估算分位数，返回所在桶的上限（最后一个桶返回None）"""
+    threshold = count * fraction
+    seen = 0
+    for index, bucket_count in enumerate(buckets):
+        seen += bucket_count
+        if seen >= threshold:
+            return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else None
+    return None
+
+
+def summarize(raw):
+    """把原始计数整理为每个路由的统计：请求数、平均延迟、各桶计数和分位数估计"""
+    routes = {}
+    for field, value in raw.items():
+        route, _, suffix = field.rpartition('|')
+        entry = routes.setdefault(route, {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum_ms': 0.0})
+        if suffix == 'sum':
+            entry['sum_ms'] = value
+        else:
+            entry['buckets'][int(suffix)] = int(value)
+    result = []
+    for route, entry in routes.items():
+        count = sum(entry['buckets'])
+        if not count:
+            continue
+        result.append({
+            'route': route,
+            'count': count,
+            'avg_ms': round(entry['sum_ms'] / count, 1),
+            'p50_ms': _percentile(entry['buckets'], count, 0.5),
+            'p95_ms': _percentile(entry['buckets'], count, 0.95),
+            'p99_ms': _percentile(entry['buckets'], count, 0.99),
+            'buckets': entry['buckets'],
+        })
+    return result
+
+
+_latency_histogram = None
+_latency_histogram_lock = threading.Lock()
+
+
+def get_latency_histogram():
+    """返回当前进程使用的延迟直方图"""
+    global _latency_histogram
+    if _latency_histogram is None:
+        with _latency_histogram_lock:
+            if _latency_histogram is None:
+                redis_connection = get_redis()
+                if redis_connection is not None:
+                    _latency_histogram = RedisLatencyHistogram(redis_connection)
+                else:
+                    _latency_histogram = LocalLatencyHistogram()
+    return _latency_histogram
+
+
+def reset_latency_histogram(*, setting, **kwargs):
+    """缓存配置变化时（如测试中override_settings）重新选择直方图"""
+    global _latency_histogram
+    if setting == 'CACHES':
+        _latency_histogram = None
+
+
+setting_changed.connect(reset_latency_histogram)
+
+
+def record_latency(route, latency_ms):
+    """记录一次请求的处理时间"""
+    get_latency_histogram().observe(route or UNRESOLVED_ROUTE, latency_ms)
+
+
+def get_latency_stats(days=1):
+    """最近几天每个路由的延迟统计，按p95和平均延迟从慢到快排序"""
+    stats = summarize(get_latency_histogram().get_raw(days))
+    return sorted(stats, key=lambda item: (item['p95_ms'] is None, item['p95_ms'] or 0, item['avg_ms']), reverse=True)
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.tracking import get_visit_buffer
+
+
+class Command(BaseCommand):
+    help = '立即把缓冲区中的访客记录批量写入数据库（Web进程会在后台定期写入，通常无需单独运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续运行，每隔 --interval 秒写入一次')
+        parser.add_argument('--interval', type=float, default=5, help='持续运行时的写入间隔（秒）')
+
+    def handle(self, *args, **options):
+        buffer = get_visit_buffer()
+        while True:
+            written = buffer.flush()
+            dropped = buffer.pop_dropped()
+            if written or dropped or not options['loop']:
+                message = f'已写入 {written} 条访客记录'
+                if dropped:
+                    message += f'，缓冲区已满丢弃 {dropped} 条'
+                self.stdout.write(self.style.SUCCESS(message))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from users.latency import get_latency_stats, get_retention_days
+
+
+class Command(BaseCommand):
+    help = '按接口输出最近几天的请求延迟统计，从慢到快排序'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='统计最近几天（包含今天）')
+        parser.add_argument('--limit', type=int, default=20, help='最多输出的接口数')
+        parser.add_argument('--min-count', type=int, default=1, help='忽略请求数少于该值的接口')
+
+    def handle(self, *args, **options):
+        days = max(1, min(options['days'], get_retention_days()))
+        stats = [item for item in get_latency_stats(days) if item['count'] >= options['min_count']]
+        if not stats:
+            self.stdout.write('暂无延迟数据')
+            return
+
+        def fmt(value):
+            return f'{value}' if value is not None else '>5000'
+
+        self.stdout.write(f'{"接口":<40} {"请求数":>8} {"平均":>8} {"p50":>6} {"p95":>6} {"p99":>6}  (毫秒)')
+        for item in stats[:options['limit']]:
+            self.stdout.write(
+                f'{item["route"]:<40} {item["count"]:>8} {item["avg_ms"]:>8} '
+                f'{fmt(item["p50_ms"]):>6} {fmt(item["p95_ms"]):>6} {fmt(item["p99_ms"]):>6}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'共 {len(stats)} 个接口，统计最近 {days} 天'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from users.rollups import get_hourly_retention_days, get_raw_retention_days, prune_visits, rollup_visits
+
+
+class Command(BaseCommand):
+    help = '把新增的访客记录累加到每小时/每日汇总表，并清理过期的原始记录（建议通过cron每隔几分钟执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='每个事务汇总的记录数')
+        parser.add_argument('--no-prune', action='store_true', help='只汇总，不清理过期数据')
+        parser.add_argument('--raw-days', type=int, default=None,
+                            help=f'原始访客记录保留天数（默认 {get_raw_retention_days()}）')
+        parser.add_argument('--hourly-days', type=int, default=None,
+                            help=f'每小时汇总保留天数（默认 {get_hourly_retention_days()}）')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每次删除的行数')
+        parser.add_argument('--sleep', type=float, default=0, help='两次删除之间的间隔（秒），降低对线上数据库的影响')
+        parser.add_argument('--archive-dir', default=None, help='删除前把原始记录归档到该目录（gzip压缩的NDJSON）')
+
+    def handle(self, *args, **options):
+        processed = rollup_visits(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'已汇总 {processed} 条访客记录'))
+        if options['no_prune']:
+            return
+        raw_deleted, hourly_deleted = prune_visits(
+            raw_days=options['raw_days'],
+            hourly_days=options['hourly_days'],
+            chunk_size=options['chunk_size'],
+            sleep=options['sleep'],
+            archive_dir=options['archive_dir'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'已删除 {raw_deleted} 条过期访客记录、{hourly_deleted} 条过期的每小时汇总'
+        ))
@@ -1,12 +1,21 @@
-import datetime
-import re  # 添加缺失的re模块导入
+import logging
+import re
+import time
+
 from django.utils.deprecation import MiddlewareMixin
 from django.utils import timezone
-from .models import VisitorRecord, CustomUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .latency import record_latency
+from .tracking import record_visit
+
+logger = logging.getLogger(__name__)
+
 
 class VisitorTrackingMiddleware(MiddlewareMixin):
     """
     记录访客信息的中间件
+    在响应返回时记录，此时DRF已完成JWT认证，可以拿到状态码、处理耗时和匹配到的路由
     """
     
     # 排除不需要记录的路径模式
@@ -26,38 +35,77 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
         return False
     
     def process_request(self, request):
-        """在处理请求前记录访客信息"""
-        # 检查是否应该排除该路径
-        if self.should_exclude(request.path):
-            return None
-            
+        """记录请求开始的时间"""
+        request._visit_started_at = timezone.now()
+        request._visit_started = time.perf_counter()
+        return None
+    
+    def process_response(self, request, response):
+        """在响应返回时记录访客信息和处理耗时"""
+        started = getattr(request, '_visit_started', None)
+        # 检查是否应该排除该路径（或请求在本中间件之前就已返回）
+        if started is None or self.should_exclude(request.path):
+            return response
+        latency_ms = round((time.perf_counter() - started) * 1000)
+        
         # 获取访客信息
         ip_address = self.get_client_ip(request)
         user_agent = request.META.get('HTTP_USER_AGENT', '')
         referer = request.META.get('HTTP_REFERER', '')
-        session_key = request.session.session_key
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        route_name = self.get_route_name(request)
         
-        # 获取用户信息（如果已登录）
-        user = None
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            user = request.user
-            
-        # 使用Django的timezone.now()获取当前时间，确保有时区信息
-        current_time = timezone.now()
+        # 放入缓冲区，由后台批量写入数据库，不阻塞请求；记录失败（如Redis不可用）不影响响应
+        try:
+            record_visit(
+                user_id=self.get_user_id(request),
+                ip_address=ip_address,
+                user_agent=user_agent,
+                referer=referer,
+                path=request.path,
+                method=request.method,
+                session_key=session_key,
+                status_code=response.status_code,
+                latency_ms=latency_ms,
+                route_name=route_name,
+                # 帖子详情视图在请求上标记了浏览的帖子
+                post_id=getattr(request, 'visited_post_id', None),
+                timestamp=request._visit_started_at.isoformat(),
+            )
+        except Exception:
+            logger.exception('访客记录失败')
+        try:
+            record_latency(route_name, latency_ms)
+        except Exception:
+            logger.exception('响应耗时记录失败')
         
-        # 创建访客记录
-        VisitorRecord.objects.create(
-            user=user,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            referer=referer,
-            path=request.path,
-            method=request.method,
-            session_key=session_key,
-            timestamp=current_time  # 使用正确的当前时间
-        )
-        
-        return None
+        return response
+    
+    def get_user_id(self, request):
+        """获取登录用户的ID
+        DRF视图认证后会把JWT用户写回 request.user；非DRF视图或认证前就返回的请求，再单独解析一次JWT
+        """
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+        if not request.META.get('HTTP_AUTHORIZATION'):
+            return None
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except Exception:
+            # 令牌无效或已过期，按未登录记录
+            return None
+        return result[0].pk if result else None
+    
+    def get_route_name(self, request):
+        """匹配到的URL路由名称（如 posts:post-detail），没有名称时使用路由模式"""
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        if match.url_name:
+            return match.view_name
+        return match.route or None
     
     def get_client_ip(self, request):
         """获取客户端真实IP地址"""
@@ -66,4 +114,4 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
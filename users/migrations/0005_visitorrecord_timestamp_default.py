@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_visitorrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visitorrecord',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='访问时间'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_visitorrecord_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorrecord',
+            name='latency_ms',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='处理耗时(毫秒)'),
+        ),
+        migrations.AddField(
+            model_name='visitorrecord',
+            name='route_name',
+            field=models.CharField(blank=True, max_length=200, null=True, verbose_name='路由名称'),
+        ),
+        migrations.AddField(
+            model_name='visitorrecord',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='响应状态码'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_related_posts'),
+        ('users', '0006_visitorrecord_response_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVisitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(verbose_name='时段开始时间')),
+                ('route_name', models.CharField(blank=True, default='', max_length=200, verbose_name='路由名称')),
+                ('is_authenticated', models.BooleanField(default=False, verbose_name='是否登录')),
+                ('visit_count', models.PositiveIntegerField(default=0, verbose_name='访问次数')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='错误响应次数')),
+                ('latency_ms_total', models.PositiveBigIntegerField(default=0, verbose_name='总处理耗时(毫秒)')),
+            ],
+            options={
+                'verbose_name': '每日访问汇总',
+                'verbose_name_plural': '每日访问汇总',
+                'ordering': ['-period_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyVisitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(verbose_name='时段开始时间')),
+                ('route_name', models.CharField(blank=True, default='', max_length=200, verbose_name='路由名称')),
+                ('is_authenticated', models.BooleanField(default=False, verbose_name='是否登录')),
+                ('visit_count', models.PositiveIntegerField(default=0, verbose_name='访问次数')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='错误响应次数')),
+                ('latency_ms_total', models.PositiveBigIntegerField(default=0, verbose_name='总处理耗时(毫秒)')),
+            ],
+            options={
+                'verbose_name': '每小时访问汇总',
+                'verbose_name_plural': '每小时访问汇总',
+                'ordering': ['-period_start'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitRollupState',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_record_id', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': '访问汇总进度',
+                'verbose_name_plural': '访问汇总进度',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='visitorrecord',
+            index=models.Index(fields=['timestamp'], name='visitor_timestamp_idx'),
+        ),
+        migrations.AddField(
+            model_name='hourlyvisitrollup',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post', verbose_name='帖子'),
+        ),
+        migrations.AddField(
+            model_name='dailyvisitrollup',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post', verbose_name='帖子'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyvisitrollup',
+            constraint=models.UniqueConstraint(fields=('period_start', 'route_name', 'post', 'is_authenticated'), name='hourly_visit_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyvisitrollup',
+            constraint=models.UniqueConstraint(fields=('period_start', 'route_name', 'post', 'is_authenticated'), name='daily_visit_rollup_unique'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_related_posts'),
+        ('users', '0007_visit_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorrecord',
+            name='post',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.post', verbose_name='浏览的帖子'),
+        ),
+    ]
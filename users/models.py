@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import Count
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 # Create your models here.
 
@@ -23,13 +25,26 @@ class CustomUser(AbstractUser):
     
     def get_tag_count(self):
         """获取用户使用的不同标签数量"""
-        # 获取用户所有文章的标签
-        user_posts = self.posts.all()
-        all_tags = []
-        for post in user_posts:
-            all_tags.extend(post.get_tags())
-        # 返回不重复标签的数量
-        return len(set(all_tags))
+        # 通过标签关联表统计，不加载文章内容
+        return self.posts.filter(tag_set__isnull=False).values('tag_set').distinct().count()
+
+    @classmethod
+    def get_author_stats(cls, user_ids):
+        """批量获取多个用户的文章数量和标签数量，查询次数与用户数量无关
+        返回 {用户ID: {'post_count': ..., 'tag_count': ...}}
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+        # 一次GROUP BY同时统计文章数和不重复的标签数
+        rows = cls.objects.filter(pk__in=user_ids).annotate(
+            post_count=Count('posts', distinct=True),
+            tag_count=Count('posts__tag_set', distinct=True),
+        ).values_list('pk', 'post_count', 'tag_count')
+        return {
+            user_id: {'post_count': post_count, 'tag_count': tag_count}
+            for user_id, post_count, tag_count in rows
+        }
 
 class VisitorRecord(models.Model):
     """访客记录模型"""
@@ -46,13 +61,28 @@ class VisitorRecord(models.Model):
     referer = models.URLField(verbose_name="来源页面", blank=True, null=True)
     path = models.CharField(max_length=500, verbose_name="访问路径")
     method = models.CharField(max_length=10, verbose_name="请求方法")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="访问时间")
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="访问时间")
     session_key = models.CharField(max_length=40, verbose_name="会话ID", blank=True, null=True)
+    status_code = models.PositiveSmallIntegerField(verbose_name="响应状态码", blank=True, null=True)
+    latency_ms = models.PositiveIntegerField(verbose_name="处理耗时(毫秒)", blank=True, null=True)
+    route_name = models.CharField(max_length=200, verbose_name="路由名称", blank=True, null=True)  # 如 posts:post-detail
+    post = models.ForeignKey(
+        'posts.Post',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="浏览的帖子",
+    )  # 由帖子详情视图标记，其他请求为空
     
     class Meta:
         verbose_name = "访客记录"
         verbose_name_plural = "访客记录"
         ordering = ['-timestamp']
+        indexes = [
+            # 按时间范围统计和清理过期记录
+            models.Index(fields=['timestamp'], name='visitor_timestamp_idx'),
+        ]
         
     def __str__(self):
         if self.user:
@@ -62,4 +92,69 @@ class VisitorRecord(models.Model):
     @property
     def is_authenticated_user(self):
         """判断是否为已登录用户"""
-        return self.user is not None
\ No newline at end of file
+        return self.user is not None
+
+
+class VisitRollup(models.Model):
+    """访问量汇总的公共字段，由 rollup_visits 命令根据访客记录增量累加"""
+    period_start = models.DateTimeField(verbose_name="时段开始时间")  # 按本地时区（Asia/Shanghai）取整点或零点
+    route_name = models.CharField(max_length=200, blank=True, default='', verbose_name="路由名称")  # 未匹配路由时为空
+    post = models.ForeignKey(
+        'posts.Post',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="帖子",
+    )  # 帖子详情页的访问才有
+    is_authenticated = models.BooleanField(default=False, verbose_name="是否登录")
+    visit_count = models.PositiveIntegerField(default=0, verbose_name="访问次数")
+    error_count = models.PositiveIntegerField(default=0, verbose_name="错误响应次数")  # 状态码 >= 400
+    latency_ms_total = models.PositiveBigIntegerField(default=0, verbose_name="总处理耗时(毫秒)")
+
+    class Meta:
+        abstract = True
+        ordering = ['-period_start']
+
+    def __str__(self):
+        return f"{self.period_start} {self.route_name or '-'} ({self.visit_count})"
+
+
+class HourlyVisitRollup(VisitRollup):
+    """每小时访问量汇总"""
+
+    class Meta(VisitRollup.Meta):
+        verbose_name = "每小时访问汇总"
+        verbose_name_plural = "每小时访问汇总"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period_start', 'route_name', 'post', 'is_authenticated'], name='hourly_visit_rollup_unique'
+            ),
+        ]
+
+
+class DailyVisitRollup(VisitRollup):
+    """每日访问量汇总"""
+
+    class Meta(VisitRollup.Meta):
+        verbose_name = "每日访问汇总"
+        verbose_name_plural = "每日访问汇总"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period_start', 'route_name', 'post', 'is_authenticated'], name='daily_visit_rollup_unique'
+            ),
+        ]
+
+
+class VisitRollupState(models.Model):
+    """汇总进度：已经累加到汇总表的最大访客记录ID"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_record_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "访问汇总进度"
+        verbose_name_plural = "访问汇总进度"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_record_id}"
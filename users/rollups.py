@@ -0,0 +1,191 @@
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from posts.models import Post
+
+from .models import DailyVisitRollup, HourlyVisitRollup, VisitorRecord, VisitRollupState
+
+STATE_NAME = 'visits'
+# 帖子详情页的路由，汇总时按帖子拆分
+POST_DETAIL_ROUTE = 'posts:post-detail'
+ROLLUP_FIELDS = ('visit_count', 'error_count', 'latency_ms_total')
+# 每条UPDATE语句更新的汇总行数
+UPDATE_CHUNK_SIZE = 500
+
+
+def get_rollup_batch_size():
+    """每个事务汇总的访客记录数"""
+    return getattr(settings, 'VISITOR_ROLLUP_BATCH_SIZE', 5000)
+
+
+def get_raw_retention_days():
+    """原始访客记录保留的天数"""
+    return getattr(settings, 'VISITOR_RAW_RETENTION_DAYS', 90)
+
+
+def get_hourly_retention_days():
+    """每小时汇总保留的天数，每日汇总永久保留"""
+    return getattr(settings, 'VISITOR_HOURLY_ROLLUP_RETENTION_DAYS', 180)
+
+
+def hour_start(value):
+    """所在小时在本地时区的开始时间"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(value):
+    """所在日期在本地时区的零点"""
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _resolve_post_ids(rows):
+    """没有记录帖子ID的早期详情页访问，从路径中取出slug，一次查询换成帖子ID"""
+    slugs = {}
+    for row in rows:
+        if row['post_id'] is None and row['route_name'] == POST_DETAIL_ROUTE and row['path'] not in slugs:
+            try:
+                slugs[row['path']] = resolve(row['path']).kwargs.get('slug')
+            except Resolver404:
+                slugs[row['path']] = None
+    ids = dict(Post.objects.filter(slug__in={slug for slug in slugs.values() if slug}).values_list('slug', 'pk'))
+    return {path: ids.get(slug) for path, slug in slugs.items()}
+
+
+def aggregate_records(rows):
+    """把一批访客记录累加为 {(模型, 时段, 路由, 帖子ID, 是否登录): {计数字段: 增量}}"""
+    post_ids = _resolve_post_ids(rows)
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+    for row in rows:
+        post_id = row['post_id'] or post_ids.get(row['path'])
+        dimensions = (row['route_name'] or '', post_id, row['user_id'] is not None)
+        for model, period_start in ((HourlyVisitRollup, hour_start(row['timestamp'])),
+                                    (DailyVisitRollup, day_start(row['timestamp']))):
+            entry = totals[(model, period_start) + dimensions]
+            entry['visit_count'] += 1
+            entry['error_count'] += int((row['status_code'] or 0) >= 400)
+            entry['latency_ms_total'] += row['latency_ms'] or 0
+    return totals
+
+
+def _apply_totals(totals):
+    """把增量累加到汇总表：已有的行用F()表达式更新，新的行批量插入"""
+    by_model = defaultdict(dict)
+    for (model, *key), deltas in totals.items():
+        by_model[model][tuple(key)] = deltas
+    for model, entries in by_model.items():
+        periods = {key[0] for key in entries}
+        existing = {
+            (row.period_start, row.route_name, row.post_id, row.is_authenticated): row.pk
+            for row in model.objects.filter(period_start__in=periods).only(
+                'pk', 'period_start', 'route_name', 'post_id', 'is_authenticated'
+            )
+        }
+        new_rows, updates = [], {}
+        for key, deltas in entries.items():
+            pk = existing.get(key)
+            if pk is None:
+                period_start, route_name, post_id, is_authenticated = key
+                new_rows.append(model(period_start=period_start, route_name=route_name, post_id=post_id,
+                                      is_authenticated=is_authenticated, **deltas))
+            else:
+                updates[pk] = deltas
+        pks = list(updates)
+        for start in range(0, len(pks), UPDATE_CHUNK_SIZE):
+            chunk = pks[start:start + UPDATE_CHUNK_SIZE]
+            # 一条UPDATE语句同时更新多行：field = field + CASE id WHEN ... END
+            model.objects.filter(pk__in=chunk).update(**{
+                field: F(field) + Case(
+                    *[When(pk=pk, then=Value(updates[pk][field])) for pk in chunk],
+                    default=Value(0),
+                    output_field=PositiveBigIntegerField(),
+                )
+                for field in ROLLUP_FIELDS
+            })
+        model.objects.bulk_create(new_rows)
+
+
+def rollup_visits(batch_size=None, max_batches=None):
+    """把上次汇总之后新增的访客记录累加到每小时和每日汇总表，返回处理的记录数
+    按主键而不是时间推进进度：缓冲区延迟写入的旧记录也会累加到对应时段。
+    每批在一个事务中更新汇总表和进度，中途失败不会重复累加；同一时间只有一个进程在汇总。
+    """
+    batch_size = batch_size or get_rollup_batch_size()
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            VisitRollupState.objects.get_or_create(name=STATE_NAME)
+            state = VisitRollupState.objects.select_for_update().get(name=STATE_NAME)
+            rows = list(
+                VisitorRecord.objects.filter(pk__gt=state.last_record_id).order_by('pk').values(
+                    'pk', 'timestamp', 'path', 'route_name', 'user_id', 'post_id', 'status_code', 'latency_ms'
+                )[:batch_size]
+            )
+            if not rows:
+                break
+            _apply_totals(aggregate_records(rows))
+            state.last_record_id = rows[-1]['pk']
+            state.save(update_fields=['last_record_id', 'updated_at'])
+        processed += len(rows)
+        batches += 1
+    return processed
+
+
+def _archive_rows(archive_dir, rows):
+    """把即将删除的记录追加到按日期命名的gzip压缩NDJSON文件"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, 'visitor-records-{}.ndjson.gz'.format(timezone.localdate().isoformat()))
+    with gzip.open(path, 'at', encoding='utf-8') as archive_file:
+        for row in rows:
+            archive_file.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+
+
+def _delete_in_chunks(queryset, chunk_size, sleep, before_delete=None):
+    """按主键分批删除，每批一个短事务，避免长时间持有大量行锁"""
+    deleted = 0
+    while True:
+        if before_delete is None:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        else:
+            rows = list(queryset.order_by('pk').values()[:chunk_size])
+            pks = [row['id'] for row in rows]
+            if rows:
+                before_delete(rows)
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+        if len(pks) < chunk_size:
+            return deleted
+        if sleep:
+            time.sleep(sleep)
+
+
+def prune_visits(raw_days=None, hourly_days=None, chunk_size=1000, sleep=0, archive_dir=None):
+    """删除过期的原始访客记录（只删除已经汇总过的）和每小时汇总，返回 (原始记录数, 每小时汇总数)
+    指定archive_dir时，原始记录删除前先归档为gzip压缩的NDJSON文件
+    """
+    now = timezone.now()
+    raw_days = get_raw_retention_days() if raw_days is None else raw_days
+    hourly_days = get_hourly_retention_days() if hourly_days is None else hourly_days
+    state = VisitRollupState.objects.filter(name=STATE_NAME).first()
+    last_record_id = state.last_record_id if state else 0
+
+    archive = (lambda rows: _archive_rows(archive_dir, rows)) if archive_dir else None
+    raw_deleted = _delete_in_chunks(
+        VisitorRecord.objects.filter(timestamp__lt=now - timedelta(days=raw_days), pk__lte=last_record_id),
+        chunk_size, sleep, archive,
+    )
+    hourly_deleted = _delete_in_chunks(
+        HourlyVisitRollup.objects.filter(period_start__lt=now - timedelta(days=hourly_days)), chunk_size, sleep,
+    )
+    return raw_deleted, hourly_deleted
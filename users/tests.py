@@ -1,3 +1,322 @@
-from django.test import TestCase
+import gzip
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from posts.models import Post
+from . import tracking
+from .models import CustomUser, DailyVisitRollup, HourlyVisitRollup, VisitorRecord, VisitRollupState
+from .analytics import get_post_rankings, get_visit_counts
+from .middleware import VisitorTrackingMiddleware
+from .rollups import STATE_NAME, prune_visits, rollup_visits
+from .tracking import BackgroundFlushMixin, LocalVisitBuffer, RedisVisitBuffer
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+def make_visit(**fields):
+    visit = {
+        'ip_address': '127.0.0.1',
+        'path': '/api/posts/',
+        'method': 'GET',
+        'status_code': 200,
+        'latency_ms': 5,
+        'timestamp': '2024-01-01T10:00:00+08:00',
+    }
+    visit.update(fields)
+    return visit
+
+
+class VisitBufferTests(TestCase):
+    """访客记录缓冲区批量写入"""
+
+    def setUp(self):
+        # 测试中直接调用flush，不启动后台写入线程
+        patcher = mock.patch.object(BackgroundFlushMixin, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_buffer_flush_writes_records(self):
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        for index in range(3):
+            self.assertTrue(buffer.push(make_visit(path=f'/api/posts/{index}/')))
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(VisitorRecord.objects.count(), 3)
+        self.assertEqual(buffer.flush(), 0)
+
+    @override_settings(VISITOR_BUFFER_MAX_SIZE=2)
+    def test_local_buffer_drops_when_full(self):
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        results = [buffer.push(make_visit()) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(buffer.pop_dropped(), 1)
+        self.assertEqual(buffer.pop_dropped(), 0)
+
+    def test_overlong_fields_are_truncated(self):
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        buffer.push(make_visit(referer='https://example.com/' + 'a' * 300))
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(len(VisitorRecord.objects.get().referer), 200)
+
+    def test_bad_row_does_not_block_batch(self):
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        buffer.push(make_visit(path='/ok/1/'))
+        buffer.push(make_visit(path='/bad/', ip_address=None))
+        buffer.push(make_visit(path='/ok/2/'))
+        with self.assertLogs('users.tracking', 'ERROR'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(sorted(VisitorRecord.objects.values_list('path', flat=True)), ['/ok/1/', '/ok/2/'])
+        self.assertEqual(buffer.pop_dropped(), 1)
+
+    @override_settings(VISITOR_BUFFER_MAX_SIZE=2)
+    def test_database_failure_requeues_batch(self):
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        buffer.push(make_visit())
+        buffer.push(make_visit())
+        with mock.patch.object(tracking, 'write_records', side_effect=Exception('database down')), \
+                self.assertLogs('users.tracking', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pop_dropped(), 0)
+        self.assertEqual(buffer.flush(), 2)
+
+    def test_deleted_references_are_cleared(self):
+        user = CustomUser.objects.create_user(username='visitor', email='visitor@example.com', password='pass')
+        buffer = LocalVisitBuffer(flush_interval=3600)
+        buffer.push(make_visit(user_id=user.pk, post_id=12345))
+        user_id = user.pk
+        user.delete()
+        buffer.push(make_visit(user_id=user_id))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertFalse(VisitorRecord.objects.exclude(user=None).exists())
+        self.assertFalse(VisitorRecord.objects.exclude(post=None).exists())
+
+    def test_record_visit_uses_local_buffer_without_redis(self):
+        tracking._visit_buffer = None
+        with mock.patch.object(tracking, 'get_redis', return_value=None), \
+                mock.patch.object(tracking.atexit, 'register'):
+            self.assertTrue(tracking.record_visit(**make_visit()))
+            self.assertIsInstance(tracking.get_visit_buffer(), LocalVisitBuffer)
+            self.assertEqual(tracking.get_visit_buffer().flush(), 1)
+        tracking._visit_buffer = None
+
+
+@skipUnless(fakeredis, '需要安装fakeredis')
+class RedisVisitBufferTests(TestCase):
+    """多个进程共享的Redis访客记录缓冲区"""
+
+    def setUp(self):
+        patcher = mock.patch.object(BackgroundFlushMixin, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = RedisVisitBuffer(fakeredis.FakeStrictRedis(), flush_interval=3600)
+
+    @override_settings(VISITOR_FLUSH_BATCH_SIZE=2)
+    def test_flush_writes_all_batches(self):
+        for index in range(5):
+            self.assertTrue(self.buffer.push(make_visit(path=f'/api/posts/{index}/')))
+        self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(VisitorRecord.objects.count(), 5)
+        self.assertEqual(self.buffer.connection.llen(RedisVisitBuffer.PENDING_KEY), 0)
+
+    @override_settings(VISITOR_BUFFER_MAX_SIZE=2)
+    def test_drops_when_full(self):
+        results = [self.buffer.push(make_visit()) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(self.buffer.pop_dropped(), 1)
+        self.assertEqual(self.buffer.flush(), 2)
+
+    def test_bad_row_is_dropped_and_counted(self):
+        self.buffer.push(make_visit(ip_address=None))
+        self.buffer.push(make_visit())
+        with self.assertLogs('users.tracking', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.connection.llen(RedisVisitBuffer.PENDING_KEY), 0)
+        self.assertEqual(self.buffer.pop_dropped(), 1)
+
+    def test_database_failure_requeues_batch(self):
+        self.buffer.push(make_visit())
+        with mock.patch.object(tracking, 'write_records', side_effect=Exception('database down')), \
+                self.assertLogs('users.tracking', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.connection.llen(RedisVisitBuffer.PENDING_KEY), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+class VisitorTrackingMiddlewareTests(TestCase):
+    """访客记录中间件"""
+
+    def test_tracking_errors_do_not_break_response(self):
+        middleware = VisitorTrackingMiddleware(lambda request: HttpResponse('ok'))
+        with mock.patch('users.middleware.record_visit', side_effect=ConnectionError) as record_visit, \
+                mock.patch('users.middleware.record_latency', side_effect=ConnectionError) as record_latency, \
+                self.assertLogs('users.middleware', level='ERROR') as logs:
+            response = middleware(RequestFactory().get('/api/posts/'))
+        self.assertEqual(response.content, b'ok')
+        record_visit.assert_called_once()
+        record_latency.assert_called_once()
+        self.assertEqual(len(logs.records), 2)
+
+
+def local_time(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class VisitRollupTests(TestCase):
+    """访问量按本地时区汇总到每小时和每日汇总表"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.post = Post.objects.create(title='Post', slug='post', content='x', author=cls.user, is_published=True)
+
+    def add_visit(self, timestamp, **fields):
+        fields = {**make_visit(route_name='posts:post-list'), **fields, 'timestamp': timestamp}
+        return VisitorRecord.objects.create(**fields)
+
+    def test_counts_split_by_local_day_and_hour(self):
+        # 两条记录在UTC是同一天，在本地时区跨过零点
+        self.add_visit(local_time(2024, 1, 1, 23, 30), latency_ms=10)
+        self.add_visit(local_time(2024, 1, 1, 23, 50), latency_ms=30, status_code=500)
+        self.add_visit(local_time(2024, 1, 2, 0, 10), latency_ms=5)
+        self.assertEqual(rollup_visits(), 3)
+
+        daily = {row.period_start: row for row in DailyVisitRollup.objects.all()}
+        self.assertEqual(set(daily), {local_time(2024, 1, 1), local_time(2024, 1, 2)})
+        first_day = daily[local_time(2024, 1, 1)]
+        self.assertEqual((first_day.visit_count, first_day.error_count, first_day.latency_ms_total), (2, 1, 40))
+        self.assertEqual(daily[local_time(2024, 1, 2)].visit_count, 1)
+        hourly = dict(HourlyVisitRollup.objects.values_list('period_start', 'visit_count'))
+        self.assertEqual(hourly, {local_time(2024, 1, 1, 23): 2, local_time(2024, 1, 2, 0): 1})
+
+    def test_split_by_post_and_login(self):
+        timestamp = local_time(2024, 1, 1, 10)
+        self.add_visit(timestamp, route_name='posts:post-detail', post_id=self.post.pk)
+        # 早期没有记录帖子ID的详情页访问，从路径中解析出帖子
+        self.add_visit(timestamp, route_name='posts:post-detail', path='/api/posts/post/')
+        self.add_visit(timestamp, user_id=self.user.pk)
+        self.add_visit(timestamp)
+        rollup_visits()
+        rows = DailyVisitRollup.objects.values_list('route_name', 'post_id', 'is_authenticated', 'visit_count')
+        self.assertEqual(set(rows), {
+            ('posts:post-detail', self.post.pk, False, 2),
+            ('posts:post-list', None, True, 1),
+            ('posts:post-list', None, False, 1),
+        })
+
+    def test_incremental_runs_do_not_double_count(self):
+        self.add_visit(local_time(2024, 1, 1, 10))
+        self.add_visit(local_time(2024, 1, 1, 10, 30))
+        self.assertEqual(rollup_visits(batch_size=1), 2)
+        self.assertEqual(rollup_visits(), 0)
+        # 延迟写入的同一时段记录累加到已有的汇总行
+        late = self.add_visit(local_time(2024, 1, 1, 10, 45))
+        self.assertEqual(rollup_visits(), 1)
+        self.assertEqual(DailyVisitRollup.objects.get().visit_count, 3)
+        self.assertEqual(HourlyVisitRollup.objects.get().visit_count, 3)
+        self.assertEqual(VisitRollupState.objects.get(name=STATE_NAME).last_record_id, late.pk)
+
+    def test_visit_counts_merge_rollups_with_pending_records(self):
+        today = timezone.localdate()
+        yesterday = local_time(*(today - timedelta(days=1)).timetuple()[:3])
+        today_start = local_time(*today.timetuple()[:3])
+        self.add_visit(yesterday - timedelta(days=2))
+        self.add_visit(yesterday + timedelta(hours=10))
+        self.add_visit(yesterday + timedelta(hours=10, minutes=20))
+        rollup_visits()
+        # 汇总之后写入的记录主键大于汇总进度，读取时从原始记录补上，已汇总的记录不重复计算
+        self.add_visit(yesterday + timedelta(hours=10, minutes=40))
+        self.add_visit(today_start)
+
+        self.assertEqual(get_visit_counts(days=2)['counts'], [3, 1])
+        hourly = get_visit_counts(days=2, granularity='hour')
+        counts = dict(zip(hourly['dates'], hourly['counts']))
+        self.assertEqual(counts[(yesterday + timedelta(hours=10)).strftime('%m-%d %H:00')], 3)
+        self.assertEqual(counts[today_start.strftime('%m-%d %H:00')], 1)
+        self.assertEqual(sum(hourly['counts']), 4)
+
+    def test_max_batches_limits_one_run(self):
+        for minute in range(3):
+            self.add_visit(local_time(2024, 1, 1, 10, minute))
+        self.assertEqual(rollup_visits(batch_size=1, max_batches=2), 2)
+        self.assertEqual(rollup_visits(batch_size=1), 1)
+        self.assertEqual(DailyVisitRollup.objects.get().visit_count, 3)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   POSTS_PRERENDER_ROOT=None)
+class PostRankingTests(TestCase):
+    """帖子访问排行合并已汇总和未汇总的访问量"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.first = Post.objects.create(title='First', slug='first', content='x', author=author, is_published=True)
+        cls.second = Post.objects.create(title='Second', slug='second', content='x', author=author, is_published=True)
+        cls.slugless = Post.objects.create(title='Slugless', slug='slugless', content='x', author=author,
+                                           is_published=True)
+        Post.objects.filter(pk=cls.slugless.pk).update(slug=None)
+
+    def add_visits(self, post, count):
+        for _ in range(count):
+            VisitorRecord.objects.create(**make_visit(timestamp=timezone.now(), route_name='posts:post-detail',
+                                                      post_id=post.pk))
+
+    def test_rollups_and_pending_records_are_merged(self):
+        self.add_visits(self.first, 2)
+        self.add_visits(self.second, 1)
+        self.add_visits(self.slugless, 5)
+        rollup_visits()
+        self.add_visits(self.second, 2)
+        rankings = get_post_rankings(days=7)
+        self.assertEqual(rankings['titles'], ['Second', 'First'])
+        self.assertEqual(rankings['counts'], [3, 2])
+        self.assertEqual(rankings['paths'], ['/api/posts/second/', '/api/posts/first/'])
+
+    def test_posts_without_valid_slug_are_skipped(self):
+        Post.objects.filter(pk=self.second.pk).update(slug='')
+        self.add_visits(self.first, 1)
+        self.add_visits(self.second, 3)
+        self.add_visits(self.slugless, 3)
+        self.assertEqual(get_post_rankings(days=7)['titles'], ['First'])
+        rollup_visits()
+        self.assertEqual(get_post_rankings(days=7)['titles'], ['First'])
+
+
+class VisitPruneTests(TestCase):
+    """过期访客记录和每小时汇总的清理"""
+
+    def setUp(self):
+        now = timezone.now()
+        self.old = [VisitorRecord.objects.create(**make_visit(timestamp=now - timedelta(days=100))) for _ in range(3)]
+        self.recent = VisitorRecord.objects.create(**make_visit(timestamp=now - timedelta(days=1)))
+        rollup_visits()
+        # 汇总之后才写入的旧记录（缓冲区延迟写入）还没有汇总，不能删除
+        self.unrolled = VisitorRecord.objects.create(**make_visit(timestamp=now - timedelta(days=100)))
+
+    def test_deletes_only_rolled_up_old_records(self):
+        raw_deleted, _ = prune_visits(raw_days=90, chunk_size=2)
+        self.assertEqual(raw_deleted, 3)
+        self.assertEqual(set(VisitorRecord.objects.values_list('pk', flat=True)), {self.recent.pk, self.unrolled.pk})
+
+    def test_deletes_old_hourly_rollups_and_keeps_daily(self):
+        _, hourly_deleted = prune_visits(raw_days=90, hourly_days=30, chunk_size=1)
+        self.assertEqual(hourly_deleted, 1)
+        self.assertEqual(HourlyVisitRollup.objects.get().visit_count, 1)
+        self.assertEqual(sum(DailyVisitRollup.objects.values_list('visit_count', flat=True)), 4)
+
+    def test_archives_deleted_records(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            prune_visits(raw_days=90, chunk_size=2, archive_dir=archive_dir)
+            (name,) = os.listdir(archive_dir)
+            with gzip.open(os.path.join(archive_dir, name), 'rt', encoding='utf-8') as archive_file:
+                self.assertEqual(len(archive_file.readlines()), 3)
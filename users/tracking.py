@@ -0,0 +1,271 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Post
+from posts.utils import get_redis
+
+from .models import CustomUser, VisitorRecord
+
+logger = logging.getLogger(__name__)
+
+# 写入前按字段长度截断的文本字段，如超长的来源页面不会导致整批写入失败
+TRUNCATED_FIELDS = {
+    field.attname: field.max_length
+    for field in VisitorRecord._meta.concrete_fields
+    if field.get_internal_type() == 'CharField' and field.max_length
+}
+
+
+def get_buffer_max_size():
+    """缓冲区最多保存的访客记录数，超过后丢弃新记录"""
+    return getattr(settings, 'VISITOR_BUFFER_MAX_SIZE', 10000)
+
+
+def get_flush_batch_size():
+    """每次bulk_create写入的记录数"""
+    return getattr(settings, 'VISITOR_FLUSH_BATCH_SIZE', 500)
+
+
+def build_records(items):
+    """把缓冲区中的字典转换为模型实例，超长的文本截断到字段长度"""
+    records = []
+    for item in items:
+        item = dict(item)
+        if isinstance(item.get('timestamp'), str):
+            item['timestamp'] = parse_datetime(item['timestamp'])
+        for field, max_length in TRUNCATED_FIELDS.items():
+            if isinstance(item.get(field), str):
+                item[field] = item[field][:max_length]
+        records.append(VisitorRecord(**item))
+    return records
+
+
+def _clear_missing_references(records):
+    """缓冲期间用户或帖子可能已被删除，把失效的外键置空，避免整批写入失败"""
+    for field, model in (('user_id', CustomUser), ('post_id', Post)):
+        ids = {getattr(record, field) for record in records} - {None}
+        if not ids:
+            continue
+        existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for record in records:
+            if getattr(record, field) not in existing:
+                setattr(record, field, None)
+
+
+def _save_one_by_one(records):
+    """整批写入失败时逐条写入，只跳过出错的记录，返回写入的条数"""
+    written = 0
+    for record in records:
+        record.pk = None
+        try:
+            with transaction.atomic():
+                record.save(force_insert=True)
+        except DatabaseError:
+            if not connection.is_usable():
+                raise
+            logger.exception('访客记录写入失败，丢弃：%s %s', record.method, record.path)
+        else:
+            written += 1
+    return written
+
+
+def write_records(items):
+    """批量写入访客记录，返回写入的条数（少于传入条数时其余记录有误已丢弃）
+    数据库不可用时抛出异常，由调用方放回缓冲区稍后重试
+    """
+    records = build_records(items)
+    _clear_missing_references(records)
+    try:
+        with transaction.atomic():
+            VisitorRecord.objects.bulk_create(records, batch_size=get_flush_batch_size())
+    except DatabaseError:
+        if not connection.is_usable():
+            raise
+        return _save_one_by_one(records)
+    return len(records)
+
+
+class BackgroundFlushMixin:
+    """后台线程每隔flush_interval秒调用一次flush，积压达到一批时立即唤醒"""
+    flush_interval = 5
+
+    def _notify(self, pending):
+        self._ensure_thread()
+        if pending >= get_flush_batch_size():
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='visitor-flusher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('访客记录后台写入失败')
+            finally:
+                # 后台线程使用完数据库连接后关闭
+                connection.close()
+
+
+class RedisVisitBuffer(BackgroundFlushMixin):
+    """基于Redis列表的访客记录缓冲区，多个进程共享
+    每个Web进程的后台线程定期取出写入数据库（取出操作是原子的，多个进程同时写入不会重复），
+    也可以用 flush_visit_records 命令立即写入。
+    """
+    PENDING_KEY = 'users:visits:pending'
+    DROPPED_KEY = 'users:visits:dropped'
+
+    def __init__(self, connection, flush_interval):
+        self.connection = connection
+        self.flush_interval = flush_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def push(self, item):
+        # 超过上限时丢弃新记录并计数，不让请求等待
+        if self.connection.llen(self.PENDING_KEY) >= get_buffer_max_size():
+            self.connection.incr(self.DROPPED_KEY)
+            self._ensure_thread()
+            return False
+        self._notify(self.connection.rpush(self.PENDING_KEY, json.dumps(item, default=str)))
+        return True
+
+    def flush(self):
+        """分批取出并写入，直到缓冲区为空，返回写入的条数"""
+        batch_size = get_flush_batch_size()
+        written = 0
+        while True:
+            # 取出和删除在同一个事务中执行，多个写入进程不会重复取到同一批记录
+            pipe = self.connection.pipeline(transaction=True)
+            pipe.lrange(self.PENDING_KEY, 0, batch_size - 1)
+            pipe.ltrim(self.PENDING_KEY, batch_size, -1)
+            raw, _ = pipe.execute()
+            if not raw:
+                return written
+            items = [json.loads(value) for value in raw]
+            try:
+                count = write_records(items)
+            except Exception:
+                # 数据库不可用时放回缓冲区，等待下次重试
+                logger.exception('访客记录写入失败')
+                self.connection.rpush(self.PENDING_KEY, *raw)
+                return written
+            written += count
+            if count < len(items):
+                self.connection.incrby(self.DROPPED_KEY, len(items) - count)
+
+    def pop_dropped(self):
+        """返回并清零被丢弃的记录数"""
+        return int(self.connection.getset(self.DROPPED_KEY, 0) or 0)
+
+
+class LocalVisitBuffer(BackgroundFlushMixin):
+    """进程内的访客记录缓冲区，未配置Redis时使用
+    后台线程每隔flush_interval秒写入一次；积压达到一批时立即唤醒写入线程；
+    缓冲区满时丢弃新记录，进程退出前写入剩余记录。
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=get_buffer_max_size())
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def push(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            self._ensure_thread()
+            return False
+        self._notify(self._queue.qsize())
+        return True
+
+    def flush(self):
+        written = 0
+        batch_size = get_flush_batch_size()
+        with self._flush_lock:
+            while True:
+                items = []
+                while len(items) < batch_size:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not items:
+                    return written
+                try:
+                    count = write_records(items)
+                except Exception:
+                    # 数据库不可用时放回缓冲区，等待下次重试，放不下的记为丢弃
+                    logger.exception('访客记录写入失败')
+                    self._requeue(items)
+                    return written
+                written += count
+                self.dropped += len(items) - count
+
+    def _requeue(self, items):
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def pop_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+_visit_buffer = None
+_visit_buffer_lock = threading.Lock()
+
+
+def get_visit_buffer():
+    """返回当前进程使用的访客记录缓冲区"""
+    global _visit_buffer
+    if _visit_buffer is None:
+        with _visit_buffer_lock:
+            if _visit_buffer is None:
+                redis_connection = get_redis()
+                flush_interval = getattr(settings, 'VISITOR_FLUSH_INTERVAL', 5)
+                if redis_connection is not None:
+                    _visit_buffer = RedisVisitBuffer(redis_connection, flush_interval)
+                else:
+                    _visit_buffer = LocalVisitBuffer(flush_interval)
+                # 进程退出前写入剩余的记录
+                atexit.register(_visit_buffer.flush)
+    return _visit_buffer
+
+
+def reset_visit_buffer(*, setting, **kwargs):
+    """缓存配置变化时（如测试中override_settings）重新选择缓冲区"""
+    global _visit_buffer
+    if setting == 'CACHES':
+        _visit_buffer = None
+
+
+setting_changed.connect(reset_visit_buffer)
+
+
+def record_visit(**fields):
+    """把一条访客记录放入缓冲区，不写数据库；缓冲区已满时丢弃并返回False"""
+    return get_visit_buffer().push(fields)